@@ -0,0 +1,150 @@
+"""Vectorized trend statistics over the daily rollups.
+
+Everything starts from ``daily_frame``: one row per calendar day (days with
+nothing logged included), built from the rollup tables rather than the raw
+rows. All statistics are whole-column pandas/NumPy operations on that
+frame, so years of history cost a few milliseconds.
+"""
+from datetime import date, timedelta
+
+import rollups
+import startup
+
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+ROLLING_WINDOWS = (7, 28)
+
+# Acute and chronic windows for training load; the chronic one also sets
+# how much history is read before the first displayed day
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+
+# Acute:chronic workload ratio bands
+ACWR_LOW = 0.8
+ACWR_HIGH = 1.3
+ACWR_DANGER = 1.5
+
+WEIGHT_ALPHA = 0.1  # EWMA smoothing; about a 10-day memory
+
+CORRELATION_COLUMNS = ('sleep_hours', 'energy_level', 'stress_level', 'resting_heart_rate',
+                       'hydration_glasses', 'minutes', 'calories_in', 'calories_out')
+MIN_CORRELATION_DAYS = 7
+
+LB_TO_KG = 0.453592
+INCH_TO_CM = 2.54
+NON_EXERCISE_ACTIVITY = 1.2  # BMR multiplier before any logged workouts
+
+# Rollup columns -> frame columns, where the names would be ambiguous
+_RENAMES = {'total_minutes': 'minutes', 'total_calories': 'calories_out', 'calories': 'calories_in'}
+# Days without a row mean "nothing logged", which is zero for these
+_ZERO_FILLED = ('workout_count', 'minutes', 'calories_out', 'meal_count')
+# but a day without meals logged says nothing about what was eaten
+_INTAKE = ('calories_in', 'protein', 'carbs', 'fats')
+
+
+def daily_frame(conn, user_id, since_day, until_day=None):
+    """Every day from ``since_day`` to ``until_day`` (default today) as one row"""
+    parts = []
+    for sql in (rollups.DAILY_WORKOUTS_SQL, rollups.DAILY_NUTRITION_SQL, rollups.DAILY_HEALTH_SQL):
+        # fetchall + from_records skips read_sql_query's per-call overhead
+        cursor = conn.execute(sql, (user_id, since_day))
+        columns = [d[0] for d in cursor.description]
+        part = pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=True)
+        part.index = pd.to_datetime(part.pop('day'), format='%Y-%m-%d')
+        parts.append(part)
+    frame = pd.concat(parts, axis=1).rename(columns=_RENAMES)
+
+    calendar = pd.date_range(since_day, until_day or date.today(), freq='D', name='day')
+    frame = frame.reindex(calendar)
+    frame[list(_ZERO_FILLED)] = frame[list(_ZERO_FILLED)].fillna(0)
+    frame[list(_INTAKE)] = frame[list(_INTAKE)].where(frame['meal_count'] > 0)
+    return frame
+
+
+def rolling_means(frame, columns, windows=ROLLING_WINDOWS):
+    """``{column}_{window}d`` trailing means"""
+    return pd.concat({
+        f'{column}_{window}d': frame[column].rolling(window, min_periods=1).mean()
+        for column in columns for window in windows
+    }, axis=1)
+
+
+def training_load(frame):
+    """Acute (7-day) and chronic (28-day) load in daily minutes, and their ratio"""
+    acute = frame['minutes'].rolling(ACUTE_DAYS, min_periods=1).mean()
+    chronic = frame['minutes'].rolling(CHRONIC_DAYS, min_periods=1).mean()
+    return pd.DataFrame({
+        'acute_load': acute,
+        'chronic_load': chronic,
+        'acwr': acute / chronic.where(chronic > 0),
+    })
+
+
+def acwr_zone(ratio):
+    """Plain-language band for an acute:chronic ratio"""
+    if ratio is None or np.isnan(ratio):
+        return "Not enough history yet"
+    if ratio < ACWR_LOW:
+        return "Detraining - load is dropping"
+    if ratio <= ACWR_HIGH:
+        return "Sweet spot"
+    if ratio <= ACWR_DANGER:
+        return "Building fast - watch recovery"
+    return "Spike - high injury risk"
+
+
+def weight_trend(frame, alpha=WEIGHT_ALPHA):
+    """Exponentially smoothed weight and its change over the last week"""
+    # Days without a weigh-in carry the trend forward unchanged
+    trend = frame['weight'].ewm(alpha=alpha, ignore_na=True).mean()
+    return pd.DataFrame({'weight_trend': trend, 'weight_change_7d': trend.diff(ACUTE_DAYS)})
+
+
+def resting_burn(profile):
+    """Daily calories burned outside workouts (Mifflin-St Jeor BMR), or 0 without a profile"""
+    if not profile or not profile.get('weight') or not profile.get('height') or not profile.get('age'):
+        return 0.0
+    offset = {'Male': 5, 'Female': -161}.get(profile.get('gender'), -78)
+    bmr = (10 * profile['weight'] * LB_TO_KG + 6.25 * profile['height'] * INCH_TO_CM
+           - 5 * profile['age'] + offset)
+    return bmr * NON_EXERCISE_ACTIVITY
+
+
+def calorie_balance(frame, baseline_burn=0.0):
+    """Intake minus (resting burn + workout burn), on days with meals logged"""
+    balance = frame['calories_in'] - (baseline_burn + frame['calories_out'])
+    balance = balance.where(frame['meal_count'] > 0)
+    return pd.DataFrame({
+        'calorie_balance': balance,
+        'calorie_balance_7d': balance.rolling(ACUTE_DAYS, min_periods=1).mean(),
+    })
+
+
+def correlations(frame, columns=CORRELATION_COLUMNS, min_days=MIN_CORRELATION_DAYS):
+    """Pearson correlation matrix over days where both values were logged"""
+    present = [c for c in columns if frame[c].notna().sum() >= min_days and frame[c].std() > 0]
+    return frame[present].corr(min_periods=min_days)
+
+
+def correlation(frame, x, y):
+    """``(r, days)`` for two columns, ``r`` NaN with too little overlap"""
+    both = frame[[x, y]].dropna()
+    if len(both) < MIN_CORRELATION_DAYS or both[x].std() == 0 or both[y].std() == 0:
+        return float('nan'), len(both)
+    return float(np.corrcoef(both[x].to_numpy(), both[y].to_numpy())[0, 1]), len(both)
+
+
+def summarize(conn, user_id, days=90, baseline_burn=0.0):
+    """The last ``days`` days with every trend column attached"""
+    first_day = date.today() - timedelta(days=days - 1)
+    frame = daily_frame(conn, user_id, (first_day - timedelta(days=CHRONIC_DAYS)).isoformat())
+    frame = pd.concat([
+        frame,
+        rolling_means(frame, ('minutes', 'calories_in', 'sleep_hours', 'energy_level')),
+        training_load(frame),
+        weight_trend(frame),
+        calorie_balance(frame, baseline_burn),
+    ], axis=1)
+    # The warm-up days only feed the windows above
+    return frame.loc[pd.Timestamp(first_day):]
@@ -1,24 +1,35 @@
 import streamlit as st
+import startup
 import openai
-import sqlite3
-import datetime
-import base64
-from PIL import Image
-from io import BytesIO
 import json
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
-import speech_recognition as sr
-import pyttsx3
-import threading
 import time
-import requests
-from datetime import datetime, timedelta
-import cv2
 import random
-import hashlib
+from datetime import datetime, timedelta
+from PIL import Image
+import database
+import writer
+import export
+import importer
+import samples
+import versions
+import analytics
+import conversation
+import charts
+import digest
+import foods
+import schema
+import rollups
+import goal_progress
+import cache
+import image_pipeline
+import batch
+import streaming
+import structured
+import llm_gateway
+import voice
+
+# Heavy libraries load on first use, after the page has started rendering
+pd = startup.lazy_import('pandas')
 
 # Page configuration
 st.set_page_config(
@@ -71,156 +82,104 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize OpenAI
+@st.cache_resource
+def get_llm_gateway(api_key, base_url=None):
+    """One gateway per process, so rate limits and coalescing span every session"""
+    return llm_gateway.LLMGateway(openai.OpenAI(api_key=api_key, base_url=base_url))
+
 if "OPENAI_API_KEY" in st.secrets:
-    client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+    gateway = get_llm_gateway(st.secrets["OPENAI_API_KEY"], st.secrets.get("OPENAI_BASE_URL"))
 else:
     st.error("🔑 Please add your OpenAI API key in Streamlit secrets!")
     st.stop()
 
+database.configure(shard_per_user=bool(st.secrets.get("ELLE_SHARD_PER_USER", False)))
+writer.configure(durability=st.secrets.get("ELLE_WRITE_DURABILITY", writer.BATCHED))
+
+@st.cache_resource
+def init_storage(path):
+    """Create and migrate a database file once per process, not once per session"""
+    with startup.timed("schema setup"), database.transaction(path) as conn:
+        schema.migrate(conn)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_read(db_path, user_id, query, args, day, data_versions, _read):
+    """``_read(conn, *args)``, run again only when the data versions or the day change.
+    
+    Streamlit leaves underscored parameters out of the key, so ``query`` must
+    name the reader uniquely.
+    """
+    with database.connection(db_path) as conn:
+        return _read(conn, *args)
+
+def current_user_id():
+    """Signed-in account; without an ``[auth]`` secret, a ``?user=`` query parameter or the shared default.
+    
+    The query parameter is only trusted when authentication isn't configured
+    at all, since anyone can edit the URL.
+    """
+    if "auth" in st.secrets:
+        if not st.user.get("is_logged_in"):
+            st.info("🔐 Sign in to see your fitness data.")
+            st.button("Log in", on_click=st.login)
+            st.stop()
+        return st.user.email
+    user = st.query_params.get("user")
+    if user:
+        st.warning("⚠️ Sign-in isn't configured, so anyone with this link can read and change this account's data.")
+    return user or schema.DEFAULT_USER
+
 class ElleComplete:
-    def __init__(self):
-        self.init_database()
-        self.init_voice_assistant()
+    def __init__(self, user_id=schema.DEFAULT_USER):
+        self.user_id = user_id
+        self.db_path = database.path_for_user(user_id)
+        init_storage(self.db_path)
+        self._voice = None
+        self._writes = []
         self.user_profile = self.load_user_profile()
-        
-    def init_database(self):
-        """Initialize comprehensive database"""
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
-        
-        # Workouts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS workouts (
-                id INTEGER PRIMARY KEY,
-                date TEXT,
-                exercise TEXT,
-                duration INTEGER,
-                calories INTEGER,
-                intensity TEXT,
-                mood_before TEXT,
-                mood_after TEXT,
-                notes TEXT,
-                heart_rate_avg INTEGER,
-                form_score REAL
-            )
-        ''')
-        
-        # Nutrition table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS nutrition (
-                id INTEGER PRIMARY KEY,
-                date TEXT,
-                meal_type TEXT,
-                food_items TEXT,
-                calories INTEGER,
-                protein REAL,
-                carbs REAL,
-                fats REAL,
-                fiber REAL,
-                sugar REAL,
-                sodium REAL,
-                analysis TEXT,
-                photo_path TEXT
-            )
-        ''')
-        
-        # User profile
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_profile (
-                id INTEGER PRIMARY KEY,
-                name TEXT,
-                age INTEGER,
-                gender TEXT,
-                height REAL,
-                weight REAL,
-                activity_level TEXT,
-                fitness_goals TEXT,
-                dietary_restrictions TEXT,
-                medical_conditions TEXT,
-                preferences TEXT,
-                created_date TEXT,
-                updated_date TEXT
-            )
-        ''')
-        
-        # Health metrics
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS health_metrics (
-                id INTEGER PRIMARY KEY,
-                date TEXT,
-                weight REAL,
-                body_fat_percentage REAL,
-                muscle_mass REAL,
-                resting_heart_rate INTEGER,
-                blood_pressure_systolic INTEGER,
-                blood_pressure_diastolic INTEGER,
-                sleep_hours REAL,
-                stress_level INTEGER,
-                energy_level INTEGER,
-                hydration_glasses INTEGER
-            )
-        ''')
-        
-        # Goals and achievements
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS goals (
-                id INTEGER PRIMARY KEY,
-                goal_type TEXT,
-                description TEXT,
-                target_value REAL,
-                current_value REAL,
-                target_date TEXT,
-                status TEXT,
-                created_date TEXT
-            )
-        ''')
-        
-        # Social features
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS challenges (
-                id INTEGER PRIMARY KEY,
-                challenge_name TEXT,
-                challenge_type TEXT,
-                description TEXT,
-                start_date TEXT,
-                end_date TEXT,
-                participants TEXT,
-                progress TEXT,
-                status TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
     
-    def init_voice_assistant(self):
-        """Initialize enhanced voice assistant"""
-        try:
-            self.recognizer = sr.Recognizer()
-            self.microphone = sr.Microphone()
-            self.tts_engine = pyttsx3.init()
-            
-            # Configure Elle's voice personality
-            voices = self.tts_engine.getProperty('voices')
-            if voices:
-                for voice in voices:
-                    if any(keyword in voice.name.lower() for keyword in ['female', 'zira', 'samantha']):
-                        self.tts_engine.setProperty('voice', voice.id)
-                        break
-            
-            self.tts_engine.setProperty('rate', 175)  # Speaking speed
-            self.tts_engine.setProperty('volume', 0.9)
-            self.listening = False
-        except:
-            st.warning("Voice features may not be available on this system.")
+    def connection(self):
+        """Pooled read connection on this user's database"""
+        return database.connection(self.db_path)
+    
+    def transaction(self):
+        """Pooled write transaction on this user's database"""
+        return database.transaction(self.db_path)
+    
+    def _submit(self, write):
+        """Hand ``write(conn)`` to the write-behind queue and wait for its commit.
+        
+        The queue still groups saves from concurrent sessions into one commit,
+        but the rest of this run reads the new row. Returns whether the write
+        committed within ``writer.SAVE_TIMEOUT``; failures, and saves that take
+        longer and then fail, are reported by ``write_errors``.
+        """
+        future = writer.get_writer().submit(self.db_path, write)
+        self._writes.append(future)
+        return writer.wait(future)
+    
+    def write_errors(self):
+        """Errors from finished saves not reported yet, once each"""
+        finished = [f for f in self._writes if f.done()]
+        self._writes = [f for f in self._writes if not f.done()]
+        return [f.exception() for f in finished if f.exception() is not None]
+    
+    def voice_listening(self):
+        """Whether the background voice pipeline is running, without creating it"""
+        return self._voice is not None and self._voice.listening
+    
+    @property
+    def voice(self):
+        """Voice assistant, created the first time a voice feature is used"""
+        if self._voice is None:
+            self._voice = voice.VoiceAssistant()
+        return self._voice
     
     def load_user_profile(self):
         """Load or create user profile"""
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM user_profile LIMIT 1')
-        profile = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            profile = conn.execute('SELECT * FROM user_profile WHERE user_id = ? LIMIT 1',
+                                   (self.user_id,)).fetchone()
         
         if profile:
             return {
@@ -236,20 +195,22 @@ class ElleComplete:
         return None
     
     def analyze_food_advanced(self, image):
-        """Advanced food analysis with detailed nutrition"""
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
+        """Advanced food analysis with detailed nutrition; a failed call raises ``GatewayError``"""
+        prepared = image_pipeline.ensure_prepared(image)
         
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Hi! I'm Elle, your comprehensive AI fitness coach! 🎀
+        vision_cache = cache.get_vision_cache()
+        cached = vision_cache.get(prepared.image)
+        if cached is not None:
+            return cached
+        
+        request = structured.json_mode(dict(
+            model="gpt-4o",
+            messages=[{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": """Hi! I'm Elle, your comprehensive AI fitness coach! 🎀
 
 Analyze this food photo and provide detailed nutritional information:
 
@@ -286,208 +247,540 @@ Format as detailed JSON:
     "cooking_tips": ["if applicable"],
     "pairing_suggestions": ["what goes well with this"]
 }"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}
-                        }
-                    ]
-                }],
-                max_tokens=800
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f'{{"elle_analysis": "I\'m having trouble analyzing this photo right now. Error: {str(e)}"}}'
-    
-    def generate_workout_plan(self, user_goals, fitness_level, available_time, equipment):
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": prepared.data_url()}
+                    }
+                ]
+            }],
+            max_tokens=800
+        ))
+        analysis = gateway.complete('food_analysis', **request)
+        # Stored normalized, so cache hits need no repairing; a reply that
+        # couldn't be parsed isn't cached, so the next upload tries again
+        parsed = self._structured('food_analysis', request, analysis, structured.FoodAnalysis)
+        if parsed.data is not None:
+            analysis = json.dumps(parsed.data)
+            vision_cache.put(prepared.image, analysis)
+        return analysis
+    
+    def generate_workout_plan(self, user_goals, fitness_level, available_time, equipment, stream=False, regenerate=False):
         """Generate personalized workout plans"""
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{
-                    "role": "system",
-                    "content": "You are Elle, an expert AI fitness coach. Create personalized, safe, and effective workout plans."
-                }, {
-                    "role": "user",
-                    "content": f"""Create a personalized workout plan for:
-                    Goals: {user_goals}
-                    Fitness Level: {fitness_level}
-                    Available Time: {available_time} minutes
-                    Equipment: {equipment}
-                    
-                    Include:
-                    - Specific exercises with sets/reps
-                    - Progressive difficulty
-                    - Safety considerations
-                    - Modification options
-                    - Recovery recommendations
-                    
-                    Format as JSON with exercise details."""
-                }],
-                max_tokens=600
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error generating workout plan: {str(e)}"
-    
-    def analyze_health_trends(self):
-        """Analyze user's health and fitness trends"""
-        conn = sqlite3.connect('elle_complete.db')
-        
-        # Get recent data
-        workouts_df = pd.read_sql_query('''
-            SELECT date, exercise, duration, calories, mood_before, mood_after 
-            FROM workouts 
-            WHERE date >= date('now', '-30 days')
-            ORDER BY date
-        ''', conn)
-        
-        nutrition_df = pd.read_sql_query('''
-            SELECT date, calories, protein, carbs, fats 
-            FROM nutrition 
-            WHERE date >= date('now', '-30 days')
-            ORDER BY date
-        ''', conn)
-        
-        health_df = pd.read_sql_query('''
-            SELECT date, weight, resting_heart_rate, sleep_hours, stress_level, energy_level 
-            FROM health_metrics 
-            WHERE date >= date('now', '-30 days')
-            ORDER BY date
-        ''', conn)
-        
-        conn.close()
+        request = dict(
+            model="gpt-4o",
+            messages=[{
+                "role": "system",
+                "content": "You are Elle, an expert AI fitness coach. Create personalized, safe, and effective workout plans."
+            }, {
+                "role": "user",
+                "content": f"""Create a personalized workout plan for:
+                Goals: {user_goals}
+                Fitness Level: {fitness_level}
+                Available Time: {available_time} minutes
+                Equipment: {equipment}
+                
+                Include:
+                - Specific exercises with sets/reps
+                - Progressive difficulty
+                - Safety considerations
+                - Modification options
+                - Recovery recommendations
+                
+                {structured.WorkoutPlan.schema_prompt()}"""
+            }],
+            max_tokens=600
+        )
         
-        return {
-            'workouts': workouts_df,
-            'nutrition': nutrition_df,
-            'health': health_df
-        }
-    
-    def get_ai_insights(self):
+        # Equipment arrives as a comma-joined string; order doesn't change the plan
+        equipment_set = sorted({item.strip().lower() for item in equipment.split(',') if item.strip()})
+        cache_key = cache.normalized_key(user_goals, fitness_level, available_time, equipment_set)
+        return self._generate('workout_plan', request, stream, "Error generating workout plan",
+                              cache_key=cache_key, regenerate=regenerate, schema=structured.WorkoutPlan)
+    
+    def health_digest(self):
+        """Token-budgeted summary of the last four weeks, rebuilt only after new rows arrive"""
+        with self.connection() as conn:
+            return digest.get(conn, self.user_id, baseline_burn=analytics.resting_burn(self.user_profile))
+    
+    def get_ai_insights(self, stream=False):
         """Get comprehensive AI insights"""
-        trends = self.analyze_health_trends()
+        summary = self.health_digest()
+        goals = self.user_profile.get('fitness_goals') if self.user_profile else None
         
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{
-                    "role": "system",
-                    "content": "You are Elle, an empathetic AI fitness coach. Provide insightful, encouraging, and actionable advice."
-                }, {
-                    "role": "user",
-                    "content": f"""Analyze this user's fitness data and provide comprehensive insights:
-                    
-                    Recent Workouts: {len(trends['workouts'])} sessions
-                    Recent Meals: {len(trends['nutrition'])} logged
-                    Health Metrics: {len(trends['health'])} entries
-                    
-                    Provide:
-                    1. Progress assessment
-                    2. Areas for improvement
-                    3. Personalized recommendations
-                    4. Motivational feedback
-                    5. Goal adjustments
-                    6. Health warnings (if any)
-                    
-                    Be specific, encouraging, and actionable."""
-                }],
-                max_tokens=500
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error getting insights: {str(e)}"
+        request = dict(
+            model="gpt-4",
+            messages=[{
+                "role": "system",
+                "content": "You are Elle, an empathetic AI fitness coach. Provide insightful, encouraging, and actionable advice."
+            }, {
+                "role": "user",
+                "content": f"""Analyze this user's fitness data and provide comprehensive insights.
+                
+                Stated goals: {goals or 'not set'}
+                
+{summary}
+                
+                Provide:
+                1. Progress assessment
+                2. Areas for improvement
+                3. Personalized recommendations
+                4. Motivational feedback
+                5. Goal adjustments
+                6. Health warnings (if any)
+                
+                Refer to the numbers above. Be specific, encouraging, and actionable."""
+            }],
+            max_tokens=500
+        )
+        
+        return self._generate('insights', request, stream, "Error getting insights")
     
     def save_workout_advanced(self, data):
         """Save comprehensive workout data"""
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
+        date, ts = schema.now_stamp()
         
-        cursor.execute('''
-            INSERT INTO workouts (date, exercise, duration, calories, intensity, 
-                                mood_before, mood_after, notes, heart_rate_avg, form_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            data['exercise'],
-            data['duration'],
-            data['calories'],
-            data.get('intensity', 'Medium'),
-            data.get('mood_before', ''),
-            data.get('mood_after', ''),
-            data.get('notes', ''),
-            data.get('heart_rate', 0),
-            data.get('form_score', 0.0)
-        ))
+        def write(conn):
+            conn.execute('''
+                INSERT INTO workouts (user_id, date, ts, exercise, duration, calories, intensity, 
+                                    mood_before, mood_after, notes, heart_rate_avg, form_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                self.user_id,
+                date,
+                ts,
+                data['exercise'],
+                data['duration'],
+                data['calories'],
+                data.get('intensity', 'Medium'),
+                data.get('mood_before', ''),
+                data.get('mood_after', ''),
+                data.get('notes', ''),
+                data.get('heart_rate', 0),
+                data.get('form_score', 0.0)
+            ))
+            rollups.record_workout(conn, self.user_id, date[:10], data['duration'], data['calories'])
+            goal_progress.record_workout(conn, self.user_id, date[:10], data['exercise'], data['duration'])
+            versions.bump(conn, self.user_id, 'workouts')
         
-        conn.commit()
-        conn.close()
+        return self._submit(write)
     
     def save_nutrition_advanced(self, data):
         """Save comprehensive nutrition data"""
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
+        return self.save_nutrition_batch([data])
+    
+    def save_nutrition_batch(self, entries):
+        """Save several meals in a single write"""
+        date, ts = schema.now_stamp()
         
-        cursor.execute('''
-            INSERT INTO nutrition (date, meal_type, food_items, calories, protein, 
-                                 carbs, fats, fiber, sugar, sodium, analysis, photo_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            data['meal_type'],
-            data['food_items'],
-            data['calories'],
-            data.get('protein', 0),
-            data.get('carbs', 0),
-            data.get('fats', 0),
-            data.get('fiber', 0),
-            data.get('sugar', 0),
-            data.get('sodium', 0),
-            data.get('analysis', ''),
-            data.get('photo_path', '')
-        ))
+        def write(conn):
+            for data in entries:
+                conn.execute('''
+                    INSERT INTO nutrition (user_id, date, ts, meal_type, food_items, calories, protein, 
+                                         carbs, fats, fiber, sugar, sodium, analysis, photo_path)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    self.user_id,
+                    date,
+                    ts,
+                    data['meal_type'],
+                    data['food_items'],
+                    data['calories'],
+                    data.get('protein', 0),
+                    data.get('carbs', 0),
+                    data.get('fats', 0),
+                    data.get('fiber', 0),
+                    data.get('sugar', 0),
+                    data.get('sodium', 0),
+                    data.get('analysis', ''),
+                    data.get('photo_path', '')
+                ))
+                rollups.record_meal(conn, self.user_id, date[:10], data['calories'], data.get('protein', 0),
+                                    data.get('carbs', 0), data.get('fats', 0))
+            versions.bump(conn, self.user_id, 'nutrition')
+        
+        return self._submit(write)
+    
+    def nutrition_from_analysis(self, data, meal_type, analysis):
+        """Turn a parsed food analysis into a nutrition row"""
+        macros = data.get('macros', {})
+        return {
+            'meal_type': meal_type,
+            'food_items': ", ".join(data.get("food_items", [])),
+            'calories': data.get("total_calories", 0),
+            'protein': macros.get('protein', 0),
+            'carbs': macros.get('carbs', 0),
+            'fats': macros.get('fats', 0),
+            'fiber': macros.get('fiber', 0),
+            'sugar': macros.get('sugar', 0),
+            'sodium': macros.get('sodium', 0),
+            'analysis': analysis
+        }
+    
+    def nutrition_from_text(self, items, meal_type):
+        """Turn meal items parsed from text into a nutrition row, no model call needed"""
+        meal_totals = foods.totals(items)
+        return dict(meal_totals,
+                    meal_type=meal_type,
+                    food_items=", ".join(item.describe() for item in items),
+                    calories=round(meal_totals['calories']),
+                    analysis="Logged from text with Elle's food database")
+    
+    def save_health_metrics(self, data):
+        """Save a daily health check-in"""
+        date, ts = schema.now_stamp()
+        
+        def write(conn):
+            conn.execute('''
+                INSERT INTO health_metrics (user_id, date, ts, weight, resting_heart_rate, sleep_hours, 
+                                          stress_level, energy_level, hydration_glasses)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                self.user_id,
+                date,
+                ts,
+                data.get('weight'),
+                data.get('resting_heart_rate'),
+                data.get('sleep_hours'),
+                data.get('stress_level'),
+                data.get('energy_level'),
+                data.get('hydration_glasses')
+            ))
+            rollups.record_health(conn, self.user_id, date[:10], data)
+            goal_progress.record_health(conn, self.user_id, date[:10], data)
+            versions.bump(conn, self.user_id, 'health_metrics')
+        
+        return self._submit(write)
+    
+    def data_version(self, tables=schema.TIMESERIES_TABLES):
+        """Change counters for ``tables``; they move whenever this user writes to one"""
+        with self.connection() as conn:
+            return versions.current(conn, self.user_id, tables)
+    
+    def read(self, query, tables, read, *args):
+        """``read(conn, *args)``, reused across reruns until one of ``tables`` is written"""
+        # Windows are relative to today, so the day is part of every key
+        return cached_read(self.db_path, self.user_id, query, args, schema.days_ago_day(0),
+                           self.data_version(tables), read)
+    
+    def load_daily_rollups(self, days=30):
+        """Per-day workout, nutrition and health aggregates for charts"""
+        return self.read('daily_rollups', schema.TIMESERIES_TABLES, self._read_daily_rollups, days)
+    
+    def _read_daily_rollups(self, conn, days):
+        since_day = schema.days_ago_day(days)
+        
+        params = (self.user_id, since_day)
         
-        conn.commit()
-        conn.close()
+        workouts_daily = pd.read_sql_query(rollups.DAILY_WORKOUTS_SQL, conn, params=params)
+        nutrition_daily = pd.read_sql_query(rollups.DAILY_NUTRITION_SQL, conn, params=params)
+        health_daily = pd.read_sql_query(rollups.DAILY_HEALTH_SQL, conn, params=params)
+        exercise_counts = pd.read_sql_query('''
+            SELECT exercise, COUNT(*) AS count
+            FROM workouts
+            WHERE user_id = ? AND ts >= ?
+            GROUP BY exercise
+            ORDER BY count DESC
+        ''', conn, params=(self.user_id, schema.days_ago_ts(days)))
+        
+        return {
+            'workouts': workouts_daily,
+            'nutrition': nutrition_daily,
+            'health': health_daily,
+            'exercises': exercise_counts
+        }
+    
+    def load_analytics(self, days=90):
+        """Daily trend frame: rolling means, training load, weight trend, calorie balance"""
+        return self.read('analytics', schema.TIMESERIES_TABLES,
+                         lambda conn, days, burn: analytics.summarize(conn, self.user_id, days, burn),
+                         days, analytics.resting_burn(self.user_profile))
+    
+    def count_entries(self):
+        """Workouts plus meals ever logged, from the rollups"""
+        return self.read('entry_count', ('workouts', 'nutrition'), lambda conn: conn.execute('''
+            SELECT (SELECT COALESCE(SUM(workout_count), 0) FROM daily_workouts WHERE user_id = ?)
+                 + (SELECT COALESCE(SUM(meal_count), 0) FROM daily_nutrition WHERE user_id = ?)
+        ''', (self.user_id, self.user_id)).fetchone()[0])
     
-    def create_meal_plan(self, days=7):
+    def create_meal_plan(self, days=7, stream=False, regenerate=False):
         """Generate personalized meal plans"""
         profile = self.user_profile
         
+        request = dict(
+            model="gpt-4o",
+            messages=[{
+                "role": "system",
+                "content": "You are Elle, a nutrition expert AI coach. Create balanced, delicious meal plans."
+            }, {
+                "role": "user",
+                "content": f"""Create a {days}-day meal plan for:
+                Profile: {profile if profile else 'General healthy adult'}
+                
+                Include:
+                - Breakfast, lunch, dinner, 2 snacks daily
+                - Short recipes with instructions
+                - Shopping list
+                - Macro breakdown
+                - Prep time estimates
+                - Dietary restrictions consideration
+                - Budget-friendly options
+                
+                {structured.MealPlan.schema_prompt()}
+                The "days" array holds all {days} days."""
+            }],
+            max_tokens=min(structured.MEAL_PLAN_TOKENS_PER_DAY * days, structured.MEAL_PLAN_MAX_TOKENS)
+        )
+        
+        return self._generate('meal_plan', request, stream, "Error creating meal plan",
+                              cache_key=cache.normalized_key(days, profile), regenerate=regenerate,
+                              schema=structured.MealPlan, expected={'days': days})
+    
+    def generate_recipe(self, cuisine_type, ingredients, stream=False, regenerate=False):
+        """Create a recipe from the ingredients on hand"""
+        request = dict(
+            model="gpt-4",
+            messages=[{
+                "role": "system",
+                "content": "You are Elle, a creative chef AI. Create delicious, healthy recipes."
+            }, {
+                "role": "user",
+                "content": f"Create a {cuisine_type} recipe using: {ingredients}. Include ingredients, instructions, nutrition info, and cooking tips."
+            }],
+            max_tokens=600
+        )
+        
+        ingredient_set = sorted({item.strip().lower() for item in ingredients.split(',') if item.strip()})
+        return self._generate('recipe', request, stream,
+                              cache_key=cache.normalized_key(cuisine_type, ingredient_set), regenerate=regenerate)
+    
+    def add_chat_message(self, role, content):
+        """Store a chat message straight away, so the next prompt includes it"""
+        _, ts = schema.now_stamp()
+        with self.transaction() as conn:
+            conversation.add(conn, self.user_id, role, content, ts)
+    
+    def chat_page(self, limit=conversation.PAGE_SIZE):
+        """``(messages, more)``: the newest ``limit`` chat messages and whether there are older ones"""
+        return self.read('chat_page', ('chat_messages',), conversation.recent, self.user_id, limit)
+    
+    def summarize_chat(self):
+        """Fold older turns into the rolling summary once they outgrow the budget"""
+        with self.connection() as conn:
+            previous, due = conversation.to_summarize(conn, self.user_id)
+        if not due:
+            return False
+        
+        transcript = "\n".join(f"{role}: {content}" for _, role, content in due)
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
+            text = gateway.complete(
+                'chat_summary',
+                model="gpt-4o-mini",
                 messages=[{
                     "role": "system",
-                    "content": "You are Elle, a nutrition expert AI coach. Create balanced, delicious meal plans."
+                    "content": "You keep the running notes of a fitness coaching chat. Merge the new turns into the "
+                               "existing notes. Keep the user's goals, injuries, preferences, numbers and anything "
+                               "the coach promised; drop small talk. Reply with the updated notes only."
                 }, {
                     "role": "user",
-                    "content": f"""Create a {days}-day meal plan for:
-                    Profile: {profile if profile else 'General healthy adult'}
-                    
-                    Include:
-                    - Breakfast, lunch, dinner, 2 snacks daily
-                    - Detailed recipes with instructions
-                    - Shopping list
-                    - Macro breakdown
-                    - Prep time estimates
-                    - Dietary restrictions consideration
-                    - Budget-friendly options
-                    
-                    Format as structured JSON with daily meals."""
+                    "content": f"Existing notes: {previous or '(none)'}\n\nNew turns:\n{transcript}"
                 }],
-                max_tokens=1000
+                max_tokens=conversation.SUMMARY_TOKENS
             )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error creating meal plan: {str(e)}"
+        except llm_gateway.GatewayError:
+            return False  # the prompt budget still holds; try again after the next reply
+        
+        with self.transaction() as conn:
+            conversation.save_summary(conn, self.user_id, text, due[-1][0])
+        return True
+    
+    def voice_reply(self, text):
+        """Answer a spoken message; runs on the voice worker thread, yielding the reply as it streams"""
+        self.add_chat_message('user', text)
+        reply = []
+        # Its own result object: the script thread reads last_generation meanwhile
+        for chunk in self.chat(stream=True, generation=streaming.Generation('chat')):
+            reply.append(chunk)
+            yield chunk
+        self.add_chat_message('assistant', "".join(reply))
+        self.summarize_chat()
+    
+    def chat(self, stream=False, generation=None):
+        """Reply to the stored conversation as Elle"""
+        with self.connection() as conn:
+            history = conversation.prompt_messages(conn, self.user_id)
+        
+        request = dict(
+            model="gpt-4",
+            messages=[
+                {
+                    "role": "system",
+                    "content": """You are Elle, an encouraging, knowledgeable, and supportive AI fitness coach. 
+                    You have a warm, friendly personality and always provide helpful, accurate advice about:
+                    - Fitness and exercise
+                    - Nutrition and healthy eating
+                    - Mental wellness and motivation
+                    - Goal setting and achievement
+                    
+                    Always be encouraging, use emojis appropriately, and provide actionable advice.
+                    Remember you're Elle, their personal AI fitness assistant who cares about their success."""
+                }
+            ] + history,
+            max_tokens=400
+        )
+        
+        return self._generate('chat', request, stream, generation=generation)
+    
+    def _generate(self, label, request, stream=False, error_message=None, cache_key=None, regenerate=False,
+                  schema=None, expected=None, generation=None):
+        """Run a completion through the gateway, optionally streamed and cached.
+        
+        With ``error_message`` set, failures come back as text (the way the
+        UI has always shown them); otherwise they propagate. Only successful
+        replies are cached, under ``cache_key`` in the ``label`` namespace.
+        
+        With a ``structured`` model as ``schema`` the reply is requested in
+        JSON mode and, once complete, read into ``generation.parsed``.
+        
+        How the reply was served is recorded in ``generation``, by default a
+        new ``last_generation`` for the UI to read. Callers on other threads
+        pass their own so they never touch the script thread's.
+        """
+        if generation is None:
+            generation = self.last_generation = streaming.Generation(label)
+        if schema is not None:
+            request = structured.json_mode(request)
+        if cache_key is not None and not regenerate:
+            cached = cache.get_response_cache().get(label, cache_key)
+            if cached is not None:
+                generation.from_cache = True
+                if schema is not None:
+                    generation.parsed = self._structured(label, request, cached, schema, expected, cache_key)
+                return iter([cached]) if stream else cached
+        
+        if stream:
+            return self._stream(label, request, generation, error_message, cache_key, schema, expected)
+        try:
+            text = gateway.complete(label, **request)
+        except llm_gateway.GatewayError as e:
+            if error_message is None:
+                raise
+            return f"{error_message}: {str(e)}"
+        if cache_key is not None:
+            cache.get_response_cache().put(label, cache_key, text)
+        if schema is not None:
+            generation.parsed = self._structured(label, request, text, schema, expected, cache_key)
+        return text
+    
+    def _stream(self, label, request, generation, error_message=None, cache_key=None, schema=None, expected=None):
+        """Yield text chunks, keeping the timings in ``generation.metrics``"""
+        chunks = []
+        try:
+            for chunk in gateway.stream(label, metrics=generation.metrics, **request):
+                chunks.append(chunk)
+                yield chunk
+        except llm_gateway.GatewayError as e:
+            if error_message is None:
+                raise
+            # Failing part way through, the message follows the text already shown
+            separator = "\n\n" if chunks else ""
+            yield f"{separator}{error_message}: {str(e)}"
+            return
+        if cache_key is not None:
+            cache.get_response_cache().put(label, cache_key, "".join(chunks))
+        if schema is not None:
+            generation.parsed = self._structured(label, request, "".join(chunks), schema, expected, cache_key)
+    
+    def _structured(self, label, request, text, schema, expected=None, cache_key=None):
+        """Read a JSON reply as ``schema``, asking again for only the fields it lacks.
+        
+        A repaired or completed reply replaces the cached one, so the next
+        hit parses cleanly.
+        """
+        parsed = structured.parse(text, schema, expected)
+        if parsed.data is None:
+            structured.record(label, 'failed')
+            return parsed
+        
+        outcome = 'repaired' if parsed.repaired else 'clean'
+        for _ in range(structured.MAX_REASKS):
+            if not parsed.missing:
+                break
+            # Continuing a cut-off array needs the full budget; filling in fields doesn't
+            continuing = any('[' in path for path in parsed.missing)
+            follow_up = dict(request,
+                             messages=structured.reask_messages(request['messages'], parsed, schema),
+                             max_tokens=request['max_tokens'] if continuing else structured.REASK_MAX_TOKENS)
+            try:
+                extra, _ = structured.extract(gateway.complete(f"{label}_reask", **follow_up))
+            except llm_gateway.GatewayError:
+                break
+            if not isinstance(extra, dict):
+                break
+            parsed = structured.parse(json.dumps(structured.merge(parsed.data, extra)), schema, expected)
+            parsed.repaired = True
+            outcome = 'reasked'
+        
+        structured.record(label, 'partial' if parsed.missing else outcome)
+        if outcome != 'clean' and cache_key is not None:
+            cache.get_response_cache().put(label, cache_key, json.dumps(parsed.data))
+        return parsed
+    
+    def generation_summary(self):
+        """One-line note on how the last generation was served"""
+        return self.last_generation.summary()
 
-# Initialize Elle
-if 'elle' not in st.session_state:
-    st.session_state.elle = ElleComplete()
+# Initialize Elle for whoever is signed in; switching accounts gets a fresh instance
+user_id = current_user_id()
+if 'elle' not in st.session_state or st.session_state.elle.user_id != user_id:
+    with startup.timed("session setup"):
+        st.session_state.elle = ElleComplete(user_id)
 
 elle = st.session_state.elle
 
+def stream_json_reply(chunks, placeholder, render_partial, error_message="Elle's reply was interrupted"):
+    """Show a streamed JSON reply as it arrives and return the full text.
+    
+    A ``GatewayError`` part way through ends the text with ``error_message``,
+    the way ``_generate`` reports failures; with ``error_message=None`` it
+    propagates.
+    """
+    parser = streaming.PartialJSONParser()
+    last_render = 0.0
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            # Scanning is incremental, but parsing and redrawing on every token is still wasted work
+            now = time.perf_counter()
+            if now - last_render < 0.1:
+                continue
+            last_render = now
+            
+            partial = parser.value()
+            if partial:
+                with placeholder.container():
+                    render_partial(partial)
+            else:
+                placeholder.markdown(parser.text)
+    except llm_gateway.GatewayError as e:
+        if error_message is None:
+            raise
+        parser.feed(f"\n\n{error_message}: {str(e)}")
+    placeholder.empty()
+    return parser.text
+
+def confirm_save(saved, message):
+    """``message`` once a save has committed, otherwise why it hasn't"""
+    if saved:
+        st.success(message)
+        return True
+    errors = elle.write_errors()
+    if errors:
+        st.error(f"⚠️ This entry couldn't be saved: {errors[-1]}")
+    else:
+        st.warning("⏳ Still saving - this entry will show up in a moment.")
+    return False
+
 # Main App Interface
 st.markdown("""
 <div class="main-header">
@@ -495,30 +788,83 @@ st.markdown("""
     <p><em>Your comprehensive health, fitness, and wellness companion!</em></p>
 </div>
 """, unsafe_allow_html=True)
+startup.record("first render (since process start)", time.perf_counter() - startup.PROCESS_START)
 
 # Sidebar for quick stats and navigation
 with st.sidebar:
     st.header("🎀 Elle's Dashboard")
     
-    # Quick stats
-    conn = sqlite3.connect('elle_complete.db')
-    workout_count = pd.read_sql_query("SELECT COUNT(*) as count FROM workouts WHERE date >= date('now', '-7 days')", conn).iloc[0]['count']
-    meal_count = pd.read_sql_query("SELECT COUNT(*) as count FROM nutrition WHERE date >= date('now', '-7 days')", conn).iloc[0]['count']
-    conn.close()
+    for error in elle.write_errors():
+        st.error(f"⚠️ A recent entry couldn't be saved: {error}")
     
-    st.metric("🏃‍♀️ This Week's Workouts", workout_count)
-    st.metric("🍽️ Meals Logged", meal_count)
+    # Filled in at the end of the run, so entries saved below are counted
+    quick_stats = st.container()
     
     # Quick actions
     st.markdown("### Quick Actions")
-    if st.button("🎤 Talk to Elle", type="primary"):
-        st.success("Say 'Hey Elle' to start!")
+    if st.button("🔇 Stop Listening" if elle.voice_listening() else "🎤 Talk to Elle", type="primary"):
+        if elle.voice_listening():
+            elle.voice.stop()
+        elif elle.voice.available:
+            elle.voice.start(respond=elle.voice_reply)
+        if not elle.voice.available or elle.voice.error:
+            st.warning(f"Voice features may not be available on this system. ({elle.voice.error})")
+        else:
+            st.rerun()
+    
+    # Polls only while the pipeline runs; starting or stopping it reruns the whole script
+    voice_polling = elle.voice_listening()
+    
+    @st.fragment(run_every=1.0 if voice_polling else None)
+    def voice_status():
+        """Live transcript and timings while the voice pipeline runs"""
+        if not elle.voice_listening():
+            if voice_polling:
+                # Stopped on its own (an error, the microphone went away): rerun once to stop polling
+                st.rerun()
+            return
+        pipeline = elle.voice.pipeline
+        if not elle.voice.hands_free:
+            st.caption(f"🎙️ Listening · {elle.voice.recognizer.name} · {pipeline.endpointer.vad.kind} VAD")
+        elif pipeline.awake:
+            st.caption(f"👂 Go ahead, I'm listening · {elle.voice.recognizer.name}")
+        else:
+            wake = pipeline.cpu_report()['wake']
+            st.caption(f"💤 Say 'Hey Elle', pause, then ask · {pipeline.wake.model.name} · "
+                       f"{wake['core_fraction']:.1%} of a core ({wake['cpu_seconds_per_hour']:.0f} CPU s/hour)")
+        for turn in pipeline.turns()[-3:]:
+            if turn.heard:
+                st.markdown(f"**You:** {turn.heard}")
+            if turn.reply:
+                st.markdown(f"**🎀 Elle:** {turn.reply}")
+            if turn.error:
+                st.error(f"⚠️ {turn.error}")
+        latency = pipeline.latency_report()
+        if 'audio_out' in latency:
+            st.caption(f"Speech → transcript {latency['recognized'] * 1000:.0f} ms · "
+                       f"→ reply audio {latency['audio_out'] * 1000:.0f} ms (median)")
+    
+    voice_status()
     
     if st.button("📊 Get Weekly Report"):
         st.session_state.show_report = True
     
     if st.button("🎯 Set New Goal"):
         st.session_state.show_goals = True
+    
+    with st.expander("⏱️ Startup Performance"):
+        for label, seconds in startup.timings().items():
+            st.caption(f"{label}: {seconds * 1000:.0f} ms")
+    
+    with st.expander("💾 Write Queue"):
+        write_queue = writer.get_writer()
+        write_stats = write_queue.stats.as_dict()
+        st.caption(f"Mode: {write_queue.durability} · {write_queue.pending()} pending")
+        st.caption(f"{write_stats['written']} rows in {write_stats['batches']} commits "
+                   f"(avg {write_stats['avg_batch']:.1f} per commit, {write_stats['avg_commit_ms']:.1f} ms each)")
+        st.caption(f"Backpressure: blocked {write_stats['blocked']} times, longest {write_stats['max_blocked_ms']:.0f} ms")
+        if write_stats['failed']:
+            st.caption(f"Failed writes: {write_stats['failed']} (last: {write_stats['last_error']})")
 
 # Main content tabs
 tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
@@ -535,11 +881,13 @@ tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
 with tab1:
     st.header("📸 Advanced Food Analysis")
     
+    meal_types = ["Breakfast", "Lunch", "Dinner", "Snack", "Pre-workout", "Post-workout"]
+    
     col1, col2 = st.columns([1, 1])
     
     with col1:
         uploaded_file = st.file_uploader("📱 Upload Food Photo", type=['png', 'jpg', 'jpeg'])
-        meal_type = st.selectbox("🍽️ Meal Type", ["Breakfast", "Lunch", "Dinner", "Snack", "Pre-workout", "Post-workout"])
+        meal_type = st.selectbox("🍽️ Meal Type", meal_types)
         
         if uploaded_file:
             image = Image.open(uploaded_file)
@@ -548,10 +896,21 @@ with tab1:
     with col2:
         if uploaded_file and st.button("🔍 Advanced Analysis", type="primary"):
             with st.spinner("🎀 Elle is analyzing your food comprehensively..."):
-                analysis = elle.analyze_food_advanced(image)
+                prepared = image_pipeline.prepare_for_vision(image, source_bytes=uploaded_file.size)
+                st.caption(f"🗜️ Photo optimized for upload: {prepared.summary()}")
+                try:
+                    analysis = elle.analyze_food_advanced(prepared)
+                except llm_gateway.GatewayError as e:
+                    st.error(f"I'm having trouble analyzing this photo right now. Error: {str(e)}")
+                    st.stop()
+                cache_stats = cache.get_vision_cache().stats.as_dict()
+                st.caption(f"⚡ Analysis cache: {cache_stats['hits'] + cache_stats['near_hits']} hits, "
+                           f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
                 
                 try:
-                    data = json.loads(analysis)
+                    data, correction = foods.cross_check(json.loads(analysis))
+                    if correction:
+                        st.caption(f"🔎 {correction}")
                     
                     st.markdown('<div class="elle-chat">', unsafe_allow_html=True)
                     st.write("**🎀 Elle's Analysis:**")
@@ -582,25 +941,89 @@ with tab1:
                             st.write(f"• {pair}")
                     
                     # Save comprehensive data
-                    nutrition_data = {
-                        'meal_type': meal_type,
-                        'food_items': ", ".join(data.get("food_items", [])),
-                        'calories': data.get("total_calories", 0),
-                        'protein': data.get('macros', {}).get('protein', 0),
-                        'carbs': data.get('macros', {}).get('carbs', 0),
-                        'fats': data.get('macros', {}).get('fats', 0),
-                        'fiber': data.get('macros', {}).get('fiber', 0),
-                        'sugar': data.get('macros', {}).get('sugar', 0),
-                        'sodium': data.get('macros', {}).get('sodium', 0),
-                        'analysis': analysis
-                    }
+                    nutrition_data = elle.nutrition_from_analysis(data, meal_type, analysis)
                     
-                    elle.save_nutrition_advanced(nutrition_data)
-                    st.success("💾 Comprehensive nutrition data saved!")
-                    st.balloons()
+                    if confirm_save(elle.save_nutrition_advanced(nutrition_data),
+                                    "💾 Comprehensive nutrition data saved!"):
+                        st.balloons()
                     
                 except:
                     st.text_area("📝 Raw Analysis", analysis, height=300)
+    
+    # Text logging: looked up in the local food database, no photo or model call
+    st.subheader("✍️ Log a Meal by Text")
+    
+    meal_text = st.text_area("What did you eat?", key="meal_text",
+                             placeholder="e.g., 2 eggs, 1 slice whole wheat toast, a medium banana, 1 cup oat milk")
+    text_meal_type = st.selectbox("🍽️ Meal Type", meal_types, key="text_meal_type")
+    
+    if meal_text.strip():
+        text_items, unmatched = foods.parse_meal(meal_text)
+        if text_items:
+            st.dataframe(pd.DataFrame([
+                dict(item=item.describe(), **item.nutrients) for item in text_items
+            ]), hide_index=True, use_container_width=True)
+            text_totals = foods.totals(text_items)
+            st.caption(f"Total: {text_totals['calories']:.0f} kcal · {text_totals['protein']:.0f}g protein · "
+                       f"{text_totals['carbs']:.0f}g carbs · {text_totals['fats']:.0f}g fats")
+        if unmatched:
+            st.warning(f"🤔 Not in Elle's food database: {', '.join(unmatched)}. "
+                       "Try simpler wording or log it with a photo.")
+        if text_items and st.button("💾 Log Meal", type="primary", key="log_text_meal"):
+            confirm_save(elle.save_nutrition_advanced(elle.nutrition_from_text(text_items, text_meal_type)),
+                         f"💾 Logged {len(text_items)} foods!")
+    
+    with st.expander("🔎 Look Up a Food"):
+        food_query = st.text_input("Food", key="food_lookup", placeholder="e.g., greek yog")
+        for _, food in foods.get_index().search(food_query, limit=5, prefix=True):
+            serving = food.default_unit
+            per_serving = food.nutrients(food.portions[serving])
+            st.write(f"**{food.name}** · 1 {serving} ({food.portions[serving]:g} g): "
+                     f"{per_serving['calories']:.0f} kcal · {per_serving['protein']:.0f}g protein · "
+                     f"{per_serving['carbs']:.0f}g carbs · {per_serving['fats']:.0f}g fats")
+    
+    # Batch logging: analyses run concurrently and render as each one finishes
+    st.subheader("📚 Log a Day of Meals")
+    
+    batch_files = st.file_uploader("📱 Upload Several Food Photos", type=['png', 'jpg', 'jpeg'],
+                                   accept_multiple_files=True, key="batch_food_photos")
+    
+    if batch_files:
+        batch_meal_types = []
+        for i, batch_file in enumerate(batch_files):
+            batch_meal_types.append(st.selectbox(f"🍽️ {batch_file.name}", meal_types, key=f"batch_meal_{i}"))
+        
+        if st.button("🔍 Analyze All Photos", type="primary"):
+            def analyze_upload(upload):
+                prepared = image_pipeline.prepare_for_vision(Image.open(upload), source_bytes=upload.size)
+                return elle.analyze_food_advanced(prepared)
+            
+            progress = st.progress(0.0, text="🎀 Elle is analyzing your meals...")
+            result_slots = [st.empty() for _ in batch_files]
+            batch_entries = []
+            
+            for done, (i, batch_analysis, error) in enumerate(batch.run_concurrently(analyze_upload, batch_files), 1):
+                progress.progress(done / len(batch_files), text=f"🎀 Analyzed {done} of {len(batch_files)} photos")
+                name = batch_files[i].name
+                
+                if error is not None:
+                    result_slots[i].error(f"❌ {name}: {error}")
+                    continue
+                try:
+                    data, correction = foods.cross_check(json.loads(batch_analysis))
+                except ValueError:
+                    result_slots[i].warning(f"⚠️ {name}: couldn't read Elle's analysis, not logged")
+                    continue
+                
+                batch_entries.append(elle.nutrition_from_analysis(data, batch_meal_types[i], batch_analysis))
+                result_slots[i].success(f"✅ {name} ({batch_meal_types[i]}): "
+                                        f"{', '.join(data.get('food_items', [])) or 'Meal'} · "
+                                        f"{data.get('total_calories', 'N/A')} kcal"
+                                        + (" · 🔎 corrected from the food database" if correction else ""))
+            
+            if batch_entries:
+                if confirm_save(elle.save_nutrition_batch(batch_entries), f"💾 Logged {len(batch_entries)} meals!"):
+                    st.balloons()
 
 with tab2:
     st.header("💪 Complete Workout Hub")
@@ -639,18 +1062,17 @@ with tab2:
                 'notes': notes
             }
             
-            elle.save_workout_advanced(workout_data)
-            st.success("🎉 Fantastic! Your complete workout has been logged!")
-            
-            # Motivational response
-            motivations = [
-                "You're absolutely crushing it! 💪",
-                "What an amazing workout session! ⭐",
-                "I'm so proud of your dedication! 🌟",
-                "You're getting stronger every day! 🚀"
-            ]
-            st.info(f"🎀 Elle says: {random.choice(motivations)}")
-            st.balloons()
+            if confirm_save(elle.save_workout_advanced(workout_data),
+                            "🎉 Fantastic! Your complete workout has been logged!"):
+                # Motivational response
+                motivations = [
+                    "You're absolutely crushing it! 💪",
+                    "What an amazing workout session! ⭐",
+                    "I'm so proud of your dedication! 🌟",
+                    "You're getting stronger every day! 🚀"
+                ]
+                st.info(f"🎀 Elle says: {random.choice(motivations)}")
+                st.balloons()
         else:
             st.error("Please enter your exercise type!")
     
@@ -670,90 +1092,178 @@ with tab2:
                                  ["None (Bodyweight)", "Dumbbells", "Resistance Bands", "Pull-up Bar", 
                                   "Full Gym", "Yoga Mat", "Kettlebells"])
     
+    regenerate_plan = st.checkbox("🔄 Create a fresh plan (skip saved plans)", key="regenerate_workout_plan")
+    
     if st.button("🎯 Generate My Custom Plan!", type="primary"):
+        def render_exercises_so_far(partial):
+            exercises = partial.get("exercises", []) if isinstance(partial, dict) else []
+            st.caption("🎀 Elle is writing your plan...")
+            for i, exercise_info in enumerate(exercises, 1):
+                if isinstance(exercise_info, dict):
+                    st.write(f"**Exercise {i}:** {exercise_info.get('name', '...')}")
+        
         with st.spinner("🎀 Elle is creating your perfect workout plan..."):
-            plan = elle.generate_workout_plan(goals, fitness_level, available_time, ", ".join(equipment))
+            plan = stream_json_reply(
+                elle.generate_workout_plan(goals, fitness_level, available_time, ", ".join(equipment),
+                                          stream=True, regenerate=regenerate_plan),
+                st.empty(), render_exercises_so_far)
+            st.caption(f"⚡ {elle.generation_summary()}")
             
-            try:
-                plan_data = json.loads(plan)
+            parsed_plan = elle.last_generation.parsed
+            if parsed_plan is not None and parsed_plan.data is not None:
+                plan_data = parsed_plan.data
                 st.success("✅ Your personalized workout plan is ready!")
+                if parsed_plan.missing:
+                    st.caption(f"⚠️ Some details didn't come through: {', '.join(parsed_plan.missing)}")
                 
-                for i, exercise_info in enumerate(plan_data.get("exercises", []), 1):
-                    with st.expander(f"Exercise {i}: {exercise_info.get('name', 'Exercise')}"):
-                        st.write(f"**Sets:** {exercise_info.get('sets', 'N/A')}")
-                        st.write(f"**Reps:** {exercise_info.get('reps', 'N/A')}")
-                        st.write(f"**Rest:** {exercise_info.get('rest', 'N/A')}")
-                        st.write(f"**Instructions:** {exercise_info.get('instructions', 'N/A')}")
-                        
-            except:
+                if plan_data['warm_up']:
+                    st.write(f"**🔥 Warm-up:** {'; '.join(plan_data['warm_up'])}")
+                for i, exercise_info in enumerate(plan_data['exercises'], 1):
+                    with st.expander(f"Exercise {i}: {exercise_info['name']}"):
+                        st.write(f"**Sets:** {exercise_info['sets'] or 'N/A'}")
+                        st.write(f"**Reps:** {exercise_info['reps'] or 'N/A'}")
+                        st.write(f"**Rest:** {exercise_info['rest'] or 'N/A'}")
+                        st.write(f"**Instructions:** {exercise_info['instructions'] or 'N/A'}")
+                        if exercise_info['modifications']:
+                            st.write(f"**Modifications:** {exercise_info['modifications']}")
+                if plan_data['cool_down']:
+                    st.write(f"**🧘 Cool-down:** {'; '.join(plan_data['cool_down'])}")
+                for note in plan_data['safety_notes']:
+                    st.caption(f"🛡️ {note}")
+            else:
                 st.text_area("📋 Your Custom Workout Plan", plan, height=400)
 
 with tab3:
     st.header("📊 Advanced Analytics & Insights")
     
-    # Get and display trends
-    trends_data = elle.analyze_health_trends()
+    # Daily rollups: one row per day, bucketed by calendar day
+    daily = elle.load_daily_rollups(30)
+    workouts_daily = daily['workouts']
+    nutrition_daily = daily['nutrition']
+    
+    # Figures are rebuilt only when new rows have arrived since they were drawn,
+    # or the day rolls over and the windows slide
+    version = (schema.days_ago_day(0), elle.data_version())
     
-    if not trends_data['workouts'].empty:
+    if not workouts_daily.empty:
         st.subheader("🏃‍♀️ Workout Trends")
         
         # Create workout frequency chart
-        workouts_by_date = trends_data['workouts'].groupby('date').size().reset_index(name='count')
-        fig_workouts = px.line(workouts_by_date, x='date', y='count', 
-                              title="Daily Workout Frequency",
-                              color_discrete_sequence=["#FF6B9D"])
+        fig_workouts = charts.cached((elle.user_id, 'workout_frequency'), version,
+                                     lambda: charts.workout_frequency(workouts_daily))
         st.plotly_chart(fig_workouts, use_container_width=True)
         
         # Exercise type distribution
-        exercise_dist = trends_data['workouts']['exercise'].value_counts()
-        fig_pie = px.pie(values=exercise_dist.values, names=exercise_dist.index,
-                        title="Exercise Type Distribution",
-                        color_discrete_sequence=px.colors.qualitative.Set3)
+        fig_pie = charts.cached((elle.user_id, 'exercise_mix'), version,
+                                lambda: charts.exercise_mix(daily['exercises']))
         st.plotly_chart(fig_pie, use_container_width=True)
     
-    if not trends_data['nutrition'].empty:
+    if not nutrition_daily.empty:
         st.subheader("🍽️ Nutrition Trends")
         
         # Daily calorie intake
-        nutrition_daily = trends_data['nutrition'].groupby('date')['calories'].sum().reset_index()
-        fig_nutrition = px.bar(nutrition_daily, x='date', y='calories',
-                              title="Daily Calorie Intake",
-                              color_discrete_sequence=["#C44BFF"])
+        fig_nutrition = charts.cached((elle.user_id, 'calorie_intake'), version,
+                                      lambda: charts.calorie_intake(nutrition_daily))
         st.plotly_chart(fig_nutrition, use_container_width=True)
         
         # Macro distribution
-        if all(col in trends_data['nutrition'].columns for col in ['protein', 'carbs', 'fats']):
-            macro_totals = {
-                'Protein': trends_data['nutrition']['protein'].sum(),
-                'Carbs': trends_data['nutrition']['carbs'].sum(),
-                'Fats': trends_data['nutrition']['fats'].sum()
-            }
-            
-            fig_macros = px.pie(values=list(macro_totals.values()), names=list(macro_totals.keys()),
-                               title="Macronutrient Distribution (Total)",
-                               color_discrete_sequence=["#FF9A8B", "#A8E6CF", "#FFD93D"])
-            st.plotly_chart(fig_macros, use_container_width=True)
+        fig_macros = charts.cached((elle.user_id, 'macro_split'), version,
+                                   lambda: charts.macro_split(nutrition_daily))
+        st.plotly_chart(fig_macros, use_container_width=True)
+    
+    # Longer-range trends, computed over the whole window at once
+    trend_ranges = {"90 days": 90, "1 year": 365, "3 years": 3 * 365}
+    trend_label = st.selectbox("📅 Trend range", list(trend_ranges))
+    trend_days = trend_ranges[trend_label]
+    trends = elle.load_analytics(trend_days)
+    resting = analytics.resting_burn(elle.user_profile)
+    
+    if trends['minutes'].any():
+        st.subheader("⚖️ Training Load")
+        
+        latest = trends.iloc[-1]
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("🔥 Acute Load (7-day min/day)", f"{latest['acute_load']:.0f}")
+        
+        with col2:
+            st.metric("🏔️ Chronic Load (28-day min/day)", f"{latest['chronic_load']:.0f}")
+        
+        with col3:
+            ratio = latest['acwr']
+            st.metric("⚖️ Acute:Chronic Ratio", "—" if ratio != ratio else f"{ratio:.2f}")
+        
+        st.caption(f"🎀 {analytics.acwr_zone(ratio)} (aim for {analytics.ACWR_LOW}–{analytics.ACWR_HIGH})")
+        
+        fig_load = charts.cached((elle.user_id, 'training_load', trend_days), version,
+                                 lambda: charts.training_load(trends, f"Training Load (minutes per day, {trend_label})"))
+        st.plotly_chart(fig_load, use_container_width=True)
+    
+    if trends['calorie_balance'].notna().any():
+        st.subheader("🔥 Calorie Balance")
+        
+        fig_balance = charts.cached((elle.user_id, 'calorie_balance', trend_days, round(resting)), version,
+                                    lambda: charts.calorie_balance(trends, f"Daily Calorie Balance (intake − burn, {trend_label})"))
+        st.plotly_chart(fig_balance, use_container_width=True)
+        
+        if resting:
+            st.caption(f"Burn = ~{resting:.0f} cal/day at rest (from your profile) + logged workouts")
+        else:
+            st.caption("Burn = logged workouts only - fill in your profile to include calories burned at rest")
+    
+    correlation_matrix = analytics.correlations(trends)
+    if len(correlation_matrix) >= 2:
+        st.subheader("🔗 What Moves Together")
+        
+        fig_corr = charts.cached((elle.user_id, 'correlations', trend_days), version,
+                                 lambda: charts.correlation_heatmap(correlation_matrix, f"Day-by-Day Correlations ({trend_label})"))
+        st.plotly_chart(fig_corr, use_container_width=True)
     
     # Performance metrics
     st.subheader("📈 Performance Metrics")
     
     col1, col2, col3, col4 = st.columns(4)
     
+    total_workouts = int(workouts_daily['workout_count'].sum())
+    
     with col1:
-        total_workouts = len(trends_data['workouts'])
         st.metric("🏃‍♀️ Total Workouts", total_workouts)
     
     with col2:
-        total_calories_burned = trends_data['workouts']['calories'].sum() if not trends_data['workouts'].empty else 0
+        total_calories_burned = int(workouts_daily['total_calories'].sum())
         st.metric("🔥 Calories Burned", total_calories_burned)
     
     with col3:
-        total_meals = len(trends_data['nutrition'])
+        total_meals = int(nutrition_daily['meal_count'].sum())
         st.metric("🍽️ Meals Logged", total_meals)
     
     with col4:
-        avg_workout_duration = trends_data['workouts']['duration'].mean() if not trends_data['workouts'].empty else 0
+        avg_workout_duration = workouts_daily['total_minutes'].sum() / total_workouts if total_workouts else 0
         st.metric("⏱️ Avg Workout (min)", f"{avg_workout_duration:.1f}")
+    
+    # Per-second sensor data from imported sessions
+    sampled = elle.read('sampled_workouts', ('workouts',), samples.sampled_workouts, elle.user_id)
+    
+    if sampled:
+        st.subheader("🫀 Workout Detail")
+        session_labels = {workout_id: f"{date[:16].replace('T', ' ')} · {exercise}"
+                          for workout_id, date, exercise in sampled}
+        session_id = st.selectbox("🏃‍♀️ Session", list(session_labels), format_func=session_labels.get)
+        
+        session_channels = elle.read('sample_channels', ('workouts',), samples.channels, session_id)
+        
+        def channel_figure(channel):
+            with elle.connection() as conn:
+                # ~1200 points is plenty for a chart; longer sessions read a coarser level
+                times, values = samples.read(conn, session_id, channel, max_points=1200)
+            return charts.sample_channel(times, values, samples.CHANNEL_LABELS[channel])
+        
+        for channel in session_channels:
+            # Stored samples never change, so the session alone identifies the figure
+            fig_channel = charts.cached((elle.user_id, 'samples', session_id, channel), None,
+                                        lambda: channel_figure(channel))
+            st.plotly_chart(fig_channel, use_container_width=True)
 
 with tab4:
     st.header("🍽️ AI-Powered Meal Planning")
@@ -772,26 +1282,48 @@ with tab4:
         daily_calories = st.number_input("🎯 Target Daily Calories", min_value=1200, max_value=4000, value=2000)
         allergies = st.text_input("🚫 Allergies/Restrictions", placeholder="e.g., nuts, dairy, gluten")
     
+    regenerate_meal_plan = st.checkbox("🔄 Create a fresh plan (skip saved plans)", key="regenerate_meal_plan")
+    
     if st.button("🍽️ Create My Meal Plan!", type="primary"):
+        def render_days_so_far(partial):
+            st.caption("🎀 Elle is writing your meal plan...")
+            days_so_far = partial.get('days', []) if isinstance(partial, dict) else []
+            for day_info in days_so_far:
+                if isinstance(day_info, dict):
+                    meals = day_info.get('meals', [])
+                    meal_names = [m.get('name', '...') for m in meals if isinstance(m, dict)] if isinstance(meals, list) else []
+                    st.write(f"**📅 {str(day_info.get('day', '...')).title()}:** {', '.join(meal_names)}")
+        
         with st.spinner("🎀 Elle is crafting your perfect meal plan..."):
-            meal_plan = elle.create_meal_plan(plan_days)
+            meal_plan = stream_json_reply(elle.create_meal_plan(plan_days, stream=True, regenerate=regenerate_meal_plan),
+                                          st.empty(), render_days_so_far)
+            st.caption(f"⚡ {elle.generation_summary()}")
             
-            try:
-                plan_data = json.loads(meal_plan)
-                st.success(f"✅ Your {plan_days}-day meal plan is ready!")
+            parsed_plan = elle.last_generation.parsed
+            if parsed_plan is not None and parsed_plan.data is not None:
+                plan_data = parsed_plan.data
+                if len(plan_data['days']) < plan_days:
+                    st.warning(f"⚠️ Elle finished {len(plan_data['days'])} of {plan_days} days - "
+                               "try again for the rest, or a shorter plan.")
+                else:
+                    st.success(f"✅ Your {plan_days}-day meal plan is ready!")
                 
-                for day, meals in plan_data.items():
-                    with st.expander(f"📅 {day.title()}"):
-                        for meal_type, meal_info in meals.items():
-                            st.write(f"**{meal_type.title()}:**")
-                            st.write(f"• {meal_info.get('name', 'Meal')}")
-                            st.write(f"• Calories: {meal_info.get('calories', 'N/A')}")
-                            st.write(f"• Prep time: {meal_info.get('prep_time', 'N/A')}")
-                            if meal_info.get('recipe'):
+                for day_info in plan_data['days']:
+                    with st.expander(f"📅 {day_info['day'].title()}"):
+                        for meal_info in day_info['meals']:
+                            st.write(f"**{meal_info['meal'].title()}:**")
+                            st.write(f"• {meal_info['name']}")
+                            st.write(f"• Calories: {meal_info['calories'] or 'N/A'}")
+                            st.write(f"• Prep time: {meal_info['prep_time'] or 'N/A'}")
+                            if meal_info['recipe']:
                                 st.write(f"• Recipe: {meal_info['recipe']}")
                             st.write("---")
-                            
-            except:
+                
+                if plan_data['shopping_list']:
+                    with st.expander("🛒 Shopping List"):
+                        for item in plan_data['shopping_list']:
+                            st.write(f"• {item}")
+            else:
                 st.text_area("📋 Your Custom Meal Plan", meal_plan, height=500)
     
     # Recipe generator
@@ -801,23 +1333,15 @@ with tab4:
     cuisine_type = st.selectbox("🌍 Cuisine Style", 
                                ["Italian", "Asian", "Mediterranean", "Mexican", "American", "Indian"])
     
+    regenerate_recipe = st.checkbox("🔄 Create a fresh recipe (skip saved recipes)", key="regenerate_recipe")
+    
     if st.button("🍳 Generate Recipe!"):
         with st.spinner("🎀 Elle is creating a delicious recipe..."):
             try:
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{
-                        "role": "system",
-                        "content": "You are Elle, a creative chef AI. Create delicious, healthy recipes."
-                    }, {
-                        "role": "user",
-                        "content": f"Create a {cuisine_type} recipe using: {ingredients}. Include ingredients, instructions, nutrition info, and cooking tips."
-                    }],
-                    max_tokens=600
-                )
+                st.write_stream(elle.generate_recipe(cuisine_type, ingredients, stream=True, regenerate=regenerate_recipe))
                 
                 st.success("👨‍🍳 Fresh recipe created!")
-                st.markdown(response.choices[0].message.content)
+                st.caption(f"⚡ {elle.generation_summary()}")
                 
             except Exception as e:
                 st.error(f"Error creating recipe: {str(e)}")
@@ -831,27 +1355,21 @@ with tab5:
     col1, col2 = st.columns(2)
     
     with col1:
-        goal_type = st.selectbox("🎪 Goal Type", 
-                                ["Weight Loss", "Weight Gain", "Muscle Building", "Endurance", 
-                                 "Strength", "Flexibility", "Habit Building"])
+        goal_type = st.selectbox("🎪 Goal Type", list(goal_progress.MEASURES))
         goal_description = st.text_input("📝 Goal Description", placeholder="e.g., Lose 10 pounds")
     
     with col2:
-        target_value = st.number_input("🎯 Target Value", value=0.0)
+        # A fixed label and key, so changing the goal type doesn't reset the target
+        target_value = st.number_input("🎯 Target Value", value=0.0, key="goal_target")
         target_date = st.date_input("📅 Target Date", value=datetime.now() + timedelta(days=30))
     
+    st.caption(f"📏 Target in {goal_progress.MEASURES[goal_type].unit}; "
+               "Elle tracks this from your logs, starting today.")
+    
     if st.button("🎯 Set Goal!", type="primary"):
         # Save goal to database
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO goals (goal_type, description, target_value, current_value, 
-                             target_date, status, created_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (goal_type, goal_description, target_value, 0, target_date.isoformat(), 
-              'Active', datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        with elle.transaction() as conn:
+            goal_progress.add(conn, elle.user_id, goal_type, goal_description, target_value, target_date.isoformat())
         
         st.success("🎉 Goal set successfully! Elle will help you achieve it!")
         st.balloons()
@@ -859,22 +1377,40 @@ with tab5:
     # Display current goals
     st.subheader("📋 Your Active Goals")
     
-    conn = sqlite3.connect('elle_complete.db')
-    goals_df = pd.read_sql_query("SELECT * FROM goals WHERE status = 'Active'", conn)
-    conn.close()
+    def read_goals():
+        # Progress is kept current on every insert; this only derives the display columns
+        return elle.read('goals', ('goals',), lambda conn: goal_progress.evaluate(pd.read_sql_query(
+            "SELECT * FROM goals WHERE user_id = ? ORDER BY target_date", conn, params=(elle.user_id,))))
     
-    if not goals_df.empty:
-        for _, goal in goals_df.iterrows():
-            progress = (goal['current_value'] / goal['target_value']) * 100 if goal['target_value'] > 0 else 0
-            
+    goals_df = read_goals()
+    if goals_df['overdue'].any():
+        with elle.transaction() as conn:
+            goal_progress.expire(conn, elle.user_id)
+        goals_df = read_goals()
+    
+    active_goals = goals_df[goals_df['status'] == goal_progress.ACTIVE]
+    if not active_goals.empty:
+        for goal in active_goals.itertuples():
             with st.container():
-                st.markdown(f"**{goal['goal_type']}: {goal['description']}**")
-                st.progress(min(progress / 100, 1.0))
-                st.write(f"Progress: {progress:.1f}% | Target: {goal['target_value']} | Due: {goal['target_date']}")
+                st.markdown(f"**{goal.goal_type}: {goal.description}**")
+                st.progress(goal.progress)
+                pace = "✅ On track" if goal.on_track else f"⏳ {goal.expected:.0%} of the time has gone"
+                st.write(f"Progress: {goal.progress:.1%} ({goal.current_value or 0:g} of {goal.target_value:g} "
+                         f"{goal.unit}) | {pace} | Due: {goal.target_date} ({goal.days_left} days left)")
                 st.write("---")
     else:
         st.info("No active goals yet. Set your first goal above!")
     
+    finished_goals = goals_df[goals_df['status'] != goal_progress.ACTIVE]
+    if not finished_goals.empty:
+        with st.expander(f"🏅 Finished Goals ({len(finished_goals)})"):
+            for goal in finished_goals.itertuples():
+                if goal.status == goal_progress.COMPLETED:
+                    st.write(f"🏆 **{goal.goal_type}: {goal.description}** - completed {goal.completed_date}")
+                else:
+                    st.write(f"⌛ **{goal.goal_type}: {goal.description}** - expired at {goal.progress:.0%} "
+                             f"on {goal.target_date}")
+    
     # Challenge system
     st.subheader("🏆 Fitness Challenges")
     
@@ -920,48 +1456,64 @@ with tab6:
         workout_motivation = st.slider("💪 Workout Motivation (1-10)", 1, 10, 8)
         
     if st.button("💝 Log Health Data!", type="primary"):
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
+        saved = elle.save_health_metrics({
+            'weight': current_weight,
+            'resting_heart_rate': resting_hr,
+            'sleep_hours': sleep_hours,
+            'stress_level': stress_level,
+            'energy_level': energy_level,
+            'hydration_glasses': hydration
+        })
         
-        cursor.execute('''
-            INSERT INTO health_metrics (date, weight, resting_heart_rate, sleep_hours, 
-                                      stress_level, energy_level, hydration_glasses)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (datetime.now().isoformat(), current_weight, resting_hr, sleep_hours,
-              stress_level, energy_level, hydration))
-        
-        conn.commit()
-        conn.close()
-        
-        st.success("💝 Health data logged successfully!")
-        st.info(f"🎀 Elle says: Thanks for checking in! Your wellness matters to me! 💕")
+        if confirm_save(saved, "💝 Health data logged successfully!"):
+            st.info(f"🎀 Elle says: Thanks for checking in! Your wellness matters to me! 💕")
+    
+    # Wearable imports
+    st.subheader("📲 Import from Wearables")
+    st.markdown("Bring in history from Apple Health, Fitbit, Google Fit or Garmin (TCX, GPX, FIT) exports.")
+    
+    import_uploads = st.file_uploader("📁 Export files or zips", type=list(importer.EXTENSIONS),
+                                      accept_multiple_files=True, key="wearable_import")
+    
+    if import_uploads and st.button("📲 Import History", type="primary"):
+        try:
+            with st.spinner("📲 Importing your history..."):
+                result = importer.import_files(elle.db_path, elle.user_id,
+                                               [(upload.name, upload) for upload in import_uploads])
+        except Exception as e:
+            # Unreadable files are skipped inside the importer; this is the database or disk failing
+            st.error(f"⚠️ Import stopped part way: {e}")
+        else:
+            st.success(f"🎉 {result.summary()}")
+            for name, reason in result.skipped_files:
+                st.warning(f"⚠️ Skipped {name}: {reason}")
     
     # Health insights
     st.subheader("📈 Health Trends")
     
-    conn = sqlite3.connect('elle_complete.db')
-    health_data = pd.read_sql_query('''
-        SELECT date, weight, resting_heart_rate, sleep_hours, stress_level, energy_level 
-        FROM health_metrics 
-        WHERE date >= date('now', '-30 days')
-        ORDER BY date
-    ''', conn)
-    conn.close()
+    health_data = daily['health']
     
     if not health_data.empty:
         # Weight trend
         if health_data['weight'].notna().any():
-            fig_weight = px.line(health_data, x='date', y='weight', 
-                                title="Weight Trend (30 days)",
-                                color_discrete_sequence=["#FF6B9D"])
+            fig_weight = charts.cached((elle.user_id, 'weight', trend_days), version,
+                                       lambda: charts.weight(health_data, trends))
             st.plotly_chart(fig_weight, use_container_width=True)
         
         # Sleep vs Energy correlation
         if health_data['sleep_hours'].notna().any() and health_data['energy_level'].notna().any():
-            fig_sleep = px.scatter(health_data, x='sleep_hours', y='energy_level',
-                                  title="Sleep vs Energy Correlation",
-                                  color_discrete_sequence=["#C44BFF"])
+            fig_sleep = charts.cached((elle.user_id, 'sleep_energy'), version,
+                                      lambda: charts.sleep_energy(health_data))
             st.plotly_chart(fig_sleep, use_container_width=True)
+            
+            r, days_logged = analytics.correlation(trends, 'sleep_hours', 'energy_level')
+            if r == r:
+                strength = "strong" if abs(r) >= 0.5 else "moderate" if abs(r) >= 0.3 else "weak"
+                st.caption(f"📐 r = {r:.2f} over {days_logged} days - a {strength} "
+                           f"{'positive' if r > 0 else 'negative'} relationship")
+            else:
+                st.caption(f"📐 Log sleep and energy on at least {analytics.MIN_CORRELATION_DAYS} days "
+                           f"to measure how they relate")
     else:
         st.info("Start logging your health data to see trends and insights!")
 
@@ -970,12 +1522,18 @@ with tab7:
     
     st.markdown("Get personalized advice, motivation, and insights from Elle!")
     
-    # Chat interface
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
+    # Chat interface: history lives in the database, a page at a time
+    if 'chat_pages' not in st.session_state:
+        st.session_state.chat_pages = 1
+    
+    chat_messages, older_messages = elle.chat_page(st.session_state.chat_pages * conversation.PAGE_SIZE)
+    
+    if older_messages and st.button("⬆️ Show earlier messages"):
+        st.session_state.chat_pages += 1
+        st.rerun()
     
     # Display chat history
-    for message in st.session_state.chat_history:
+    for message in chat_messages:
         if message['role'] == 'user':
             st.markdown(f"**You:** {message['content']}")
         else:
@@ -986,31 +1544,18 @@ with tab7:
     
     if st.button("Send 💌") and user_message:
         # Add user message to history
-        st.session_state.chat_history.append({'role': 'user', 'content': user_message})
+        elle.add_chat_message('user', user_message)
         
         try:
-            # Get Elle's response
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are Elle, an encouraging, knowledgeable, and supportive AI fitness coach. 
-                        You have a warm, friendly personality and always provide helpful, accurate advice about:
-                        - Fitness and exercise
-                        - Nutrition and healthy eating
-                        - Mental wellness and motivation
-                        - Goal setting and achievement
-                        
-                        Always be encouraging, use emojis appropriately, and provide actionable advice.
-                        Remember you're Elle, their personal AI fitness assistant who cares about their success."""
-                    }
-                ] + st.session_state.chat_history[-10:],  # Keep last 10 messages for context
-                max_tokens=400
-            )
+            # Stream Elle's response as it's written
+            st.markdown(f"**You:** {user_message}")
+            st.markdown("**🎀 Elle:**")
+            elle_response = st.write_stream(elle.chat(stream=True))
+            elle.add_chat_message('assistant', elle_response)
             
-            elle_response = response.choices[0].message.content
-            st.session_state.chat_history.append({'role': 'assistant', 'content': elle_response})
+            # Older turns become part of the summary so the next prompt stays within budget
+            elle.summarize_chat()
+            st.session_state.chat_pages = 1
             
             # Rerun to show new messages
             st.rerun()
@@ -1037,8 +1582,12 @@ with tab7:
     with col2:
         if st.button("🎯 Get AI Insights"):
             with st.spinner("🎀 Elle is analyzing your progress..."):
-                insights = elle.get_ai_insights()
-                st.info(insights)
+                insights_box = st.empty()
+                insights = ""
+                for chunk in elle.get_ai_insights(stream=True):
+                    insights += chunk
+                    insights_box.info(insights)
+                st.caption(f"⚡ {elle.generation_summary()}")
     
     with col3:
         if st.button("📋 Daily Check-in"):
@@ -1050,6 +1599,31 @@ with tab7:
                 "How can I support you today? 💝"
             ]
             st.info(f"🎀 Elle asks: {random.choice(checkin_questions)}")
+    
+    latency = streaming.latency_report()
+    gateway_stats = gateway.stats()
+    saved_plan_stats = cache.get_response_cache().hit_rates()
+    digest_stats = digest.stats()
+    reply_stats = structured.stats()
+    if latency or gateway_stats or saved_plan_stats:
+        with st.expander("⚡ Response Speed"):
+            for label, stats in latency.items():
+                st.write(f"**{label.replace('_', ' ').title()}:** first token in {stats['median_ttft']:.2f}s, "
+                         f"full reply in {stats['median_total']:.1f}s (median of {stats['count']})")
+            for model, stats in gateway_stats.items():
+                st.caption(f"{model}: {stats['calls']} calls, {stats['retries']} retries, {stats['errors']} errors, "
+                           f"{stats['coalesced']} shared · p50 {stats['p50_latency']:.1f}s, p95 {stats['p95_latency']:.1f}s · "
+                           f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens")
+            for label, stats in saved_plan_stats.items():
+                st.caption(f"Saved {label.replace('_', ' ')}s: {stats['hits']} reused, {stats['misses']} generated "
+                           f"({stats['hit_rate']:.0%} hit rate)")
+            if digest_stats['hits'] + digest_stats['misses']:
+                st.caption(f"Insight digests: {digest_stats['hits']} reused, {digest_stats['misses']} rebuilt "
+                           f"({digest_stats['hit_rate']:.0%} hit rate)")
+            for label, outcomes in reply_stats.items():
+                st.caption(f"{label.replace('_', ' ').title()} replies: {outcomes.get('clean', 0)} clean, "
+                           f"{outcomes.get('repaired', 0)} repaired, {outcomes.get('reasked', 0)} completed by a "
+                           f"follow-up, {outcomes.get('partial', 0) + outcomes.get('failed', 0)} incomplete")
 
 with tab8:
     st.header("⚙️ Your Fitness Profile")
@@ -1089,20 +1663,16 @@ with tab8:
     
     # Save profile
     if st.button("💾 Save Profile", type="primary"):
-        conn = sqlite3.connect('elle_complete.db')
-        cursor = conn.cursor()
-        
-        # Delete existing profile and insert new one
-        cursor.execute('DELETE FROM user_profile')
-        cursor.execute('''
-            INSERT INTO user_profile (name, age, gender, height, weight, activity_level, 
-                                    fitness_goals, dietary_restrictions, created_date, updated_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (profile_name, age, gender, height, weight_profile, activity_level,
-              fitness_goals, dietary_restrictions, datetime.now().isoformat(), datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
+        with elle.transaction() as conn:
+            # Delete existing profile and insert new one
+            conn.execute('DELETE FROM user_profile WHERE user_id = ?', (elle.user_id,))
+            conn.execute('''
+                INSERT INTO user_profile (user_id, name, age, gender, height, weight, activity_level, 
+                                        fitness_goals, dietary_restrictions, created_date, updated_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (elle.user_id, profile_name, age, gender, height, weight_profile, activity_level,
+                  fitness_goals, dietary_restrictions, datetime.now().isoformat(), datetime.now().isoformat()))
+            versions.bump(conn, elle.user_id, 'user_profile')
         
         # Update session state
         st.session_state.elle.user_profile = {
@@ -1138,50 +1708,52 @@ with tab8:
     col1, col2, col3 = st.columns(3)
     
     with col1:
+        export_format = st.selectbox("🗂️ Export Format", export.formats(), format_func=str.upper)
         if st.button("📥 Export My Data"):
-            # Export functionality
-            conn = sqlite3.connect('elle_complete.db')
-            
-            workouts_df = pd.read_sql_query("SELECT * FROM workouts", conn)
-            nutrition_df = pd.read_sql_query("SELECT * FROM nutrition", conn)
-            health_df = pd.read_sql_query("SELECT * FROM health_metrics", conn)
-            
-            conn.close()
-            
-            # Create download link for CSV
-            csv_workouts = workouts_df.to_csv(index=False)
-            csv_nutrition = nutrition_df.to_csv(index=False)
-            csv_health = health_df.to_csv(index=False)
+            # Include anything still waiting in the write queue
+            writer.get_writer().flush()
+            with st.spinner("📦 Packing your data..."), elle.connection() as conn:
+                archive = export.write_archive(conn, elle.user_id, export_format)
+            # Streamlit serves downloads from memory, so only the compressed archive is held
+            with archive:
+                archive_bytes = archive.read()
             
             st.download_button(
-                label="📥 Download Workouts CSV",
-                data=csv_workouts,
-                file_name=f"elle_workouts_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime='text/csv'
+                label="📥 Download All My Data (.zip)",
+                data=archive_bytes,
+                file_name=f"elle_export_{datetime.now().strftime('%Y%m%d')}.zip",
+                mime='application/zip'
             )
     
     with col2:
         if st.button("🔄 Reset App Data"):
             st.warning("⚠️ This will delete ALL your data permanently!")
             if st.button("❌ Confirm Reset", type="secondary"):
-                conn = sqlite3.connect('elle_complete.db')
-                cursor = conn.cursor()
-                
-                cursor.execute('DELETE FROM workouts')
-                cursor.execute('DELETE FROM nutrition')
-                cursor.execute('DELETE FROM health_metrics')
-                cursor.execute('DELETE FROM goals')
-                cursor.execute('DELETE FROM user_profile')
-                
-                conn.commit()
-                conn.close()
+                with elle.transaction() as conn:
+                    for table in schema.USER_TABLES:
+                        conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (elle.user_id,))
+                    rollups.clear(conn, elle.user_id)
+                    conversation.clear(conn, elle.user_id)
+                    versions.bump(conn, elle.user_id, *schema.USER_TABLES)
                 
                 st.success("🔄 All data has been reset!")
     
     with col3:
-        st.metric("📊 Total Data Points", 
-                 len(pd.read_sql_query("SELECT * FROM workouts", sqlite3.connect('elle_complete.db'))) + 
-                 len(pd.read_sql_query("SELECT * FROM nutrition", sqlite3.connect('elle_complete.db'))))
+        st.metric("📊 Total Data Points", elle.count_entries())
+
+# Quick stats
+def read_week_counts(conn, week_start):
+    workout_count = conn.execute("SELECT COUNT(*) FROM workouts WHERE user_id = ? AND ts >= ?",
+                                 (elle.user_id, week_start)).fetchone()[0]
+    meal_count = conn.execute("SELECT COUNT(*) FROM nutrition WHERE user_id = ? AND ts >= ?",
+                              (elle.user_id, week_start)).fetchone()[0]
+    return workout_count, meal_count
+
+workout_count, meal_count = elle.read('week_counts', ('workouts', 'nutrition'), read_week_counts,
+                                      schema.days_ago_ts(7))
+with quick_stats:
+    st.metric("🏃‍♀️ This Week's Workouts", workout_count)
+    st.metric("🍽️ Meals Logged", meal_count)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,37 @@
+"""Bounded fan-out for slow per-item work such as vision calls.
+
+Results are yielded in completion order on the calling thread, so the
+Streamlit script can render each one as soon as it is ready while the
+workers never touch ``st`` themselves.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Vision calls in flight across all sessions of this process; keeps a batch
+# upload from bursting past the provider's per-minute request limit.
+MAX_CONCURRENT_VISION_CALLS = 4
+_vision_slots = threading.BoundedSemaphore(MAX_CONCURRENT_VISION_CALLS)
+
+
+def _throttled(fn, slots):
+    def run(item):
+        with slots:
+            return fn(item)
+    return run
+
+
+def run_concurrently(fn, items, max_workers=MAX_CONCURRENT_VISION_CALLS, slots=_vision_slots):
+    """Yield ``(index, result, error)`` for each item as its call finishes"""
+    items = list(items)
+    if not items:
+        return
+    task = _throttled(fn, slots)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)),
+                            thread_name_prefix='elle-batch') as pool:
+        futures = {pool.submit(task, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, e
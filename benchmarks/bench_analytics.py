@@ -0,0 +1,90 @@
+"""Time the analytics engine over several years of synthetic history.
+
+    python benchmarks/bench_analytics.py [years]
+
+Builds a throwaway database with a workout most days, three meals a day and
+a daily check-in, then reports the best of several runs for each step.
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import analytics  # noqa: E402
+import database  # noqa: E402
+import rollups  # noqa: E402
+import schema  # noqa: E402
+
+USER = 'bench'
+REPEATS = 20
+
+
+def populate(path, years):
+    random.seed(7)
+    days = int(years * 365)
+    start = datetime.now() - timedelta(days=days)
+    workouts, meals, checkins = [], [], []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if random.random() < 0.7:
+            workouts.append((USER, day.isoformat(), int(day.timestamp()), 'Running',
+                             random.randint(20, 90), random.randint(150, 800)))
+        for meal in range(3):
+            moment = day + timedelta(hours=7 + 5 * meal)
+            meals.append((USER, moment.isoformat(), int(moment.timestamp()), 'Meal',
+                          random.randint(300, 900), 30.0, 60.0, 20.0))
+        checkins.append((USER, day.isoformat(), int(day.timestamp()), 150 + random.gauss(0, 1.5),
+                         random.randint(50, 65), random.uniform(5, 9), random.randint(1, 10),
+                         random.randint(1, 10), random.randint(4, 12)))
+
+    with database.transaction(path) as conn:
+        schema.migrate(conn)
+        conn.executemany('''
+            INSERT INTO workouts (user_id, date, ts, exercise, duration, calories) VALUES (?, ?, ?, ?, ?, ?)
+        ''', workouts)
+        conn.executemany('''
+            INSERT INTO nutrition (user_id, date, ts, meal_type, calories, protein, carbs, fats)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', meals)
+        conn.executemany('''
+            INSERT INTO health_metrics (user_id, date, ts, weight, resting_heart_rate, sleep_hours,
+                                        stress_level, energy_level, hydration_glasses)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', checkins)
+        rollups.rebuild(conn)
+    return days, len(workouts) + len(meals) + len(checkins)
+
+
+def best_ms(fn):
+    return min(timeit.repeat(fn, number=1, repeat=REPEATS)) * 1000
+
+
+def main():
+    years = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    days, rows = populate(path, years)
+    print(f"{years:g} years: {days} days, {rows} raw rows")
+
+    with database.connection(path) as conn:
+        since = (datetime.now() - timedelta(days=days)).date().isoformat()
+        frame = analytics.daily_frame(conn, USER, since)
+        steps = {
+            'daily_frame (3 rollup reads)': lambda: analytics.daily_frame(conn, USER, since),
+            'rolling 7/28-day means': lambda: analytics.rolling_means(frame, ('minutes', 'calories_in', 'sleep_hours')),
+            'training load + ACWR': lambda: analytics.training_load(frame),
+            'EWMA weight trend': lambda: analytics.weight_trend(frame),
+            'calorie balance': lambda: analytics.calorie_balance(frame, 1800),
+            'correlation matrix': lambda: analytics.correlations(frame),
+            'summarize (everything, full history)': lambda: analytics.summarize(conn, USER, days),
+        }
+        analytics.summarize(conn, USER, days)  # warm imports and caches
+        for label, fn in steps.items():
+            print(f"  {label:<40} {best_ms(fn):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Measure speech-in to reply-audio-out latency over recorded WAV fixtures.
+
+    python benchmarks/bench_voice.py [fixture.wav ...] [--speak] [--recognizer NAME]
+    python benchmarks/bench_voice.py --synthetic
+
+Each fixture is played through the voice pipeline at real-time speed, as
+if from a microphone, and every utterance is timed from the end of speech
+to: the VAD closing it, the transcript, the first reply sentence and the
+start of reply audio. Replies come from a canned responder, so the numbers
+are the pipeline's own; add the model's time-to-first-token for the full
+round trip.
+
+Fixtures default to ``benchmarks/fixtures/voice/*.wav`` (any rate or
+width; mono or stereo). ``--synthetic`` generates syllable-like noise
+bursts instead, which exercises capture, VAD and TTS but gives the
+recognizer nothing to transcribe. Without an offline recognizer a
+placeholder transcript is used and the recognition stage measures nothing.
+"""
+import argparse
+import glob
+import math
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import voice  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'voice', '*.wav')
+REPLY = "Great question! Keep your chest up and your knees tracking over your toes. Start with three sets of ten."
+STAGES = ('endpoint', 'recognized', 'first_sentence', 'audio_out')
+
+
+class PlaceholderRecognizer:
+    """Stands in when no recognizer is installed, so the reply path is still timed"""
+
+    name = 'none (placeholder transcript)'
+
+    def start(self):
+        pass
+
+    def feed(self, frame):
+        pass
+
+    def finish(self):
+        return '[speech]'
+
+
+def canned_reply(text):
+    for word in REPLY.split(' '):
+        yield word + ' '
+
+
+def synthetic_fixtures(directory, count=5):
+    """Utterances of 4 Hz noise bursts (syllables) with short gaps, between silences"""
+    random.seed(11)
+    paths = []
+    for index in range(count):
+        samples = []
+        samples += [int(random.gauss(0, 40)) for _ in range(voice.SAMPLE_RATE // 2)]  # room noise
+        for _ in range(random.randint(6, 14)):
+            syllable = int(voice.SAMPLE_RATE * random.uniform(0.12, 0.25))
+            samples += [int(random.gauss(0, 3000) * math.sin(math.pi * i / syllable)) for i in range(syllable)]
+            samples += [int(random.gauss(0, 40)) for _ in range(int(voice.SAMPLE_RATE * random.uniform(0.03, 0.2)))]
+        pcm = b''.join(max(-32768, min(32767, s)).to_bytes(2, 'little', signed=True) for s in samples)
+        path = os.path.join(directory, f'synthetic_{index}.wav')
+        voice.write_wav(path, pcm)
+        paths.append(path)
+    return paths
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('fixtures', nargs='*')
+    parser.add_argument('--synthetic', action='store_true', help="generate noise-burst fixtures")
+    parser.add_argument('--speak', action='store_true', help="play replies through the TTS engine")
+    parser.add_argument('--recognizer', choices=voice.RECOGNIZERS, help="force one recognizer")
+    args = parser.parse_args()
+
+    paths = args.fixtures or (synthetic_fixtures(tempfile.mkdtemp()) if args.synthetic else sorted(glob.glob(FIXTURES)))
+    if not paths:
+        sys.exit(f"No fixtures: record some WAVs into {os.path.dirname(FIXTURES)} or pass --synthetic")
+
+    recognizer, errors = voice.load_recognizer((args.recognizer,) if args.recognizer else voice.RECOGNIZERS)
+    recognizer = recognizer or PlaceholderRecognizer()
+    print(f"recognizer: {recognizer.name}"
+          + ''.join(f"\n  {name} unavailable: {error}" for name, error in errors.items()))
+    print(f"vad: {voice.VoiceActivityDetector().kind}\n")
+
+    print(f"{'fixture':<24} {'endpoint':>9} {'recognized':>11} {'1st sentence':>13} {'audio out':>10}  heard")
+    results = {stage: [] for stage in STAGES}
+    for path in paths:
+        source = voice.WavSource(path)
+        speaker = voice.Speaker(enabled=args.speak)
+        if args.speak and not speaker.available and path == paths[0]:
+            print(f"tts unavailable ({speaker.error}); timing hand-off only")
+        pipeline = voice.VoicePipeline(source, recognizer, canned_reply, speaker).start()
+        pipeline.wait_until_done(timeout=source.duration + 60)
+        pipeline.stop()  # lets the speaker finish its queue
+        for turn in pipeline.turns():
+            timings = turn.timings()
+            for stage in STAGES:
+                if timings[stage] is not None:
+                    results[stage].append(timings[stage])
+            cells = ''.join(f" {'—' if timings[s] is None else f'{timings[s] * 1000:.0f} ms':>{w}}"
+                            for s, w in zip(STAGES, (9, 11, 13, 10)))
+            print(f"{os.path.basename(path)[:24]:<24}{cells}  {turn.heard[:40]!r}")
+
+    print("\nmedian since end of speech:")
+    for stage in STAGES:
+        value = median(results[stage])
+        print(f"  {stage:<15} {'—' if value is None else f'{value * 1000:.0f} ms'}  ({len(results[stage])} turns)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Measure the "Hey Elle" detector: misses, false triggers, latency and CPU.
+
+    python benchmarks/bench_wakeword.py [--fixtures DIR] [--model templates|vosk] [--idle-minutes N]
+    python benchmarks/bench_wakeword.py --synthetic
+
+Fixtures live in ``benchmarks/fixtures/wakeword/``:
+
+* ``templates/*.wav``: a few recordings of the phrase, for the template model
+* ``positive/*.wav``: one "Hey Elle" each, with whatever came before it
+* ``negative/*.wav``: anything else (conversation, TV, kitchen noise)
+
+Audio is fed frame by frame as fast as the detector takes it, timed in
+audio time. Latency runs from the end of the last loud frame before a
+trigger to the trigger, plus the time the triggering call took. CPU is
+thread time inside the detector per hour of audio, measured separately
+for the negatives and for ``--idle-minutes`` of generated room noise (the
+state an always-on listener spends most of its life in).
+
+``--synthetic`` writes a stand-in phrase (two vowel-like syllables with
+moving formants) spoken at varied pitch and tempo, plus babble and
+bursts made of other syllables, so the numbers can be reproduced without
+recordings. They say the gate and matcher work; only real recordings
+say how well.
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np  # noqa: E402
+
+import voice  # noqa: E402
+import wakeword  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'wakeword')
+RATE = voice.SAMPLE_RATE
+FRAME_BYTES = voice.FRAME_SAMPLES * voice.SAMPLE_WIDTH
+
+
+def syllable(rng, ms, formants, pitch):
+    """A voiced syllable: harmonics of a falling f0 shaped by a formant gliding through ``formants``"""
+    n = int(RATE * ms / 1000)
+    t = np.linspace(0, 1, n)
+    f0 = pitch * (1.1 - 0.2 * t)
+    formant = np.interp(t, np.linspace(0, 1, len(formants)), formants)
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    wave = sum(np.exp(-((k * f0 - formant) / 250) ** 2) * np.sin(k * phase) for k in range(1, 40))
+    envelope = np.sin(np.pi * t) ** 0.5
+    return wave / np.abs(wave).max() * envelope * rng.uniform(5000, 9000)
+
+
+def phrase(rng):
+    tempo, pitch = rng.uniform(0.85, 1.15), rng.uniform(100, 220)
+    return np.concatenate([
+        syllable(rng, 220 * tempo, (500, 1900, 2200), pitch),       # "hey"
+        np.zeros(int(RATE * 0.05 * tempo)),
+        syllable(rng, 330 * tempo, (1800, 700, 350), pitch * 0.95),  # "elle"
+    ])
+
+
+def babble(rng, syllables):
+    parts = []
+    for _ in range(syllables):
+        formants = tuple(rng.uniform(300, 2500) for _ in range(rng.integers(2, 4)))
+        parts.append(syllable(rng, rng.uniform(120, 380), formants, rng.uniform(100, 220)))
+        parts.append(np.zeros(int(RATE * rng.uniform(0.03, 0.25))))
+    return np.concatenate(parts)
+
+
+def room(rng, seconds):
+    return rng.normal(0, 40, int(RATE * seconds))
+
+
+def save(path, samples):
+    voice.write_wav(path, np.clip(samples, -32768, 32767).astype('<i2').tobytes())
+
+
+def synthetic_fixtures(directory):
+    rng = np.random.default_rng(22)
+    for name in ('templates', 'positive', 'negative'):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    for index in range(3):
+        save(os.path.join(directory, 'templates', f'{index}.wav'), phrase(rng))
+    for index in range(20):
+        lead = babble(rng, rng.integers(1, 6)) if index % 2 else np.zeros(0)
+        clip = np.concatenate([lead, np.zeros(RATE // 2), phrase(rng), np.zeros(RATE // 2)])
+        save(os.path.join(directory, 'positive', f'{index}.wav'), clip + room(rng, len(clip) / RATE))
+    for index in range(10):
+        parts = []
+        while sum(map(len, parts)) < RATE * 60:
+            parts.append(babble(rng, rng.integers(1, 12)))
+            parts.append(np.zeros(int(RATE * rng.uniform(0.2, 3))))
+        clip = np.concatenate(parts)
+        save(os.path.join(directory, 'negative', f'{index}.wav'), clip + room(rng, len(clip) / RATE))
+    return directory
+
+
+def frames_of(path):
+    source = voice.WavSource(path, realtime=False, trailing_silence_ms=500)
+    source.open()
+    while (frame := source.read()) is not None:
+        yield frame
+
+
+def run(detector, frames):
+    """``[(trigger_ms, call_seconds, last_loud_ms)]`` for one stream"""
+    triggers, last_loud, elapsed = [], None, 0
+    for frame in frames:
+        elapsed += voice.FRAME_MS
+        if voice.rms(frame) >= wakeword.MIN_RMS:
+            last_loud = elapsed
+        started = time.perf_counter()
+        if detector.feed(frame):
+            triggers.append((elapsed, time.perf_counter() - started, last_loud))
+    return triggers
+
+
+def idle_frames(minutes):
+    rng = np.random.default_rng(0)
+    for _ in range(minutes):
+        pcm = room(rng, 60).astype('<i2').tobytes()
+        for offset in range(0, len(pcm) - FRAME_BYTES + 1, FRAME_BYTES):
+            yield pcm[offset:offset + FRAME_BYTES]
+
+
+def cpu_line(label, stats):
+    print(f"  {label:<10} {stats['audio_seconds'] / 60:7.1f} min audio  "
+          f"{stats['cpu_seconds_per_hour']:6.1f} CPU s/hour  ({stats['core_fraction']:.2%} of a core)  "
+          f"{stats['candidates']} model runs, {stats['avg_model_ms']:.1f} ms each")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--synthetic', action='store_true', help="generate stand-in fixtures")
+    parser.add_argument('--model', choices=('templates', 'vosk'), default='templates')
+    parser.add_argument('--idle-minutes', type=int, default=60)
+    args = parser.parse_args()
+
+    directory = synthetic_fixtures(tempfile.mkdtemp()) if args.synthetic else args.fixtures
+    positives = sorted(glob.glob(os.path.join(directory, 'positive', '*.wav')))
+    negatives = sorted(glob.glob(os.path.join(directory, 'negative', '*.wav')))
+    if not positives and not negatives:
+        sys.exit(f"No fixtures: record some WAVs into {directory} or pass --synthetic")
+
+    if args.model == 'vosk':
+        model = wakeword.VoskKeywordModel(RATE)
+    else:
+        model = wakeword.TemplateModel.from_directory(os.path.join(directory, 'templates'), RATE)
+        print(f"{len(model.templates)} templates, DTW threshold {model.threshold:.2f}")
+
+    def detector():
+        return wakeword.WakeWordDetector(model, RATE, voice.FRAME_MS)
+
+    print(f"\n{'positive':<20} {'latency':>9}")
+    latencies, hits, positive_stats = [], 0, detector().stats
+    for path in positives:
+        wake = detector()
+        triggers = run(wake, frames_of(path))
+        for name, value in wake.stats.__dict__.items():
+            setattr(positive_stats, name, getattr(positive_stats, name) + value)
+        if triggers:
+            hits += 1
+            at_ms, call, loud_ms = triggers[0]
+            latencies.append((at_ms - loud_ms) / 1000 + call)
+            print(f"{os.path.basename(path)[:20]:<20} {latencies[-1] * 1000:7.0f} ms")
+        else:
+            print(f"{os.path.basename(path)[:20]:<20} {'missed':>9}")
+
+    negative = detector()
+    false_triggers = sum(len(run(negative, frames_of(path))) for path in negatives)
+    idle = detector()
+    run(idle, idle_frames(args.idle_minutes))
+
+    print()
+    if positives:
+        latencies.sort()
+        print(f"detected {hits}/{len(positives)} positives"
+              + (f"; latency median {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+                 f"max {latencies[-1] * 1000:.0f} ms" if latencies else ''))
+    if negatives:
+        hours = negative.stats.audio_seconds / 3600
+        print(f"false triggers: {false_triggers} in {hours * 60:.1f} min of negatives "
+              f"({false_triggers / hours:.1f}/hour)")
+    print("cpu in the detector:")
+    if positives:
+        cpu_line('positive', positive_stats.as_dict())
+    if negatives:
+        cpu_line('negative', negative.stats.as_dict())
+    cpu_line('idle room', idle.stats.as_dict())
+    print(f"  ({os.cpu_count()} cores here; 'idle room' is the always-on cost)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""Persistent caches for expensive model calls.
+
+Cache entries live in their own SQLite file so clearing them never touches
+user data. Hit/miss counters are kept per process.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from PIL import Image
+
+import database
+
+CACHE_PATH = 'elle_cache.db'
+
+# Hits are counted in memory and written in batches, so lookups only read
+TOUCH_BATCH = 32
+TOUCH_FLUSH_SECONDS = 60.0
+
+_HASH_BITS = 64
+_SIGN_BIT = 1 << (_HASH_BITS - 1)
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << _HASH_BITS) if value & _SIGN_BIT else value
+
+
+def _to_unsigned(value):
+    return value & ((1 << _HASH_BITS) - 1)
+
+
+def content_hash(image):
+    """Exact hash of the decoded pixels, independent of the file encoding"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def perceptual_hash(image):
+    """64-bit difference hash; near-identical photos differ by a few bits"""
+    gray = image.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+
+class PendingTouches:
+    """Access times and hit counts waiting to be written.
+
+    ``add`` says when a batch is due; callers flush inside a write
+    transaction, and ``put`` flushes first so eviction sees current
+    access times.
+    """
+
+    def __init__(self, update_sql):
+        self.update_sql = update_sql  # parameters: accessed_at, hits, then the key columns
+        self._pending = {}
+        self._since = None
+        self._lock = threading.Lock()
+
+    def add(self, key, now):
+        """Record a hit on ``key`` (a tuple); True once a flush is due"""
+        with self._lock:
+            accessed, hits = self._pending.get(key, (now, 0))
+            self._pending[key] = (max(accessed, now), hits + 1)
+            if self._since is None:
+                self._since = now
+            return len(self._pending) >= TOUCH_BATCH or now - self._since >= TOUCH_FLUSH_SECONDS
+
+    def flush(self, conn):
+        with self._lock:
+            pending, self._pending, self._since = self._pending, {}, None
+        conn.executemany(self.update_sql, [(accessed, hits) + key for key, (accessed, hits) in pending.items()])
+
+
+class ImageAnalysisCache:
+    """Vision results keyed by image content, with near-duplicate matching.
+
+    A lookup first tries the exact content hash, then falls back to the
+    closest perceptual hash within ``max_distance`` bits, so re-uploads and
+    recompressed copies of the same meal photo are served locally.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=500, max_bytes=20 * 1024 * 1024,
+                 max_age_days=30, max_distance=4):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.max_distance = max_distance
+        self.stats = CacheStats()
+        self._touches = PendingTouches(
+            'UPDATE vision_cache SET accessed_at = MAX(accessed_at, ?), hits = hits + ? WHERE content_hash = ?')
+
+        with database.transaction(self.path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS vision_cache (
+                    content_hash TEXT PRIMARY KEY,
+                    phash INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_vision_cache_accessed ON vision_cache (accessed_at)')
+
+    def _touch(self, key):
+        if self._touches.add((key,), time.time()):
+            with database.transaction(self.path) as conn:
+                self._touches.flush(conn)
+
+    def get(self, image):
+        """Cached result for ``image`` or ``None``"""
+        exact = content_hash(image)
+        fresh_after = time.time() - self.max_age
+
+        with database.connection(self.path) as conn:
+            row = conn.execute('SELECT result FROM vision_cache WHERE content_hash = ? AND created_at >= ?',
+                               (exact, fresh_after)).fetchone()
+        if row:
+            self._touch(exact)
+            self.stats.add('hits')
+            return row[0]
+
+        target = perceptual_hash(image)
+        with database.connection(self.path) as conn:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, phash in conn.execute('SELECT content_hash, phash FROM vision_cache WHERE created_at >= ?',
+                                           (fresh_after,)):
+                distance = (_to_unsigned(phash) ^ target).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            near = best_key is not None and conn.execute('SELECT result FROM vision_cache WHERE content_hash = ?',
+                                                         (best_key,)).fetchone()
+
+        if near:
+            self._touch(best_key)
+            self.stats.add('near_hits')
+            return near[0]
+        self.stats.add('misses')
+        return None
+
+    def put(self, image, result):
+        """Store a result, then evict stale and least recently used entries"""
+        now = time.time()
+        with database.transaction(self.path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO vision_cache (content_hash, phash, result, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (content_hash(image), _to_signed(perceptual_hash(image)), result,
+                  len(result.encode()), now, now))
+            self._touches.flush(conn)
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        evicted = conn.execute('DELETE FROM vision_cache WHERE created_at < ?', (now - self.max_age,)).rowcount
+
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM vision_cache').fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Walk from least recently used until both limits hold
+            drop = []
+            for key, size in conn.execute('SELECT content_hash, size FROM vision_cache ORDER BY accessed_at'):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                drop.append((key,))
+                count -= 1
+                total -= size
+            conn.executemany('DELETE FROM vision_cache WHERE content_hash = ?', drop)
+            evicted += len(drop)
+
+        if evicted:
+            self.stats.add('evictions', evicted)
+
+    def clear(self):
+        with database.transaction(self.path) as conn:
+            conn.execute('DELETE FROM vision_cache')
+
+
+def _normalize(value):
+    """Canonical form for cache keys: case, spacing and dict order don't matter"""
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def normalized_key(*parts):
+    """Stable hash of the parameters that determine a generation"""
+    return hashlib.sha256(json.dumps(_normalize(list(parts)), sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Generated text keyed by namespace and normalized parameters.
+
+    Entries expire after ``max_age_days`` and the least recently used are
+    evicted once a namespace holds more than ``max_entries``.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=1000, max_age_days=14):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._touches = PendingTouches('''
+            UPDATE response_cache SET accessed_at = MAX(accessed_at, ?), hits = hits + ?
+            WHERE namespace = ? AND key = ?
+        ''')
+
+        with database.transaction(self.path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_response_cache_lru
+                ON response_cache (namespace, accessed_at)
+            ''')
+
+    def stats(self, namespace):
+        with self._stats_lock:
+            return self._stats.setdefault(namespace, CacheStats())
+
+    def get(self, namespace, key):
+        """Cached value or ``None``"""
+        now = time.time()
+        with database.connection(self.path) as conn:
+            row = conn.execute('''
+                SELECT value FROM response_cache
+                WHERE namespace = ? AND key = ? AND created_at >= ?
+            ''', (namespace, key, now - self.max_age)).fetchone()
+        if row and self._touches.add((namespace, key), now):
+            with database.transaction(self.path) as conn:
+                self._touches.flush(conn)
+
+        self.stats(namespace).add('hits' if row else 'misses')
+        return row[0] if row else None
+
+    def put(self, namespace, key, value):
+        now = time.time()
+        with database.transaction(self.path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO response_cache (namespace, key, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (namespace, key, value, now, now))
+            self._touches.flush(conn)
+
+            evicted = conn.execute('DELETE FROM response_cache WHERE created_at < ?',
+                                   (now - self.max_age,)).rowcount
+            evicted += conn.execute('''
+                DELETE FROM response_cache
+                WHERE namespace = ? AND key IN (
+                    SELECT key FROM response_cache WHERE namespace = ?
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (namespace, namespace, self.max_entries)).rowcount
+        if evicted:
+            self.stats(namespace).add('evictions', evicted)
+
+    def hit_rates(self):
+        """Per-namespace counters for this process"""
+        with self._stats_lock:
+            namespaces = list(self._stats)
+        return {namespace: self.stats(namespace).as_dict() for namespace in namespaces}
+
+
+_vision_cache = None
+_vision_cache_lock = threading.Lock()
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_vision_cache():
+    """Process-wide vision cache, shared by every session"""
+    global _vision_cache
+    with _vision_cache_lock:
+        if _vision_cache is None:
+            _vision_cache = ImageAnalysisCache()
+        return _vision_cache
+
+
+def get_response_cache():
+    """Process-wide cache for generated plans and recipes"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,155 @@
+"""Plotly figures for the analytics and health tabs, cached by data version.
+
+Building a figure with ``plotly.express`` costs tens of milliseconds, and
+Streamlit reruns the whole script on every widget change. Figures are
+kept per user under the data version they were built from, so a rerun
+with no new rows reuses them.
+
+Line and scatter traces render with WebGL (``Scattergl``), and daily
+series longer than ``MAX_POINTS`` are averaged into wider buckets before
+plotting, so multi-year ranges stay responsive.
+"""
+import threading
+from collections import OrderedDict
+
+import cache
+import startup
+
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+px = startup.lazy_import('plotly.express')
+go = startup.lazy_import('plotly.graph_objects')
+
+# A full-width chart is roughly 800 px, so this keeps about two pixels per
+# point (or bar): the 90-day and 1-year ranges plot every day, and 3 years
+# plots 3-day means
+MAX_POINTS = 400
+MAX_CACHED = 512
+
+PINK = "#FF6B9D"
+PURPLE = "#C44BFF"
+CORAL = "#FF9A8B"
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+_stats = cache.CacheStats()
+
+
+def cached(key, version, build):
+    """Figure for ``key`` built at ``version``; ``build()`` runs only when the data changed"""
+    with _figures_lock:
+        entry = _figures.get(key)
+        if entry is not None:
+            _figures.move_to_end(key)
+    if entry is not None and entry[0] == version:
+        _stats.add('hits')
+        return entry[1]
+
+    _stats.add('misses')
+    figure = build()
+    with _figures_lock:
+        _figures[key] = (version, figure)
+        while len(_figures) > MAX_CACHED:
+            _figures.popitem(last=False)
+            _stats.add('evictions')
+    return figure
+
+
+def stats():
+    """Process-wide hit/miss counters"""
+    return _stats.as_dict()
+
+
+def downsample(frame, max_points=MAX_POINTS):
+    """Bucket means of a day-indexed frame, at most ``max_points`` rows.
+
+    Each bucket is labelled with its first day; frames already short enough
+    come back unchanged.
+    """
+    if len(frame) <= max_points:
+        return frame
+    width = -(-len(frame) // max_points)
+    bucket = np.arange(len(frame)) // width
+    means = frame.groupby(bucket).mean()
+    means.index = frame.index[::width]
+    return means
+
+
+def workout_frequency(workouts_daily):
+    return px.line(workouts_daily, x='day', y='workout_count', render_mode='webgl',
+                   title="Daily Workout Frequency",
+                   labels={'day': 'date', 'workout_count': 'count'},
+                   color_discrete_sequence=[PINK])
+
+
+def exercise_mix(exercise_counts):
+    return px.pie(values=exercise_counts['count'], names=exercise_counts['exercise'],
+                  title="Exercise Type Distribution",
+                  color_discrete_sequence=px.colors.qualitative.Set3)
+
+
+def calorie_intake(nutrition_daily):
+    return px.bar(nutrition_daily, x='day', y='calories',
+                  title="Daily Calorie Intake",
+                  labels={'day': 'date'},
+                  color_discrete_sequence=[PURPLE])
+
+
+def macro_split(nutrition_daily):
+    macro_totals = {
+        'Protein': nutrition_daily['protein'].sum(),
+        'Carbs': nutrition_daily['carbs'].sum(),
+        'Fats': nutrition_daily['fats'].sum()
+    }
+    return px.pie(values=list(macro_totals.values()), names=list(macro_totals.keys()),
+                  title="Macronutrient Distribution (Total)",
+                  color_discrete_sequence=[CORAL, "#A8E6CF", "#FFD93D"])
+
+
+def training_load(trends, title):
+    load = downsample(trends[['acute_load', 'chronic_load']])
+    return px.line(load.reset_index(), x='day', y=['acute_load', 'chronic_load'], render_mode='webgl',
+                   title=title,
+                   labels={'day': 'date', 'value': 'minutes/day', 'variable': ''},
+                   color_discrete_sequence=[PINK, PURPLE])
+
+
+def calorie_balance(trends, title):
+    balance = downsample(trends[['calorie_balance', 'calorie_balance_7d']])
+    figure = px.bar(balance.reset_index(), x='day', y='calorie_balance',
+                    title=title,
+                    labels={'day': 'date', 'calorie_balance': 'calories'},
+                    color_discrete_sequence=[CORAL])
+    figure.add_trace(go.Scattergl(x=balance.index, y=balance['calorie_balance_7d'], mode='lines',
+                                  name='7-day average', line_color=PURPLE))
+    return figure
+
+
+def correlation_heatmap(matrix, title):
+    return px.imshow(matrix, text_auto='.2f', zmin=-1, zmax=1,
+                     color_continuous_scale="RdBu", title=title)
+
+
+def weight(health_daily, trends):
+    figure = px.line(health_daily, x='day', y='weight', labels={'day': 'date'}, render_mode='webgl',
+                     title="Weight Trend (30 days)",
+                     color_discrete_sequence=[PINK])
+    # Smoothed trend; daily weigh-ins swing with water and food
+    recent = trends.iloc[-30:]
+    figure.add_trace(go.Scattergl(x=recent.index.strftime('%Y-%m-%d'), y=recent['weight_trend'], mode='lines',
+                                  name='Smoothed trend', line_color=PURPLE))
+    return figure
+
+
+def sleep_energy(health_daily):
+    return px.scatter(health_daily, x='sleep_hours', y='energy_level', render_mode='webgl',
+                      title="Sleep vs Energy Correlation",
+                      color_discrete_sequence=[PURPLE])
+
+
+def sample_channel(times, values, title):
+    """A per-second sensor channel against minutes since the start"""
+    minutes = (times - times[0]).astype('float64') / 60
+    return px.line(x=minutes, y=values, title=title, render_mode='webgl',
+                   labels={'x': 'minutes', 'y': ''},
+                   color_discrete_sequence=[PINK])
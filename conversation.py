@@ -0,0 +1,135 @@
+"""Persistent AI Coach conversation with a bounded prompt.
+
+Every message is stored with its token count. Once the turns not yet
+covered by the summary grow past ``SUMMARIZE_AT`` tokens, the oldest of
+them are folded into a rolling summary, keeping roughly the last
+``KEEP_RECENT_TOKENS`` verbatim. A prompt is the summary plus as many
+recent turns as fit in ``PROMPT_BUDGET``, so its size stays flat however
+long the conversation runs.
+
+Token counts use tiktoken when it is installed and ~4 characters per
+token otherwise.
+"""
+import versions
+
+PROMPT_BUDGET = 2000
+SUMMARIZE_AT = 1500
+KEEP_RECENT_TOKENS = 600
+SUMMARY_TOKENS = 250
+PAGE_SIZE = 20
+
+MESSAGE_OVERHEAD = 4  # role and separators, per chat message
+CHARS_PER_TOKEN = 4
+ENCODING = 'cl100k_base'
+
+_tiktoken_encoding = None
+
+
+def _encoding():
+    """tiktoken encoding, or ``None`` when tiktoken isn't installed"""
+    global _tiktoken_encoding
+    if _tiktoken_encoding is None:
+        try:
+            import tiktoken
+            _tiktoken_encoding = tiktoken.get_encoding(ENCODING)
+        except ImportError:  # fall back to the character estimate
+            _tiktoken_encoding = False
+    return _tiktoken_encoding or None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text)) + MESSAGE_OVERHEAD
+    return len(text) // CHARS_PER_TOKEN + 1 + MESSAGE_OVERHEAD
+
+
+def add(conn, user_id, role, content, ts):
+    """Store one message; returns its id"""
+    message_id = conn.execute('''
+        INSERT INTO chat_messages (user_id, ts, role, content, tokens) VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, ts, role, content, count_tokens(content))).lastrowid
+    versions.bump(conn, user_id, 'chat_messages')
+    return message_id
+
+
+def recent(conn, user_id, limit=PAGE_SIZE):
+    """``(messages, more)``: the newest ``limit`` messages oldest first, and whether older ones exist"""
+    rows = conn.execute('''
+        SELECT role, content FROM chat_messages
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (user_id, limit + 1)).fetchall()
+    return [{'role': role, 'content': content} for role, content in reversed(rows[:limit])], len(rows) > limit
+
+
+def summary(conn, user_id):
+    """``(summary, through_id)``; ``('', 0)`` before the first summary"""
+    row = conn.execute('SELECT summary, through_id FROM chat_summaries WHERE user_id = ?',
+                       (user_id,)).fetchone()
+    return row if row else ('', 0)
+
+
+def prompt_messages(conn, user_id, budget=PROMPT_BUDGET):
+    """Summary plus the newest unsummarized turns, within ``budget`` tokens"""
+    text, through_id = summary(conn, user_id)
+    messages = []
+    used = count_tokens(text) if text else 0
+    for role, content, tokens in conn.execute('''
+        SELECT role, content, tokens FROM chat_messages
+        WHERE user_id = ? AND id > ?
+        ORDER BY id DESC
+    ''', (user_id, through_id)):
+        if used + tokens > budget:
+            if not messages:
+                # The newest message always goes, cut down to what fits
+                messages.append({'role': role, 'content': content[:max(budget - used, 0) * CHARS_PER_TOKEN]})
+            break
+        messages.append({'role': role, 'content': content})
+        used += tokens
+    messages.reverse()
+    if text:
+        messages.insert(0, {'role': 'system', 'content': f"Summary of the conversation so far: {text}"})
+    return messages
+
+
+def to_summarize(conn, user_id, trigger=SUMMARIZE_AT, keep=KEEP_RECENT_TOKENS):
+    """``(summary, [(id, role, content), ...])`` due for folding, or ``(summary, [])``.
+
+    Nothing is due until the unsummarized turns pass ``trigger`` tokens;
+    then everything but the newest ``keep`` tokens is.
+    """
+    text, through_id = summary(conn, user_id)
+    rows = conn.execute('''
+        SELECT id, role, content, tokens FROM chat_messages
+        WHERE user_id = ? AND id > ?
+        ORDER BY id
+    ''', (user_id, through_id)).fetchall()
+    total = sum(row[3] for row in rows)
+    if total <= trigger:
+        return text, []
+
+    due = []
+    for message_id, role, content, tokens in rows:
+        if total <= keep:
+            break
+        due.append((message_id, role, content))
+        total -= tokens
+    return text, due
+
+
+def save_summary(conn, user_id, text, through_id):
+    """Replace the rolling summary; it now covers messages up to ``through_id``"""
+    conn.execute('''
+        INSERT INTO chat_summaries (user_id, summary, tokens, through_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            summary = excluded.summary, tokens = excluded.tokens, through_id = excluded.through_id
+    ''', (user_id, text, count_tokens(text), through_id))
+
+
+def clear(conn, user_id):
+    """Forget the user's conversation"""
+    conn.execute('DELETE FROM chat_messages WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM chat_summaries WHERE user_id = ?', (user_id,))
+    versions.bump(conn, user_id, 'chat_messages')
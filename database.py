@@ -0,0 +1,188 @@
+"""Shared SQLite connection layer for Elle.
+
+Streamlit re-executes app.py on every rerun, but imported modules stay cached
+in ``sys.modules`` - so the pool below lives for the whole process and its
+connections (and their compiled statement caches) are reused across reruns
+and sessions instead of being reopened on every query.
+"""
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DB_PATH = 'elle_complete.db'
+SHARD_DIR = 'user_data'
+
+# Open pools kept at once; the least recently used is closed beyond this
+MAX_OPEN_POOLS = 64
+POOL_SIZE = 8
+SHARD_POOL_SIZE = 2  # a single user rarely has more than a couple of tabs open
+
+# Applied once to every new connection
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',        # readers never block the writer
+    'PRAGMA synchronous=NORMAL',      # safe with WAL, one fsync per checkpoint
+    'PRAGMA busy_timeout=5000',       # wait on the write lock instead of failing
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-8000',        # ~8 MB page cache per connection
+    'PRAGMA mmap_size=134217728',     # 128 MB memory-mapped reads
+    'PRAGMA foreign_keys=ON',
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection frees up in time"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections"""
+
+    def __init__(self, path=DB_PATH, max_size=8, timeout=10.0, cached_statements=256):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+
+    def _connect(self):
+        # isolation_level=None puts the connection in autocommit mode; writes
+        # open their own transaction through ``transaction()`` below.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if there is room"""
+        if self._closed:
+            # Evicted while a caller still held it; serve a one-off connection
+            # that release() closes
+            return self._connect()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self.max_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a ``with`` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection inside a write transaction.
+
+        ``BEGIN IMMEDIATE`` takes the write lock up front, so concurrent
+        sessions queue on ``busy_timeout`` rather than failing mid-transaction
+        with "database is locked" when a read lock has to be upgraded.
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def stats(self):
+        """Pool occupancy, for diagnostics"""
+        with self._lock:
+            opened = len(self._connections)
+        return {'open': opened, 'idle': self._idle.qsize(), 'max_size': self.max_size}
+
+    def close(self):
+        """Close every connection; connections still checked out close on release"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+_shard_per_user = False
+
+
+def get_pool(path=DB_PATH):
+    """Process-wide pool for a database file.
+
+    With one file per user the number of files is unbounded, so pools are
+    kept in LRU order and the coldest is closed once ``MAX_OPEN_POOLS`` are
+    open. Connections it still has checked out close when released.
+    """
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            size = SHARD_POOL_SIZE if os.path.dirname(path) == SHARD_DIR else POOL_SIZE
+            pool = _pools[path] = ConnectionPool(path, max_size=size)
+            while len(_pools) > MAX_OPEN_POOLS:
+                _, evicted = _pools.popitem(last=False)
+                evicted.close()
+        else:
+            _pools.move_to_end(path)
+        return pool
+
+
+def configure(shard_per_user=False):
+    """Choose between one shared database and one database file per user"""
+    global _shard_per_user
+    _shard_per_user = shard_per_user
+
+
+def path_for_user(user_id):
+    """Database file holding ``user_id``'s data"""
+    if not _shard_per_user:
+        return DB_PATH
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    # Hashed so any identity (emails, URLs) maps to a safe file name
+    return os.path.join(SHARD_DIR, hashlib.sha256(user_id.encode()).hexdigest()[:32] + '.db')
+
+
+def connection(path=DB_PATH):
+    """Context manager yielding a pooled connection for reads"""
+    return get_pool(path).connection()
+
+
+def transaction(path=DB_PATH):
+    """Context manager yielding a pooled connection inside a write transaction"""
+    return get_pool(path).transaction()
@@ -0,0 +1,187 @@
+"""Compact statistical digest of recent history, for coaching prompts.
+
+The digest is plain text built from the analytics frame: logging adherence,
+this week against last, weekly aggregates, anomalous days and notable
+correlations, in that priority order. Lower-priority lines are dropped to
+keep it under a token budget.
+
+Built digests are cached per user under the change counters of the source
+tables, so they are rebuilt only after new rows arrive.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import analytics
+import cache
+import schema
+import startup
+import versions
+
+np = startup.lazy_import('numpy')
+
+DIGEST_DAYS = 28
+DIGEST_TOKENS = 400
+CHARS_PER_TOKEN = 4  # same rough ratio the gateway budgets with
+
+ANOMALY_Z = 2.0
+ANOMALY_LIMIT = 5
+ANOMALY_COLUMNS = {
+    'sleep_hours': ('sleep', '.1f', ' h'),
+    'resting_heart_rate': ('resting HR', '.0f', ' bpm'),
+    'energy_level': ('energy', '.0f', '/10'),
+    'stress_level': ('stress', '.0f', '/10'),
+    'calories_in': ('calories in', '.0f', ' kcal'),
+}
+NOTABLE_CORRELATION = 0.3
+
+MAX_CACHED = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = cache.CacheStats()
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _fmt(value, spec='.0f', unit=''):
+    if value is None or value != value:
+        return '—'
+    return f'{value:{spec}}{unit}'
+
+
+def _delta(now, before, spec='+.0f', unit=''):
+    if now != now or before != before:
+        return '—'
+    return f'{now - before:{spec}}{unit}'
+
+
+def _adherence(frame):
+    days = len(frame)
+    meal_days = int((frame['meal_count'] > 0).sum())
+    meals_per_day = frame['meal_count'].sum() / meal_days if meal_days else 0
+    return ["Adherence:",
+            f"- workouts on {int((frame['workout_count'] > 0).sum())}/{days} days "
+            f"({int(frame['workout_count'].sum())} sessions, {frame['minutes'].sum():.0f} min)",
+            f"- meals logged on {meal_days}/{days} days ({meals_per_day:.1f} per logged day)",
+            f"- health check-ins on {int(frame['entries'].notna().sum())}/{days} days"]
+
+
+def _weeks(frame):
+    """Per-week aggregates, most recent week first"""
+    week = (len(frame) - 1 - np.arange(len(frame))) // 7
+    return frame.groupby(week).agg(
+        start=('workout_count', lambda s: s.index.min()),
+        workouts=('workout_count', 'sum'),
+        minutes=('minutes', 'sum'),
+        calories_in=('calories_in', 'mean'),
+        sleep=('sleep_hours', 'mean'),
+        energy=('energy_level', 'mean'),
+        weight=('weight_trend', 'last'),
+    )
+
+
+def _this_week(frame, weeks):
+    latest = frame.iloc[-1]
+    lines = ["This week vs last:"]
+    if len(weeks) >= 2:
+        now, before = weeks.iloc[0], weeks.iloc[1]
+        lines += [f"- training: {now['minutes']:.0f} min ({_delta(now['minutes'], before['minutes'], unit=' min')}), "
+                  f"{now['workouts']:.0f} sessions ({_delta(now['workouts'], before['workouts'])})",
+                  f"- calories in/day: {_fmt(now['calories_in'])} ({_delta(now['calories_in'], before['calories_in'])})",
+                  f"- sleep: {_fmt(now['sleep'], '.1f', ' h')} ({_delta(now['sleep'], before['sleep'], '+.1f', ' h')}), "
+                  f"energy: {_fmt(now['energy'], '.1f')} ({_delta(now['energy'], before['energy'], '+.1f')})"]
+    lines += [f"- acute:chronic load {_fmt(latest['acwr'], '.2f')} ({analytics.acwr_zone(latest['acwr'])})",
+              f"- weight trend {_fmt(latest['weight_trend'], '.1f')}, "
+              f"7-day change {_fmt(latest['weight_change_7d'], '+.1f')}",
+              f"- calorie balance 7-day avg {_fmt(latest['calorie_balance_7d'], '+.0f', ' kcal/day')}"]
+    return lines
+
+
+def _weekly(weeks):
+    lines = ["Weekly (newest first):"]
+    for _, week in weeks.iterrows():
+        lines.append(f"- from {week['start']:%b %d}: {week['workouts']:.0f} workouts, {week['minutes']:.0f} min, "
+                     f"{_fmt(week['calories_in'])} kcal in/day, sleep {_fmt(week['sleep'], '.1f', ' h')}, "
+                     f"energy {_fmt(week['energy'], '.1f')}, weight {_fmt(week['weight'], '.1f')}")
+    return lines
+
+
+def _anomalies(frame):
+    """Days more than ``ANOMALY_Z`` standard deviations from the period mean, newest first"""
+    found = []
+    for column, (label, spec, unit) in ANOMALY_COLUMNS.items():
+        values = frame[column]
+        if values.count() < analytics.MIN_CORRELATION_DAYS or not values.std() > 0:
+            continue
+        mean = values.mean()
+        z = (values - mean) / values.std()
+        for day, value in values[z.abs() >= ANOMALY_Z].items():
+            found.append((day, f"- {day:%b %d}: {label} {value:{spec}}{unit} (usual {mean:{spec}})"))
+    found.sort(key=lambda item: item[0], reverse=True)
+    return ["Unusual days:"] + [line for _, line in found[:ANOMALY_LIMIT]] if found else []
+
+
+def _correlations(frame):
+    matrix = analytics.correlations(frame)
+    pairs = [(matrix.iat[i, j], matrix.index[i], matrix.columns[j])
+             for i in range(len(matrix)) for j in range(i + 1, len(matrix))]
+    pairs = sorted((p for p in pairs if abs(p[0]) >= NOTABLE_CORRELATION), key=lambda p: -abs(p[0]))
+    if not pairs:
+        return []
+    return ["Day-to-day correlations:"] + [f"- {x} vs {y}: r={r:+.2f}" for r, x, y in pairs]
+
+
+def build(conn, user_id, days=DIGEST_DAYS, baseline_burn=0.0, budget=DIGEST_TOKENS):
+    """Digest text of the last ``days`` days, at most about ``budget`` tokens"""
+    frame = analytics.summarize(conn, user_id, days, baseline_burn)
+    if not (frame['workout_count'].any() or frame['meal_count'].any() or frame['entries'].notna().any()):
+        return f"No workouts, meals or health check-ins logged in the last {days} days."
+
+    weeks = _weeks(frame)
+    sections = [_adherence(frame), _this_week(frame, weeks), _weekly(weeks),
+                _anomalies(frame), _correlations(frame)]
+
+    lines = [f"Last {days} days ({frame.index[0]:%b %d} - {frame.index[-1]:%b %d}):"]
+    used = estimate_tokens(lines[0])
+    for section in sections:
+        # A heading is only worth its tokens with at least one line under it
+        if not section or used + estimate_tokens('\n'.join(section[:2])) > budget:
+            continue
+        for line in section:
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+    return '\n'.join(lines)
+
+
+def get(conn, user_id, days=DIGEST_DAYS, baseline_burn=0.0, budget=DIGEST_TOKENS):
+    """Cached ``build``; rebuilt only when the user's source tables have changed"""
+    # The window slides at midnight even when nothing new is logged
+    key = (user_id, date.today(), days, round(baseline_burn), budget)
+    version = versions.current(conn, user_id, schema.TIMESERIES_TABLES)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is not None and entry[0] == version:
+        _stats.add('hits')
+        return entry[1]
+
+    _stats.add('misses')
+    text = build(conn, user_id, days, baseline_burn, budget)
+    with _cache_lock:
+        _cache[key] = (version, text)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+            _stats.add('evictions')
+    return text
+
+
+def stats():
+    """Process-wide hit/miss counters"""
+    return _stats.as_dict()
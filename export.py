@@ -0,0 +1,174 @@
+"""Streaming export of a user's data as a zip archive.
+
+Rows are read in keyset-paginated chunks (``id > last_id``) and written
+straight into the archive, which is built in a temporary file, so memory
+use depends on ``CHUNK_SIZE`` rather than on how much history is exported.
+
+Per-second workout samples are stored compressed; they are exported
+decoded, one row per sample (``workout_id, channel, ts, value``).
+"""
+import csv
+import io
+import json
+import tempfile
+import zipfile
+from datetime import datetime
+
+import samples
+import schema
+
+CHUNK_SIZE = 5000
+
+EXPORT_TABLES = ('workouts', 'nutrition', 'health_metrics', 'goals', 'challenges', 'user_profile',
+                 'chat_messages')
+
+SAMPLES_TABLE = 'workout_samples'
+SAMPLE_COLUMNS = [('workout_id', 'INTEGER'), ('channel', 'TEXT'), ('ts', 'INTEGER'), ('value', 'REAL')]
+
+CSV = 'csv'
+PARQUET = 'parquet'
+
+# SQLite declared type -> Arrow type name, for a schema that holds across chunks.
+# Type affinity lets an INTEGER column store a REAL, so those are checked first.
+_ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+_pyarrow_modules = None
+
+
+def _pyarrow():
+    """``(pyarrow, pyarrow.parquet)`` or ``None`` when pyarrow isn't installed"""
+    global _pyarrow_modules
+    if _pyarrow_modules is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            _pyarrow_modules = (pyarrow, pyarrow.parquet)
+        except ImportError:
+            _pyarrow_modules = False
+    return _pyarrow_modules or None
+
+
+def formats():
+    """Export formats available in this environment"""
+    return (CSV, PARQUET) if _pyarrow() else (CSV,)
+
+
+def table_columns(conn, table):
+    """``[(name, declared_type), ...]`` in table order"""
+    return [(row[1], row[2].upper()) for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def iter_chunks(conn, table, user_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of at most ``chunk_size`` rows for ``user_id``, in id order"""
+    last_id = 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT * FROM {table}
+            WHERE user_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (user_id, last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        # id is the first column of every table
+        last_id = rows[-1][0]
+
+
+def iter_sample_chunks(conn, user_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of decoded ``(workout_id, channel, ts, value)`` rows, about ``chunk_size`` at a time"""
+    chunk = []
+    for workout_id, channel, times, values in samples.iter_samples(conn, user_id):
+        chunk.extend(zip([workout_id] * len(times), [channel] * len(times), times.tolist(), values.tolist()))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _chunks(conn, table, user_id):
+    if table == SAMPLES_TABLE:
+        return iter_sample_chunks(conn, user_id)
+    return iter_chunks(conn, table, user_id)
+
+
+def _write_csv(archive, conn, table, user_id, columns):
+    count = 0
+    with archive.open(f'{table}.csv', 'w') as member:
+        text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+        out = csv.writer(text)
+        out.writerow(name for name, _ in columns)
+        for rows in _chunks(conn, table, user_id):
+            out.writerows(rows)
+            count += len(rows)
+        text.flush()
+        text.detach()
+    return count
+
+
+def _real_columns(conn, table, user_id, columns):
+    """INTEGER columns holding at least one REAL value for ``user_id``"""
+    integers = [name for name, kind in columns if kind == 'INTEGER']
+    if table == SAMPLES_TABLE or not integers:
+        return set()
+    checks = ', '.join(f"MAX(typeof({name}) = 'real')" for name in integers)
+    found = conn.execute(f'SELECT {checks} FROM {table} WHERE user_id = ?', (user_id,)).fetchone()
+    return {name for name, real in zip(integers, found) if real}
+
+
+def _write_parquet(archive, conn, table, user_id, columns):
+    pa, pq = _pyarrow()
+    # Checked in the export's snapshot, so no chunk can disagree; int64 would truncate 61.5 to 61
+    reals = _real_columns(conn, table, user_id, columns)
+    arrow_schema = pa.schema([(name, 'float64' if name in reals else _ARROW_TYPES.get(kind, 'string'))
+                              for name, kind in columns])
+    count = 0
+    # Parquet needs a seekable sink, so each table goes through its own temp file
+    with tempfile.TemporaryFile() as spool:
+        with pq.ParquetWriter(spool, arrow_schema, compression='zstd') as parquet:
+            for rows in _chunks(conn, table, user_id):
+                parquet.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*rows), arrow_schema)],
+                    schema=arrow_schema,
+                ))
+                count += len(rows)
+        spool.seek(0)
+        with archive.open(f'{table}.parquet', 'w') as member:
+            while block := spool.read(1 << 20):
+                member.write(block)
+    return count
+
+
+def write_archive(conn, user_id, fmt=CSV):
+    """Build the export zip and return it as an open temporary file at offset 0.
+
+    The file is deleted when closed.
+    """
+    if fmt not in formats():
+        raise ValueError(f"Export format {fmt!r} isn't available")
+    write_table = _write_parquet if fmt == PARQUET else _write_csv
+
+    output = tempfile.TemporaryFile()
+    # One read transaction, so every table comes from the same snapshot
+    conn.execute('BEGIN')
+    try:
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            counts = {}
+            for table in EXPORT_TABLES:
+                counts[table] = write_table(archive, conn, table, user_id, table_columns(conn, table))
+            counts[SAMPLES_TABLE] = write_table(archive, conn, SAMPLES_TABLE, user_id, SAMPLE_COLUMNS)
+            archive.writestr('manifest.json', json.dumps({
+                'exported_at': datetime.now().isoformat(),
+                'user_id': user_id,
+                'format': fmt,
+                'schema_version': len(schema.MIGRATIONS),
+                'rows': counts,
+            }, indent=2))
+    except BaseException:
+        output.close()
+        raise
+    finally:
+        conn.rollback()
+    output.seek(0)
+    return output
@@ -0,0 +1,387 @@
+"""Local food-composition lookups, so most meals log without a model call.
+
+``data/foods.csv`` holds nutrients per 100 g for common foods (USDA
+FoodData Central values, rounded) and ``data/food_portions.csv`` the gram
+weight of their household units; the first unit listed for a food is its
+default serving. Both load once per process into an in-memory index:
+food names and aliases are tokenized and stemmed, and each token maps to
+the names containing it. A sorted token list gives prefix matches for
+search-as-you-type, and misspelled words fall back to the closest known
+token. Lookups of known words take microseconds.
+
+``parse_meal`` turns "half a dozen eggs, a slice of toast and 1 cup oat
+milk" into portions with nutrients; ``cross_check`` recomputes a photo analysis
+from its ``food_items`` and replaces the model's totals when they are
+far off.
+"""
+import bisect
+import csv
+import difflib
+import os
+import re
+import threading
+from functools import lru_cache
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats', 'fiber', 'sugar', 'sodium')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+FOODS_PATH = os.path.join(DATA_DIR, 'foods.csv')
+PORTIONS_PATH = os.path.join(DATA_DIR, 'food_portions.csv')
+
+MIN_SCORE = 0.5             # share of name and query words that must match
+DISH_SCORE = 1.0            # "mac and cheese" is one food only if every word matches one name
+FUZZY_CUTOFF = 0.8          # difflib ratio for a misspelled word
+CROSS_CHECK_TOLERANCE = 0.25
+
+# Generic units; food-specific ones in food_portions.csv take precedence
+GRAMS = {'g': 1.0, 'kg': 1000.0, 'oz': 28.35, 'lb': 453.6}
+MILLILITERS = {'ml': 1.0, 'l': 1000.0, 'cup': 240.0, 'tbsp': 15.0, 'tsp': 5.0, 'floz': 29.57,
+               'glass': 240.0, 'mug': 240.0, 'pint': 473.0}
+SIZES = {'small': 0.75, 'medium': 1.0, 'large': 1.3}
+
+UNIT_ALIASES = {
+    'g': 'g', 'gr': 'g', 'gram': 'g', 'grams': 'g', 'kg': 'kg', 'kilo': 'kg', 'kilos': 'kg',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz', 'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'ml': 'ml', 'milliliter': 'ml', 'milliliters': 'ml', 'millilitre': 'ml', 'millilitres': 'ml',
+    'l': 'l', 'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l',
+    'cup': 'cup', 'cups': 'cup', 'tbsp': 'tbsp', 'tbs': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp', 'floz': 'floz',
+    'piece': 'each', 'pieces': 'each', 'whole': 'each', 'each': 'each',
+    'serving': 'serving', 'servings': 'serving', 'portion': 'serving', 'portions': 'serving',
+    'slice': 'slice', 'slices': 'slice', 'fillet': 'fillet', 'fillets': 'fillet',
+    'scoop': 'scoop', 'scoops': 'scoop', 'can': 'can', 'cans': 'can', 'bar': 'bar', 'bars': 'bar',
+    'glass': 'glass', 'glasses': 'glass', 'bowl': 'bowl', 'bowls': 'bowl', 'plate': 'plate', 'plates': 'plate',
+    'handful': 'handful', 'handfuls': 'handful', 'container': 'container', 'containers': 'container',
+    'bottle': 'bottle', 'bottles': 'bottle', 'pint': 'pint', 'pints': 'pint', 'mug': 'mug', 'mugs': 'mug',
+    'stalk': 'stalk', 'stalks': 'stalk', 'spear': 'spear', 'spears': 'spear', 'ear': 'ear', 'ears': 'ear',
+    'wedge': 'wedge', 'wedges': 'wedge', 'square': 'square', 'squares': 'square', 'pat': 'pat', 'pats': 'pat',
+    'box': 'box', 'boxes': 'box', 'bag': 'bag', 'bags': 'bag',
+    'small': 'small', 'medium': 'medium', 'large': 'large', 'big': 'large',
+    'tall': 'tall', 'grande': 'grande',
+}
+NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+                'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'half': 0.5, 'couple': 2, 'dozen': 12}
+FRACTIONS = {'½': ' 1/2', '⅓': ' 1/3', '¼': ' 1/4', '¾': ' 3/4', '⅔': ' 2/3'}
+FILLER = {'about', 'approx', 'approximately', 'around', 'roughly', 'some', 'of', 'the', 'x', 'estimated'}
+# Preparation words that don't change which food it is
+IGNORED_WORDS = FILLER | {'a', 'an', 'and', 'with', 'fresh', 'grilled', 'baked', 'roasted', 'steamed',
+                          'boiled', 'raw', 'cooked', 'plain', 'homemade', 'sliced', 'chopped', 'diced',
+                          'organic', 'small', 'medium', 'large', 'serving', 'portion', 'cup', 'cups'}
+
+_SPLIT = re.compile(r'[,;\n+]')
+_CONJUNCTION = re.compile(r'(&|\band\b|\bwith\b)')
+_QUANTITY = r'(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)'
+_LEADING = re.compile(rf'^{_QUANTITY}\s*(.*)$')
+_TRAILING = re.compile(rf'^(.*?)\s*{_QUANTITY}\s*([a-z]+)$')
+_PARENS = re.compile(r'\(([^)]*)\)')
+
+
+def _stem(word):
+    # Just enough to make plurals meet their singular
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes', 'sses')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+def _tokens(text):
+    return tuple(_stem(word) for word in re.findall(r"[a-z]+", text.lower()) if word not in IGNORED_WORDS)
+
+
+def _number(text):
+    text = text.strip()
+    if ' ' in text:
+        whole, fraction = text.split()
+        return float(whole) + _number(fraction)
+    if '/' in text:
+        numerator, denominator = text.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else 0.0
+    return float(text)
+
+
+class Food:
+    """One row of the food table, with its household units"""
+
+    __slots__ = ('name', 'per_100g', 'portions', 'default_unit')
+
+    def __init__(self, name, per_100g):
+        self.name = name
+        self.per_100g = per_100g
+        self.portions = {}
+        self.default_unit = None
+
+    def add_portion(self, unit, grams):
+        self.portions[unit] = grams
+        if self.default_unit is None:
+            self.default_unit = unit
+
+    def grams(self, quantity, unit=None):
+        """``(grams, assumed)``; ``assumed`` when the unit didn't apply and a serving was used"""
+        if unit is None and 'each' in self.portions:
+            unit = 'each'  # "3 strawberries" counts berries, not servings
+        if unit in self.portions:
+            return quantity * self.portions[unit], False
+        if unit in GRAMS:
+            return quantity * GRAMS[unit], False
+        if unit in MILLILITERS:
+            return quantity * MILLILITERS[unit] * self.grams_per_ml(), False
+        if unit in SIZES:
+            for base in ('medium', 'each'):
+                if base in self.portions:
+                    return quantity * self.portions[base] * SIZES[unit], False
+        serving = self.portions.get(self.default_unit, 100.0)
+        return quantity * serving, unit not in (None, 'each', 'serving')
+
+    def grams_per_ml(self):
+        for unit, grams in self.portions.items():
+            if unit in MILLILITERS:
+                return grams / MILLILITERS[unit]
+        return 1.0
+
+    def nutrients(self, grams):
+        return {name: round(self.per_100g[name] * grams / 100, 1) for name in NUTRIENTS}
+
+
+class MealItem:
+    """A parsed line of a meal: what it matched, how much, and its nutrients"""
+
+    __slots__ = ('text', 'food', 'quantity', 'unit', 'grams', 'assumed', 'explicit', 'nutrients')
+
+    def __init__(self, text, food, quantity, unit, explicit):
+        self.text = text
+        self.food = food
+        self.quantity = quantity
+        self.unit = unit
+        self.explicit = explicit  # the amount was stated rather than defaulted
+        self.grams, self.assumed = food.grams(quantity, unit)
+        self.nutrients = food.nutrients(self.grams)
+
+    def describe(self):
+        if self.unit == 'g':
+            return f"{self.grams:.0f} g {self.food.name}"
+        unit = f" {self.unit}" if self.unit and self.unit not in ('each', 'serving') else ''
+        return f"{self.quantity:g}{unit} {self.food.name} ({self.grams:.0f} g)"
+
+
+class FoodIndex:
+    """Token and prefix index over food names and aliases"""
+
+    def __init__(self, foods, names):
+        self.foods = foods
+        self._entries = []   # (food position, tokens) per name and alias
+        self._postings = {}
+        for position, food_names in enumerate(names):
+            for name in food_names:
+                tokens = _tokens(name)
+                if not tokens:
+                    continue
+                for token in set(tokens):
+                    self._postings.setdefault(token, []).append(len(self._entries))
+                self._entries.append((position, tokens))
+        self._vocabulary = sorted(self._postings)
+
+    @classmethod
+    def from_csv(cls, foods_path=FOODS_PATH, portions_path=PORTIONS_PATH):
+        foods, names, by_name = [], [], {}
+        with open(foods_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                food = Food(row['name'], {name: float(row[name] or 0) for name in NUTRIENTS})
+                by_name[food.name] = food
+                foods.append(food)
+                names.append([food.name] + [alias for alias in row['aliases'].split('|') if alias])
+        with open(portions_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                by_name[row['food']].add_portion(row['unit'], float(row['grams']))
+        return cls(foods, names)
+
+    def _known(self, token):
+        if token in self._postings:
+            return token
+        return _closest(token, tuple(self._vocabulary))
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_right(self._vocabulary, prefix + '￿')
+        return self._vocabulary[start:end]
+
+    def search(self, query, limit=5, prefix=False, min_score=MIN_SCORE):
+        """``[(score, food), ...]`` best first; with ``prefix`` the last word may be unfinished"""
+        words = _tokens(query)
+        if not words:
+            return []
+        alternatives = [{self._known(word)} - {None} for word in words]
+        if prefix:
+            alternatives[-1] |= set(self._prefixed(words[-1]))
+
+        best = {}
+        for position, tokens in self._candidates(alternatives):
+            matched = sum(1 for options in alternatives if options & set(tokens))
+            score = (matched / len(tokens) + matched / len(words)) / 2
+            if score > best.get(position, 0):
+                best[position] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, self.foods[position]) for position, score in ranked[:limit] if score >= min_score]
+
+    def _candidates(self, alternatives):
+        seen = set()
+        for options in alternatives:
+            for token in options:
+                for entry in self._postings.get(token, ()):
+                    if entry not in seen:
+                        seen.add(entry)
+                        yield self._entries[entry]
+
+    def lookup(self, query, min_score=MIN_SCORE):
+        """Best matching food, or ``None``"""
+        matches = self.search(query, limit=1, min_score=min_score)
+        return matches[0][1] if matches else None
+
+
+@lru_cache(maxsize=1024)
+def _closest(token, vocabulary):
+    matches = difflib.get_close_matches(token, vocabulary, n=1, cutoff=FUZZY_CUTOFF)
+    return matches[0] if matches else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide index over the bundled tables"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FoodIndex.from_csv()
+        return _index
+
+
+def _amount(text):
+    """``(quantity, unit, rest)``; quantity ``None`` when the text doesn't state one.
+
+    Number words multiply into what precedes them: "half a dozen eggs" is
+    6 eggs, "2 dozen" 24, "a couple of" 2.
+    """
+    text = text.strip()
+    quantity = None
+    match = _LEADING.match(text)
+    if match:
+        quantity, text = _number(match.group(1)), match.group(2)
+    words = text.split()
+    while words and words[0] in NUMBER_WORDS:
+        quantity = (1 if quantity is None else quantity) * NUMBER_WORDS[words.pop(0)]
+    unit = None
+    if words[:2] == ['fl', 'oz']:
+        unit, words = 'floz', words[2:]
+    elif words and words[0] in UNIT_ALIASES:
+        unit, words = UNIT_ALIASES[words[0]], words[1:]
+    while words and words[0] in FILLER:
+        words = words[1:]
+    rest = ' '.join(words)
+
+    if quantity is None:
+        # "chicken breast 150g"
+        match = _TRAILING.match(rest)
+        if match and match.group(3) in UNIT_ALIASES:
+            rest, quantity, unit = match.group(1), _number(match.group(2)), UNIT_ALIASES[match.group(3)]
+    return quantity, unit, rest
+
+
+def _normalize(text):
+    text = text.lower()
+    for symbol, replacement in FRACTIONS.items():
+        text = text.replace(symbol, replacement)
+    text = re.sub(r'(\d)\s*(g|kg|oz|ml|lb)\b', r'\1 \2', text)  # "150g" -> "150 g"
+    return re.sub(r'[~*•]', ' ', text).strip(' .-')
+
+
+def parse_item(text, index=None, hint='', min_score=MIN_SCORE):
+    """A ``MealItem`` for one food, or ``None`` when it isn't in the table.
+
+    ``hint`` is a separate portion description ("about 150g", "1 cup"),
+    used when ``text`` doesn't say how much.
+    """
+    index = index or get_index()
+    text = _normalize(text)
+    hints = _PARENS.findall(text) + [_normalize(hint)]
+    quantity, unit, name = _amount(_PARENS.sub(' ', text))
+    food = index.lookup(name, min_score)
+    if food is None:
+        return None
+    for extra in hints:
+        if quantity is not None:
+            break
+        if extra:
+            quantity, unit, _ = _amount(extra)
+    explicit = quantity is not None
+    if not explicit and unit is None:
+        unit = food.default_unit  # "strawberries" is a serving of them
+    return MealItem(text, food, quantity if explicit else 1, unit, explicit)
+
+
+def parse_meal(text, index=None):
+    """``(items, unmatched)`` for a free-text meal description"""
+    index = index or get_index()
+    items, unmatched = [], []
+    for segment in _SPLIT.split(text):
+        pieces = _CONJUNCTION.split(segment)  # parts with the conjunctions between them
+        parts = pieces[::2]
+        start = 0
+        while start < len(parts):
+            # "mac and cheese" names one dish, "eggs and toast" two foods: take
+            # the longest run of parts that fully matches a single name first
+            item, end = None, start + 1
+            for stop in range(len(parts), start + 1, -1):
+                item = parse_item(''.join(pieces[2 * start:2 * stop - 1]), index, min_score=DISH_SCORE)
+                if item is not None:
+                    end = stop
+                    break
+            part, start = parts[start], end
+            if item is None and _tokens(_normalize(part)):
+                item = parse_item(part, index)
+                if item is None:
+                    unmatched.append(part.strip())
+            if item is not None:
+                items.append(item)
+    return items, unmatched
+
+
+def totals(items):
+    return {name: round(sum(item.nutrients[name] for item in items), 1) for name in NUTRIENTS}
+
+
+def cross_check(data, index=None, tolerance=CROSS_CHECK_TOLERANCE):
+    """``(data, note)``: a photo analysis with totals recomputed locally when they disagree.
+
+    Only applies when every item is in the table with a stated amount;
+    otherwise, or when the model's calories are within ``tolerance``, the
+    analysis comes back unchanged with ``note`` ``None``.
+    """
+    names = data.get('food_items') or []
+    portions = data.get('portion_estimates') or []
+    if not names:
+        return data, None
+    items = []
+    for position, name in enumerate(names):
+        item = parse_item(str(name), index, str(portions[position]) if position < len(portions) else '')
+        if item is None or not item.explicit or item.assumed:
+            return data, None
+        items.append(item)
+
+    local = totals(items)
+    try:
+        reported = float(data.get('total_calories') or 0)
+    except (TypeError, ValueError):
+        reported = 0.0
+    if reported and abs(local['calories'] - reported) <= tolerance * max(reported, local['calories']):
+        return data, None
+
+    corrected = dict(data)
+    corrected['total_calories'] = round(local['calories'])
+    corrected['macros'] = dict(data.get('macros') or {}, **{name: local[name] for name in NUTRIENTS[1:]})
+    note = (f"Checked against the food database: {reported:.0f} → {local['calories']:.0f} kcal "
+            f"({', '.join(item.describe() for item in items)})")
+    return corrected, note
@@ -0,0 +1,182 @@
+"""Goal progress, kept current as workouts and check-ins are logged.
+
+Each goal type measures one thing (``MEASURES``): weight lost or gained
+since the goal was set, minutes or sessions of matching workouts, or days
+with any workout. The ``record_*`` helpers run inside the transaction
+that inserts the raw row, like ``rollups``, and add that row's share to
+every active goal it counts toward, so ``current_value`` is never
+recomputed from history. A goal that reaches its target becomes
+``Completed`` in the same statement; ``expire`` retires the ones whose
+date has passed. ``evaluate`` derives the display columns for a whole
+frame of goals at once.
+"""
+from datetime import date, datetime
+
+import startup
+import versions
+
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+ACTIVE, COMPLETED, EXPIRED = 'Active', 'Completed', 'Expired'
+
+# Matched against the lowercased free-text exercise name
+STRENGTH_KEYWORDS = ('strength', 'weight', 'lift', 'resistance', 'dumbbell', 'barbell', 'kettlebell',
+                     'squat', 'deadlift', 'bench', 'press', 'push-up', 'pull-up', 'calisthenics', 'crossfit')
+FLEXIBILITY_KEYWORDS = ('yoga', 'stretch', 'pilates', 'mobility', 'flexibility', 'tai chi', 'barre')
+
+
+class Measure:
+    """What a goal type counts: ``source`` is ``'weight'``, ``'minutes'``, ``'sessions'`` or ``'active_days'``"""
+
+    __slots__ = ('source', 'unit', 'keywords', 'sign')
+
+    def __init__(self, source, unit, keywords=None, sign=0):
+        self.source = source
+        self.unit = unit
+        self.keywords = keywords  # None counts every workout
+        self.sign = sign          # weight goals: +1 counts weight lost, -1 weight gained
+
+    def counts(self, exercise):
+        if self.source == 'weight':
+            return False
+        return self.keywords is None or any(k in (exercise or '').lower() for k in self.keywords)
+
+    def workout_amount(self, exercise, duration, first_of_day):
+        """How far one workout moves a goal of this type"""
+        if not self.counts(exercise):
+            return 0
+        if self.source == 'minutes':
+            return duration or 0
+        if self.source == 'sessions':
+            return 1
+        return 1 if first_of_day else 0
+
+
+MEASURES = {
+    'Weight Loss': Measure('weight', 'lbs/kg lost', sign=1),
+    'Weight Gain': Measure('weight', 'lbs/kg gained', sign=-1),
+    'Muscle Building': Measure('minutes', 'minutes of strength training', STRENGTH_KEYWORDS),
+    'Endurance': Measure('minutes', 'minutes of exercise'),
+    'Strength': Measure('sessions', 'strength sessions', STRENGTH_KEYWORDS),
+    'Flexibility': Measure('minutes', 'minutes of yoga and stretching', FLEXIBILITY_KEYWORDS),
+    'Habit Building': Measure('active_days', 'days with a workout'),
+}
+
+_UNITS = {goal_type: measure.unit for goal_type, measure in MEASURES.items()}
+
+# Goals count data from the day they were set through their target date
+_IN_WINDOW = "AND :day BETWEEN substr(created_date, 1, 10) AND COALESCE(target_date, :day)"
+
+
+def _completes(value):
+    return f"target_value > 0 AND {value} >= target_value"
+
+
+_ADVANCE_SQL = f'''
+    UPDATE goals SET
+        current_value = COALESCE(current_value, 0) + :amount,
+        status = CASE WHEN {_completes('COALESCE(current_value, 0) + :amount')} THEN '{COMPLETED}' ELSE status END,
+        completed_date = CASE WHEN {_completes('COALESCE(current_value, 0) + :amount')}
+                              THEN :day ELSE completed_date END
+    WHERE user_id = :user_id AND status = '{ACTIVE}' AND goal_type = :goal_type {_IN_WINDOW}
+'''
+
+_WEIGHED_SQL = f'''
+    UPDATE goals SET
+        baseline_value = COALESCE(baseline_value, :weight),
+        measured_day = :day,
+        current_value = :sign * (COALESCE(baseline_value, :weight) - :weight),
+        status = CASE WHEN {_completes(':sign * (COALESCE(baseline_value, :weight) - :weight)')}
+                      THEN '{COMPLETED}' ELSE status END,
+        completed_date = CASE WHEN {_completes(':sign * (COALESCE(baseline_value, :weight) - :weight)')}
+                              THEN :day ELSE completed_date END
+    WHERE user_id = :user_id AND status = '{ACTIVE}' AND goal_type = :goal_type {_IN_WINDOW}
+      AND (measured_day IS NULL OR measured_day <= :day)
+'''
+
+
+def _changed(conn, user_id, changed):
+    if changed:
+        versions.bump(conn, user_id, 'goals')
+    return changed
+
+
+def add(conn, user_id, goal_type, description, target_value, target_date):
+    """Insert an active goal; weight goals start from the latest logged weight"""
+    baseline, measured_day = None, None
+    measure = MEASURES.get(goal_type)
+    if measure is not None and measure.source == 'weight':
+        latest = conn.execute('''
+            SELECT weight, substr(date, 1, 10) FROM health_metrics
+            WHERE user_id = ? AND weight > 0 ORDER BY ts DESC LIMIT 1
+        ''', (user_id,)).fetchone()
+        if latest:
+            baseline, measured_day = latest
+    conn.execute('''
+        INSERT INTO goals (user_id, goal_type, description, target_value, current_value,
+                           target_date, status, created_date, baseline_value, measured_day)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, goal_type, description, target_value, 0, target_date, ACTIVE,
+          datetime.now().isoformat(), baseline, measured_day))
+    versions.bump(conn, user_id, 'goals')
+
+
+def record_workout(conn, user_id, day, exercise, duration):
+    """Fold one workout into the active goals; call after ``rollups.record_workout``"""
+    first_of_day = conn.execute('SELECT workout_count FROM daily_workouts WHERE user_id = ? AND day = ?',
+                                (user_id, day)).fetchone()[0] == 1
+    changed = 0
+    for goal_type, measure in MEASURES.items():
+        amount = measure.workout_amount(exercise, duration, first_of_day)
+        if amount:
+            changed += conn.execute(_ADVANCE_SQL, dict(amount=amount, user_id=user_id, goal_type=goal_type,
+                                                       day=day)).rowcount
+    return _changed(conn, user_id, changed)
+
+
+def record_health(conn, user_id, day, metrics):
+    """Fold one check-in's weight into the active weight goals"""
+    weight = metrics.get('weight')
+    if not weight:
+        return 0
+    changed = 0
+    for goal_type, measure in MEASURES.items():
+        if measure.source == 'weight':
+            changed += conn.execute(_WEIGHED_SQL, dict(weight=weight, sign=measure.sign, user_id=user_id,
+                                                       goal_type=goal_type, day=day)).rowcount
+    return _changed(conn, user_id, changed)
+
+
+def expire(conn, user_id, today=None):
+    """Mark active goals past their target date as expired"""
+    changed = conn.execute(f'''
+        UPDATE goals SET status = '{EXPIRED}'
+        WHERE user_id = ? AND status = '{ACTIVE}' AND target_date < ?
+    ''', (user_id, (today or date.today()).isoformat())).rowcount
+    return _changed(conn, user_id, changed)
+
+
+def evaluate(goals, today=None):
+    """``goals`` rows with display columns added, computed for all of them at once.
+
+    ``progress`` is the fraction of the target reached, ``expected`` the
+    fraction of the time window gone, ``days_left`` counts to the target
+    date, and ``overdue`` flags active goals past it.
+    """
+    today = pd.Timestamp(today or date.today())
+    target = goals['target_value'].astype(float)
+    current = goals['current_value'].fillna(0).astype(float)
+    start = pd.to_datetime(goals['created_date'].str[:10], errors='coerce')
+    due = pd.to_datetime(goals['target_date'], errors='coerce')
+
+    progress = np.where(target > 0, current / target.where(target > 0), 0)
+    expected = ((today - start) / (due - start)).replace([np.inf, -np.inf], np.nan).fillna(1).clip(0, 1)
+    return goals.assign(
+        progress=np.clip(progress, 0, 1),
+        expected=expected,
+        on_track=np.clip(progress, 0, 1) >= expected,
+        days_left=(due - today).dt.days,
+        overdue=(goals['status'] == ACTIVE) & (due < today),
+        unit=goals['goal_type'].map(_UNITS).fillna(''),
+    )
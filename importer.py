@@ -0,0 +1,604 @@
+"""Bulk import of wearable and third-party fitness exports.
+
+Supported inputs:
+
+* Apple Health ``export.xml``, or the ``export.zip`` it ships in
+* Fitbit account exports (``exercise-*``, ``sleep-*``, ``resting_heart_rate-*``
+  and ``weight-*`` JSON files)
+* Google Fit Takeout session JSON (``All Sessions/*.json``)
+* Garmin TCX and GPX files, and FIT files when ``fitparse`` is installed
+* zip archives of any of the above
+
+Parsing is streaming throughout: XML goes through an incremental parser
+with every element cleared once it has been read, and JSON arrays are
+streamed with ``ijson`` when it is installed. Workouts are inserted
+``BATCH_SIZE`` rows per transaction; health samples are folded into one row
+per metric per day as they are read. Per-second heart rate, pace, power and
+cadence from TCX, GPX and FIT track points go to the ``samples`` store.
+Every imported row carries ``(source, source_id)``, so importing the same
+file twice inserts nothing the second time.
+"""
+import io
+import json
+import os
+import time
+import zipfile
+import zlib
+from array import array
+from datetime import datetime, timezone
+from xml.etree.ElementTree import XMLPullParser, iterparse
+
+import database
+import goal_progress
+import rollups
+import samples
+import versions
+
+BATCH_SIZE = 5000
+# Buffered per-second samples that force an early workout flush
+MAX_PENDING_SAMPLES = 1_000_000
+
+APPLE_HEALTH = 'apple_health'
+FITBIT = 'fitbit'
+GOOGLE_FIT = 'google_fit'
+GARMIN = 'garmin'
+
+SOURCE_LABELS = {
+    APPLE_HEALTH: 'Apple Health',
+    FITBIT: 'Fitbit',
+    GOOGLE_FIT: 'Google Fit',
+    GARMIN: 'Garmin',
+}
+
+EXTENSIONS = ('zip', 'xml', 'json', 'tcx', 'gpx', 'fit')
+
+KG_TO_LB = 2.20462
+
+# Daily health values that add up over a day; the rest are averaged
+_SUMMED = ('sleep_hours',)
+
+
+class UnsupportedFile(ValueError):
+    """A file that can't be imported; ``str()`` is safe to show users"""
+
+
+class ImportResult:
+    """Counts for one import run"""
+
+    def __init__(self):
+        self.files = 0
+        self.skipped_files = []
+        self.workouts = 0
+        self.days = 0
+        self.duplicates = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def summary(self):
+        text = (f"Imported {self.workouts} workouts and {self.days} days of health data "
+                f"from {self.files} files in {self.seconds:.1f}s")
+        if self.duplicates:
+            text += f" ({self.duplicates} already imported)"
+        return text
+
+
+def _local(moment):
+    """Naive local time; naive inputs are taken to be local already"""
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def _iso_utc(text):
+    """Parse ISO-8601 with a trailing ``Z``"""
+    return datetime.fromisoformat(text.replace('Z', '+00:00'))
+
+
+def _words(identifier):
+    """``TraditionalStrengthTraining`` -> ``Traditional Strength Training``"""
+    out = ''
+    for i, char in enumerate(identifier):
+        if char.isupper() and i and identifier[i - 1].islower():
+            out += ' '
+        out += char
+    out = out.replace('_', ' ').replace('.', ' ').strip()
+    return out.title() if identifier.islower() else out
+
+
+def _local_tag(elem):
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def _workout(source_id, start, exercise, minutes, calories=None, heart_rate=None, series=None):
+    return ('workout', {
+        'source_id': source_id,
+        'start': start,
+        'exercise': exercise,
+        'duration': round(minutes or 0),
+        'calories': round(calories or 0),
+        'heart_rate_avg': round(heart_rate) if heart_rate else None,
+        'series': series if series else None,
+    })
+
+
+class _Series:
+    """Per-channel ``(timestamps, values)`` sample arrays for one activity"""
+
+    def __init__(self):
+        self.channels = {}
+
+    def add(self, moment, channel, value):
+        times, values = self.channels.setdefault(channel, (array('d'), array('d')))
+        times.append(moment.timestamp())
+        values.append(value)
+
+    def add_speed(self, moment, speed):
+        # Pace is undefined while standing still
+        if speed > 0.3:
+            self.add(moment, 'pace', 1000 / speed)
+
+    def mean(self, channel):
+        values = self.channels.get(channel, (None, ()))[1]
+        return sum(values) / len(values) if values else None
+
+    def __len__(self):
+        return sum(len(times) for times, _ in self.channels.values())
+
+
+def _health(moment, metric, value):
+    return ('health', (_local(moment).date().isoformat(), metric, value))
+
+
+# Apple Health
+
+_APPLE_QUANTITIES = {
+    'HKQuantityTypeIdentifierRestingHeartRate': 'resting_heart_rate',
+    'HKQuantityTypeIdentifierBodyMass': 'weight',
+    'HKQuantityTypeIdentifierBodyFatPercentage': 'body_fat_percentage',
+}
+_APPLE_ASLEEP = ('HKCategoryValueSleepAnalysisAsleep', 'HKCategoryValueSleepAnalysisAsleepUnspecified',
+                 'HKCategoryValueSleepAnalysisAsleepCore', 'HKCategoryValueSleepAnalysisAsleepDeep',
+                 'HKCategoryValueSleepAnalysisAsleepREM')
+_APPLE_DURATION_MINUTES = {'min': 1, 's': 1 / 60, 'hr': 60}
+_APPLE_ENERGY_KCAL = {'Cal': 1, 'kcal': 1, 'kJ': 1 / 4.184}
+
+
+def _apple_date(text):
+    return datetime.strptime(text, '%Y-%m-%d %H:%M:%S %z')
+
+
+def _apple_record(attrib):
+    kind = attrib.get('type')
+    if kind == 'HKCategoryTypeIdentifierSleepAnalysis':
+        if attrib.get('value') in _APPLE_ASLEEP:
+            start, end = _apple_date(attrib['startDate']), _apple_date(attrib['endDate'])
+            # Credited to the day the user woke up on
+            return _health(end, 'sleep_hours', (end - start).total_seconds() / 3600)
+        return None
+
+    metric = _APPLE_QUANTITIES.get(kind)
+    if metric is None:
+        return None
+    value = float(attrib['value'])
+    if metric == 'weight' and attrib.get('unit') == 'kg':
+        value *= KG_TO_LB
+    elif metric == 'body_fat_percentage' and value <= 1:
+        value *= 100  # stored as a fraction
+    return _health(_apple_date(attrib['startDate']), metric, value)
+
+
+def _apple_workout(elem):
+    attrib = elem.attrib
+    start = _apple_date(attrib['startDate'])
+    minutes = float(attrib.get('duration', 0)) * _APPLE_DURATION_MINUTES.get(attrib.get('durationUnit', 'min'), 1)
+    calories = float(attrib['totalEnergyBurned']) * _APPLE_ENERGY_KCAL.get(
+        attrib.get('totalEnergyBurnedUnit', 'kcal'), 1) if 'totalEnergyBurned' in attrib else None
+    heart_rate = None
+
+    # Newer exports move the totals into per-workout statistics
+    for stat in elem.iter('WorkoutStatistics'):
+        kind = stat.get('type')
+        if kind == 'HKQuantityTypeIdentifierActiveEnergyBurned' and calories is None and stat.get('sum'):
+            calories = float(stat.get('sum')) * _APPLE_ENERGY_KCAL.get(stat.get('unit', 'kcal'), 1)
+        elif kind == 'HKQuantityTypeIdentifierHeartRate' and stat.get('average'):
+            heart_rate = float(stat.get('average'))
+
+    activity = attrib.get('workoutActivityType', 'HKWorkoutActivityTypeOther')
+    return _workout(f"{activity}@{attrib['startDate']}", start,
+                    _words(activity.removeprefix('HKWorkoutActivityType')), minutes, calories, heart_rate)
+
+
+_APPLE_IMPORTED_TYPES = frozenset(t.encode() for t in (*_APPLE_QUANTITIES, 'HKCategoryTypeIdentifierSleepAnalysis'))
+_RECORD_PREFIX = b'<Record type="'
+
+
+def _apple_lines(fileobj):
+    """Lines of ``export.xml`` without the Records Elle doesn't import.
+
+    Most of an export is per-minute samples (heart rate, steps, energy) that
+    are never used; dropping them before the XML parser sees them more than
+    halves the parse time. Apple writes one element per line, and a Record
+    whose tag doesn't close on its own line is passed through untouched.
+    """
+    skipping = False
+    for line in fileobj:
+        if skipping:
+            skipping = b'</Record>' not in line
+            continue
+        start = line.find(_RECORD_PREFIX)
+        if start >= 0:
+            start += len(_RECORD_PREFIX)
+            tail = line.rstrip()
+            if tail.endswith(b'>') and line[start:line.find(b'"', start)] not in _APPLE_IMPORTED_TYPES:
+                skipping = not tail.endswith(b'/>')
+                continue
+        yield line
+
+
+def _apple_events(fileobj, lines_per_feed=2000):
+    parser = XMLPullParser(events=('start', 'end'))
+    batch = []
+    for line in _apple_lines(fileobj):
+        batch.append(line)
+        if len(batch) >= lines_per_feed:
+            parser.feed(b''.join(batch))
+            batch = []
+            yield from parser.read_events()
+    parser.feed(b''.join(batch))
+    parser.close()
+    yield from parser.read_events()
+
+
+def parse_apple_health(fileobj):
+    events = _apple_events(fileobj)
+    _, root = next(events)
+    depth = 1
+    for event, elem in events:
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        # Top-level elements only; clearing the root drops everything read so far
+        if elem.tag == 'Record':
+            parsed = _apple_record(elem.attrib)
+            if parsed:
+                yield parsed
+        elif elem.tag == 'Workout':
+            yield _apple_workout(elem)
+        root.clear()
+
+
+# Fitbit and Google Fit
+
+_ijson = None
+
+
+def _json_items(fileobj):
+    """Items of a top-level JSON array, streamed when ``ijson`` is installed"""
+    global _ijson
+    if _ijson is None:
+        try:
+            import ijson
+            _ijson = ijson
+        except ImportError:
+            _ijson = False
+    if _ijson:
+        # Floats as float, not Decimal
+        yield from _ijson.items(fileobj, 'item', use_float=True)
+        return
+    data = json.load(fileobj)
+    yield from data if isinstance(data, list) else [data]
+
+
+def _fitbit_date(text):
+    return datetime.strptime(text, '%m/%d/%y %H:%M:%S')
+
+
+def _fitbit_item(kind, item):
+    if kind == 'exercise':
+        return _workout(str(item['logId']), _fitbit_date(item['startTime']), item.get('activityName', 'Workout'),
+                        item.get('duration', 0) / 60000, item.get('calories'), item.get('averageHeartRate'))
+    if kind == 'sleep':
+        day = datetime.fromisoformat(item['dateOfSleep'])
+        return _health(day, 'sleep_hours', item.get('minutesAsleep', 0) / 60)
+    if kind == 'resting_heart_rate':
+        value = item.get('value') or {}
+        if value.get('value'):
+            return _health(_fitbit_date(item['dateTime']), 'resting_heart_rate', value['value'])
+        return None
+    if kind == 'weight':
+        moment = _fitbit_date(f"{item['date']} {item.get('time', '00:00:00')}")
+        if item.get('fat'):
+            # Weight and fat arrive together; fat is the rarer of the two
+            return [_health(moment, 'weight', item['weight']), _health(moment, 'body_fat_percentage', item['fat'])]
+        return _health(moment, 'weight', item['weight'])
+    return None
+
+
+def parse_fitbit(fileobj, kind):
+    for item in _json_items(fileobj):
+        parsed = _fitbit_item(kind, item)
+        if isinstance(parsed, list):
+            yield from parsed
+        elif parsed:
+            yield parsed
+
+
+def parse_google_fit(fileobj):
+    session = json.load(fileobj)  # one small session per file
+    if 'fitnessActivity' not in session:
+        raise UnsupportedFile("Not a Google Fit session file")
+    start = _iso_utc(session['startTime'])
+    minutes = (_iso_utc(session['endTime']) - start).total_seconds() / 60
+    aggregates = {a.get('metricName'): a.get('floatValue', a.get('intValue')) for a in session.get('aggregate', [])}
+    yield _workout(session['startTime'], start, _words(session['fitnessActivity']), minutes,
+                   aggregates.get('com.google.calories.expended'), aggregates.get('com.google.heart_rate.summary'))
+
+
+# Garmin
+
+# Trackpoint child tags (namespaces stripped) -> sample channel
+_TCX_CHANNELS = {'Value': 'heart_rate', 'Watts': 'power', 'Cadence': 'cadence', 'RunCadence': 'cadence'}
+_GPX_CHANNELS = {'hr': 'heart_rate', 'power': 'power', 'cad': 'cadence'}
+
+
+def _trackpoint(elem, series, channels, time_tag):
+    """Add one track point's readings to ``series``; returns its time text"""
+    readings = {_local_tag(child): child.text for child in elem.iter() if child.text and child.text.strip()}
+    stamp = readings.get(time_tag)
+    if stamp:
+        moment = _iso_utc(stamp)
+        for tag, channel in channels.items():
+            if tag in readings:
+                series.add(moment, channel, float(readings[tag]))
+        if 'Speed' in readings:
+            series.add_speed(moment, float(readings['Speed']))
+    return stamp
+
+
+def parse_tcx(fileobj):
+    seconds = calories = 0
+    series = _Series()
+    for _, elem in iterparse(fileobj, events=('end',)):
+        tag = _local_tag(elem)
+        if tag == 'Trackpoint':
+            _trackpoint(elem, series, _TCX_CHANNELS, 'Time')
+            elem.clear()
+        elif tag == 'Lap':
+            for child in elem:
+                if _local_tag(child) == 'TotalTimeSeconds':
+                    seconds += float(child.text)
+                elif _local_tag(child) == 'Calories':
+                    calories += float(child.text)
+            elem.clear()
+        elif tag == 'Activity':
+            activity_id = next(child.text for child in elem if _local_tag(child) == 'Id')
+            yield _workout(activity_id, _iso_utc(activity_id), _words(elem.get('Sport', 'Other')),
+                           seconds / 60, calories, series.mean('heart_rate'), series)
+            seconds = calories = 0
+            series = _Series()
+            elem.clear()
+
+
+def parse_gpx(fileobj):
+    first = last = None
+    series = _Series()
+    for _, elem in iterparse(fileobj, events=('end',)):
+        tag = _local_tag(elem)
+        if tag == 'trkpt':
+            stamp = _trackpoint(elem, series, _GPX_CHANNELS, 'time')
+            if stamp:
+                last = stamp
+                first = first or last
+            elem.clear()
+        elif tag == 'trk':
+            if first:
+                labels = {_local_tag(child): child.text for child in elem if child.text}
+                name = labels.get('type') or labels.get('name') or 'GPS Activity'
+                start = _iso_utc(first)
+                yield _workout(first, start, _words(name), (_iso_utc(last) - start).total_seconds() / 60,
+                               heart_rate=series.mean('heart_rate'), series=series)
+            first = last = None
+            series = _Series()
+            elem.clear()
+
+
+def parse_fit(fileobj):
+    try:
+        import fitparse
+    except ImportError:
+        raise UnsupportedFile("FIT files need the optional 'fitparse' package")
+    fit = fitparse.FitFile(fileobj)
+    sessions = []
+    for message in fit.get_messages('session'):
+        values = message.get_values()
+        # FIT timestamps are UTC
+        start = values['start_time'].replace(tzinfo=timezone.utc)
+        elapsed = values.get('total_elapsed_time') or 0
+        sessions.append((start, start.timestamp() + elapsed, values, _Series()))
+
+    for message in fit.get_messages('record'):
+        values = message.get_values()
+        if values.get('timestamp') is None:
+            continue
+        moment = values['timestamp'].replace(tzinfo=timezone.utc)
+        for start, end, _, series in sessions:
+            if start.timestamp() <= moment.timestamp() <= end:
+                for field, channel in (('heart_rate', 'heart_rate'), ('power', 'power'), ('cadence', 'cadence')):
+                    if values.get(field) is not None:
+                        series.add(moment, channel, values[field])
+                speed = values.get('enhanced_speed', values.get('speed'))
+                if speed is not None:
+                    series.add_speed(moment, speed)
+                break
+
+    for start, _, values, series in sessions:
+        yield _workout(start.isoformat(), start, _words(str(values.get('sport', 'Other'))),
+                       (values.get('total_elapsed_time') or 0) / 60, values.get('total_calories'),
+                       values.get('avg_heart_rate'), series)
+
+
+# Dispatch
+
+_FITBIT_PREFIXES = ('exercise-', 'sleep-', 'resting_heart_rate-', 'weight-')
+
+
+def parse(name, fileobj):
+    """``(source, records)`` for one file, by name; raises ``UnsupportedFile``"""
+    base = os.path.basename(name).lower()
+    ext = base.rsplit('.', 1)[-1]
+    if ext == 'xml' and base != 'export_cda.xml':
+        return APPLE_HEALTH, parse_apple_health(fileobj)
+    if ext == 'json':
+        for prefix in _FITBIT_PREFIXES:
+            if base.startswith(prefix):
+                return FITBIT, parse_fitbit(fileobj, prefix[:-1])
+        return GOOGLE_FIT, parse_google_fit(fileobj)
+    if ext == 'tcx':
+        return GARMIN, parse_tcx(fileobj)
+    if ext == 'gpx':
+        return GARMIN, parse_gpx(fileobj)
+    if ext == 'fit':
+        return GARMIN, parse_fit(fileobj)
+    raise UnsupportedFile(f"Don't know how to import {os.path.basename(name)}")
+
+
+def _members(name, fileobj):
+    """``(name, fileobj)`` for a file, or for each file inside a zip"""
+    if not name.lower().endswith('.zip'):
+        yield name, fileobj
+        return
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            # Apple's route GPX files duplicate workouts already in export.xml
+            if info.is_dir() or '/workout-routes/' in f'/{info.filename}':
+                continue
+            with archive.open(info) as member:
+                # ZipExtFile's own readline is pure Python and several times slower
+                yield info.filename, io.BufferedReader(member, buffer_size=1 << 20)
+
+
+class _DailyHealth:
+    """Per-day sums and counts for imported health samples"""
+
+    def __init__(self):
+        self.days = {}
+
+    def add(self, day, metric, value):
+        sums = self.days.setdefault(day, {})
+        total, count = sums.get(metric, (0.0, 0))
+        sums[metric] = (total + value, count + 1)
+
+    def rows(self):
+        """``(day, metric, value)``, one per metric per day"""
+        for day, sums in sorted(self.days.items()):
+            for metric, (total, count) in sums.items():
+                yield day, metric, total if metric in _SUMMED else total / count
+
+
+class Importer:
+    """Streams parsed records into one user's database"""
+
+    def __init__(self, db_path, user_id, batch_size=BATCH_SIZE):
+        self.db_path = db_path
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self._pending = []
+        self._pending_samples = 0
+        self._health = {}
+
+    def _flush_workouts(self):
+        if not self._pending:
+            return
+        with database.transaction(self.db_path) as conn:
+            for source, workout in self._pending:
+                start = _local(workout['start'])
+                date = start.isoformat()
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO workouts (user_id, date, ts, exercise, duration, calories,
+                                                    heart_rate_avg, notes, source, source_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (self.user_id, date, int(start.timestamp()), workout['exercise'], workout['duration'],
+                      workout['calories'], workout['heart_rate_avg'], f"Imported from {SOURCE_LABELS[source]}",
+                      source, workout['source_id']))
+                if cursor.rowcount:
+                    rollups.record_workout(conn, self.user_id, date[:10], workout['duration'], workout['calories'])
+                    goal_progress.record_workout(conn, self.user_id, date[:10], workout['exercise'],
+                                                 workout['duration'])
+                    for channel, (times, values) in (workout['series'].channels.items()
+                                                     if workout['series'] else ()):
+                        samples.store(conn, cursor.lastrowid, channel, times, values)
+                    self.result.workouts += 1
+                else:
+                    self.result.duplicates += 1
+            versions.bump(conn, self.user_id, 'workouts')
+        self._pending = []
+        self._pending_samples = 0
+
+    def _flush_health(self):
+        # One row per metric per day, so files covering different metrics
+        # for the same days (Fitbit's sleep-* and weight-*) never collide
+        rows = [(source, day, metric, value)
+                for source, daily in self._health.items() for day, metric, value in daily.rows()]
+        days = set()
+        for start in range(0, len(rows), self.batch_size):
+            with database.transaction(self.db_path) as conn:
+                for source, day, metric, value in rows[start:start + self.batch_size]:
+                    midnight = datetime.fromisoformat(day)
+                    inserted = conn.execute(f'''
+                        INSERT OR IGNORE INTO health_metrics (user_id, date, ts, {metric}, source, source_id)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (self.user_id, midnight.isoformat(), int(midnight.timestamp()), value,
+                          source, f"{metric}@{day}")).rowcount
+                    if inserted:
+                        rollups.record_health(conn, self.user_id, day, {metric: value})
+                        goal_progress.record_health(conn, self.user_id, day, {metric: value})
+                        days.add(day)
+                    else:
+                        self.result.duplicates += 1
+                versions.bump(conn, self.user_id, 'health_metrics')
+        self.result.days += len(days)
+        self._health = {}
+
+    def add_file(self, name, fileobj):
+        """Import one file or zip; unreadable files are recorded and skipped"""
+        try:
+            for member_name, member in _members(name, fileobj):
+                self._add_member(member_name, member)
+        except (zipfile.BadZipFile, OSError) as e:
+            # The archive itself can't be opened or listed
+            self.result.skipped_files.append((name, f"not a readable zip ({e})"))
+
+    def _add_member(self, name, fileobj):
+        try:
+            source, records = parse(name, fileobj)
+            daily = self._health.setdefault(source, _DailyHealth())
+            for kind, record in records:
+                if kind == 'workout':
+                    self._pending.append((source, record))
+                    self._pending_samples += len(record['series'] or ())
+                    if len(self._pending) >= self.batch_size or self._pending_samples >= MAX_PENDING_SAMPLES:
+                        self._flush_workouts()
+                else:
+                    daily.add(*record)
+        except (UnsupportedFile, ValueError, KeyError, SyntaxError, zipfile.BadZipFile, zlib.error) as e:
+            # SyntaxError covers ElementTree's ParseError; the zip errors mean a corrupt member
+            self.result.skipped_files.append((name, str(e)))
+            return
+        self.result.files += 1
+
+    def finish(self):
+        """Write everything still buffered and return the ``ImportResult``"""
+        self._flush_workouts()
+        self._flush_health()
+        self.result.seconds = time.perf_counter() - self.result.started
+        return self.result
+
+
+def import_files(db_path, user_id, files):
+    """Import ``(name, fileobj)`` pairs for ``user_id``"""
+    importer = Importer(db_path, user_id)
+    for name, fileobj in files:
+        importer.add_file(name, fileobj)
+    return importer.finish()
@@ -0,0 +1,292 @@
+"""Single entry point for every OpenAI chat completion Elle makes.
+
+The gateway adds what the raw SDK calls lacked:
+
+* per-model token buckets for requests/minute and tokens/minute, shared by
+  every session in the process, so bursts queue locally instead of
+  tripping the provider's 429s
+* exponential backoff with full jitter on 429, 5xx, timeouts and dropped
+  connections, honouring ``Retry-After``
+* an overall deadline per call that bounds queueing, retries and the
+  request itself
+* coalescing of identical in-flight (non-streaming) requests
+* latency and token accounting per model
+
+Point ``base_url`` at a local stub server to exercise throttling behaviour.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+import openai
+
+import streaming
+
+# (requests per minute, tokens per minute); conservative tier-1 style limits
+DEFAULT_LIMITS = {
+    'gpt-4': (500, 10000),
+    'gpt-4o': (500, 30000),
+    'gpt-4o-mini': (500, 200000),
+}
+FALLBACK_LIMITS = (500, 10000)
+
+DEFAULT_DEADLINE = 60.0
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+
+class GatewayError(Exception):
+    """A completion failed after retries; ``str()`` is safe to show users"""
+
+    def __init__(self, message, cause=None):
+        super().__init__(message)
+        self.cause = cause
+
+
+class DeadlineExceeded(GatewayError):
+    """The call's deadline passed while queued, backing off or in flight"""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` per second"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1.0, deadline=None):
+        """Block until ``amount`` tokens are available; False if the deadline passes first"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+                wait = (amount - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+
+class CallRecord:
+    """Accounting for one gateway call"""
+
+    __slots__ = ('label', 'model', 'latency', 'attempts', 'prompt_tokens',
+                 'completion_tokens', 'coalesced', 'ok')
+
+    def __init__(self, label, model):
+        self.label = label
+        self.model = model
+        self.latency = 0.0
+        self.attempts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.coalesced = False
+        self.ok = False
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    """Server-suggested delay in seconds, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def _estimate_tokens(request):
+    """Rough prompt + completion size, for the tokens/minute bucket"""
+    prompt_chars = 0
+    for message in request.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            prompt_chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                # Images are billed by tile, not by their base64 length
+                prompt_chars += len(part.get('text', '')) if part.get('type') == 'text' else 3000
+    return prompt_chars // 4 + request.get('max_tokens', 500)
+
+
+class LLMGateway:
+    """Rate-limited, retrying, coalescing front for ``client.chat.completions``"""
+
+    def __init__(self, client, limits=None, default_deadline=DEFAULT_DEADLINE, max_attempts=MAX_ATTEMPTS):
+        # The gateway owns retries, so the SDK's own retry loop is switched off
+        self.client = client.with_options(max_retries=0)
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.default_deadline = default_deadline
+        self.max_attempts = max_attempts
+
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._records = deque(maxlen=1000)
+        self._records_lock = threading.Lock()
+
+    def _buckets_for(self, model):
+        with self._buckets_lock:
+            if model not in self._buckets:
+                rpm, tpm = self.limits.get(model, FALLBACK_LIMITS)
+                self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+            return self._buckets[model]
+
+    def _admit(self, request, deadline):
+        requests_bucket, tokens_bucket = self._buckets_for(request['model'])
+        if not (requests_bucket.acquire(1, deadline) and
+                tokens_bucket.acquire(_estimate_tokens(request), deadline)):
+            raise DeadlineExceeded("Elle is getting a lot of requests right now - please try again in a moment.")
+
+    def _call(self, request, deadline, record):
+        """Admit, send and retry one request until it succeeds or runs out of time"""
+        last_error = None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._admit(request, deadline)
+            record.attempts += 1
+            try:
+                return self.client.with_options(timeout=deadline - time.monotonic()).chat.completions.create(**request)
+            except Exception as e:
+                last_error = e
+                if not _is_retryable(e):
+                    raise GatewayError(str(e), e)
+            if attempt == self.max_attempts - 1:
+                break
+
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            delay = max(delay, _retry_after(last_error) or 0)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        if record.attempts >= self.max_attempts:
+            raise GatewayError(f"Elle couldn't reach the AI service after {record.attempts} attempts: {last_error}",
+                               last_error)
+        raise DeadlineExceeded("Elle took too long to respond - please try again.", last_error)
+
+    def _finish(self, record, started):
+        record.latency = time.perf_counter() - started
+        with self._records_lock:
+            self._records.append(record)
+
+    def complete(self, label, deadline=None, **request):
+        """Run a completion and return the message text.
+
+        Identical concurrent requests share one upstream call.
+        """
+        key = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+        with self._in_flight_lock:
+            leader = key not in self._in_flight
+            if leader:
+                self._in_flight[key] = Future()
+            future = self._in_flight[key]
+
+        record = CallRecord(label, request['model'])
+        started = time.perf_counter()
+        deadline_at = time.monotonic() + (deadline or self.default_deadline)
+
+        if not leader:
+            record.coalesced = True
+            try:
+                text = future.result(timeout=max(deadline_at - time.monotonic(), 0))
+                record.ok = True
+                return text
+            except TimeoutError:
+                raise DeadlineExceeded("Elle took too long to respond - please try again.")
+            finally:
+                self._finish(record, started)
+
+        try:
+            response = self._call(request, deadline_at, record)
+            text = response.choices[0].message.content
+            if response.usage:
+                record.prompt_tokens = response.usage.prompt_tokens
+                record.completion_tokens = response.usage.completion_tokens
+            record.ok = True
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+            self._finish(record, started)
+
+    def stream(self, label, deadline=None, metrics=None, **request):
+        """Yield text deltas; retries apply until the stream is open.
+
+        A failure after that (a dropped connection, a timeout between
+        chunks) can't be retried without repeating text already shown, so
+        it ends the stream with ``GatewayError`` and counts as a failed call.
+        """
+        record = CallRecord(label, request['model'])
+        metrics = metrics or streaming.StreamMetrics(label)
+        started = time.perf_counter()
+        deadline_at = time.monotonic() + (deadline or self.default_deadline)
+        try:
+            response = self._call(dict(request, stream=True, stream_options={"include_usage": True}),
+                                  deadline_at, record)
+            try:
+                yield from streaming.stream_text(response, metrics)
+            except Exception as e:
+                raise GatewayError(f"Elle's reply was interrupted: {e}", e)
+            record.prompt_tokens = metrics.prompt_tokens or 0
+            record.completion_tokens = metrics.completion_tokens or 0
+            record.ok = True
+        finally:
+            self._finish(record, started)
+
+    def stats(self):
+        """Per-model call counts, retries, token totals and latency percentiles"""
+        with self._records_lock:
+            records = list(self._records)
+
+        by_model = defaultdict(list)
+        for record in records:
+            by_model[record.model].append(record)
+
+        report = {}
+        for model, rows in by_model.items():
+            latencies = sorted(r.latency for r in rows)
+            report[model] = {
+                'calls': len(rows),
+                'errors': sum(not r.ok for r in rows),
+                'retries': sum(max(r.attempts - 1, 0) for r in rows),
+                'coalesced': sum(r.coalesced for r in rows),
+                'prompt_tokens': sum(r.prompt_tokens for r in rows),
+                'completion_tokens': sum(r.completion_tokens for r in rows),
+                'p50_latency': latencies[len(latencies) // 2],
+                'p95_latency': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+            }
+        return report
@@ -0,0 +1,127 @@
+"""Per-day aggregate tables maintained alongside the raw inserts.
+
+The ``record_*`` helpers run inside the same transaction as the raw row
+insert, so a rollup can never disagree with the rows it summarizes. Charts
+read these tables directly: one row per day instead of one per entry.
+The tables themselves are created by ``schema`` migrations 3 and 4.
+"""
+
+# Health columns averaged per day; each keeps a running sum and count
+HEALTH_METRICS = ('weight', 'resting_heart_rate', 'sleep_hours',
+                  'stress_level', 'energy_level', 'hydration_glasses')
+
+# Entered as 0 when the user leaves the field blank
+_ZERO_MEANS_MISSING = ('weight', 'resting_heart_rate')
+
+
+def _metric_expr(metric):
+    if metric in _ZERO_MEANS_MISSING:
+        return f'NULLIF({metric}, 0)'
+    return metric
+
+
+def rebuild(conn):
+    """Recompute every rollup from the raw tables"""
+    conn.execute('DELETE FROM daily_workouts')
+    conn.execute('''
+        INSERT INTO daily_workouts (user_id, day, workout_count, total_minutes, total_calories)
+        SELECT user_id, substr(date, 1, 10), COUNT(*), COALESCE(SUM(duration), 0), COALESCE(SUM(calories), 0)
+        FROM workouts WHERE date IS NOT NULL
+        GROUP BY user_id, substr(date, 1, 10)
+    ''')
+
+    conn.execute('DELETE FROM daily_nutrition')
+    conn.execute('''
+        INSERT INTO daily_nutrition (user_id, day, meal_count, calories, protein, carbs, fats)
+        SELECT user_id, substr(date, 1, 10), COUNT(*), COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0),
+               COALESCE(SUM(carbs), 0), COALESCE(SUM(fats), 0)
+        FROM nutrition WHERE date IS NOT NULL
+        GROUP BY user_id, substr(date, 1, 10)
+    ''')
+
+    conn.execute('DELETE FROM daily_health')
+    columns = ', '.join(f'{m}_sum, {m}_n' for m in HEALTH_METRICS)
+    aggregates = ', '.join(
+        f'COALESCE(SUM({_metric_expr(m)}), 0), COUNT({_metric_expr(m)})' for m in HEALTH_METRICS
+    )
+    conn.execute(f'''
+        INSERT INTO daily_health (user_id, day, entries, {columns})
+        SELECT user_id, substr(date, 1, 10), COUNT(*), {aggregates}
+        FROM health_metrics WHERE date IS NOT NULL
+        GROUP BY user_id, substr(date, 1, 10)
+    ''')
+
+
+def clear(conn, user_id):
+    """Drop a user's rollups, alongside deleting their raw rows"""
+    for table in ('daily_workouts', 'daily_nutrition', 'daily_health'):
+        conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+
+
+def record_workout(conn, user_id, day, duration, calories):
+    """Fold one workout into its day"""
+    conn.execute('''
+        INSERT INTO daily_workouts (user_id, day, workout_count, total_minutes, total_calories)
+        VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            workout_count = workout_count + 1,
+            total_minutes = total_minutes + excluded.total_minutes,
+            total_calories = total_calories + excluded.total_calories
+    ''', (user_id, day, duration or 0, calories or 0))
+
+
+def record_meal(conn, user_id, day, calories, protein, carbs, fats):
+    """Fold one meal into its day"""
+    conn.execute('''
+        INSERT INTO daily_nutrition (user_id, day, meal_count, calories, protein, carbs, fats)
+        VALUES (?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            meal_count = meal_count + 1,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fats = fats + excluded.fats
+    ''', (user_id, day, calories or 0, protein or 0, carbs or 0, fats or 0))
+
+
+def record_health(conn, user_id, day, metrics):
+    """Fold one health check-in into its day"""
+    values = []
+    for m in HEALTH_METRICS:
+        value = metrics.get(m)
+        if value is None or (m in _ZERO_MEANS_MISSING and value == 0):
+            values += [0, 0]
+        else:
+            values += [value, 1]
+
+    columns = ', '.join(f'{m}_sum, {m}_n' for m in HEALTH_METRICS)
+    placeholders = ', '.join('?' for _ in values)
+    updates = ',\n'.join(
+        f'{m}_sum = {m}_sum + excluded.{m}_sum, {m}_n = {m}_n + excluded.{m}_n' for m in HEALTH_METRICS
+    )
+    conn.execute(f'''
+        INSERT INTO daily_health (user_id, day, entries, {columns})
+        VALUES (?, ?, 1, {placeholders})
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            entries = entries + 1,
+            {updates}
+    ''', [user_id, day] + values)
+
+
+# Chart reads: one row per day for a user since a 'YYYY-MM-DD' bound
+DAILY_WORKOUTS_SQL = '''
+    SELECT day, workout_count, total_minutes, total_calories
+    FROM daily_workouts WHERE user_id = ? AND day >= ? ORDER BY day
+'''
+
+DAILY_NUTRITION_SQL = '''
+    SELECT day, meal_count, calories, protein, carbs, fats
+    FROM daily_nutrition WHERE user_id = ? AND day >= ? ORDER BY day
+'''
+
+_HEALTH_MEANS = ', '.join(f'{m}_sum / NULLIF({m}_n, 0) AS {m}' for m in HEALTH_METRICS)
+
+DAILY_HEALTH_SQL = f'''
+    SELECT day, entries, {_HEALTH_MEANS}
+    FROM daily_health WHERE user_id = ? AND day >= ? ORDER BY day
+'''
@@ -0,0 +1,165 @@
+"""Compact store for per-second workout samples (heart rate, pace, power).
+
+Samples are resampled onto a 1 s grid and kept as fixed-point integers,
+delta-encoded and zlib-compressed in blocks of ``BLOCK_SAMPLES``. Alongside
+the 1 s series, 10 s and 1 min means are stored the same way, so a chart
+reads the finest level that fits its point budget.
+
+Reads decode straight into NumPy arrays (``frombuffer`` + ``cumsum``); no
+per-sample Python objects are created on the way to a chart.
+"""
+import math
+import zlib
+
+import startup
+
+np = startup.lazy_import('numpy')
+
+# Seconds per point at each pyramid level
+RESOLUTIONS = (1, 10, 60)
+BLOCK_SAMPLES = 3600
+
+# Fixed-point scale per channel: values are stored as round(value * scale)
+CHANNELS = {
+    'heart_rate': 10,   # bpm
+    'pace': 10,         # seconds per km
+    'power': 10,        # watts
+    'cadence': 10,      # steps or revolutions per minute
+}
+
+CHANNEL_LABELS = {
+    'heart_rate': '❤️ Heart Rate (bpm)',
+    'pace': '🏃‍♀️ Pace (sec/km)',
+    'power': '⚡ Power (W)',
+    'cadence': '🔁 Cadence (rpm)',
+}
+
+# Samples more than this long after the first are dropped
+MAX_SESSION_SECONDS = 24 * 3600
+
+
+def _encode(values, scale):
+    """Validity bitmask + int32 deltas of the fixed-point values, compressed"""
+    valid = ~np.isnan(values)
+    fixed = np.zeros(len(values), dtype=np.int64)
+    fixed[valid] = np.round(values[valid] * scale)
+    # Carry the last value across gaps so they cost nothing in the deltas
+    carried = np.maximum.accumulate(np.where(valid, np.arange(len(values)), 0))
+    fixed = fixed[carried]
+    deltas = np.diff(fixed, prepend=0).astype('<i4')
+
+    mask = np.packbits(valid)
+    padding = -len(mask) % 4  # keep the deltas 4-byte aligned
+    return zlib.compress(mask.tobytes() + b'\0' * padding + deltas.tobytes(), 6)
+
+
+def _decode(blob, count, scale):
+    raw = zlib.decompress(blob)
+    mask_bytes = math.ceil(count / 8)
+    offset = mask_bytes + (-mask_bytes % 4)
+    valid = np.unpackbits(np.frombuffer(raw, dtype=np.uint8, count=mask_bytes), count=count).astype(bool)
+    values = np.cumsum(np.frombuffer(raw, dtype='<i4', count=count, offset=offset), dtype=np.int64) / scale
+    values[~valid] = np.nan
+    return values
+
+
+def to_grid(timestamps, values):
+    """``(start_ts, per-second values)`` from irregular ``(ts, value)`` samples"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    start = int(np.floor(timestamps.min()))
+    index = np.round(timestamps - start).astype(np.int64)
+    keep = index < MAX_SESSION_SECONDS
+    grid = np.full(int(index[keep].max()) + 1, np.nan)
+    grid[index[keep]] = values[keep]
+    return start, grid
+
+
+def downsample(grid, factor):
+    """Mean of each ``factor``-sample bucket, ignoring gaps"""
+    padded = np.full(math.ceil(len(grid) / factor) * factor, np.nan)
+    padded[:len(grid)] = grid
+    buckets = padded.reshape(-1, factor)
+    counts = (~np.isnan(buckets)).sum(axis=1)
+    sums = np.nansum(buckets, axis=1)
+    means = np.full(len(buckets), np.nan)
+    np.divide(sums, counts, out=means, where=counts > 0)
+    return means
+
+
+def store(conn, workout_id, channel, timestamps, values):
+    """Replace ``channel`` for a workout with new samples (epoch seconds, values)"""
+    scale = CHANNELS[channel]
+    conn.execute('DELETE FROM workout_samples WHERE workout_id = ? AND channel = ?', (workout_id, channel))
+    if len(timestamps) == 0:
+        return
+
+    start, grid = to_grid(timestamps, values)
+    rows = []
+    for resolution in RESOLUTIONS:
+        level = grid if resolution == 1 else downsample(grid, resolution)
+        for offset in range(0, len(level), BLOCK_SAMPLES):
+            block = level[offset:offset + BLOCK_SAMPLES]
+            rows.append((workout_id, channel, resolution, start + offset * resolution, len(block),
+                         _encode(block, scale)))
+    conn.executemany('''
+        INSERT INTO workout_samples (workout_id, channel, resolution, start_ts, count, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def channels(conn, workout_id):
+    """Channels stored for a workout"""
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT channel FROM workout_samples WHERE workout_id = ? AND resolution = 1', (workout_id,))]
+
+
+def read(conn, workout_id, channel, max_points=None):
+    """``(times, values)`` NumPy arrays at the finest level with at most ``max_points``.
+
+    ``times`` is ``datetime64[s]`` (UTC); gaps are NaN. Returns ``None`` when
+    the channel has no samples.
+    """
+    counts = dict(conn.execute('''
+        SELECT resolution, SUM(count) FROM workout_samples
+        WHERE workout_id = ? AND channel = ? GROUP BY resolution
+    ''', (workout_id, channel)).fetchall())
+    if not counts:
+        return None
+    resolution = next((r for r in RESOLUTIONS if max_points is None or counts.get(r, 0) <= max_points),
+                      max(counts))
+
+    scale = CHANNELS[channel]
+    blocks = conn.execute('''
+        SELECT start_ts, count, data FROM workout_samples
+        WHERE workout_id = ? AND channel = ? AND resolution = ?
+        ORDER BY start_ts
+    ''', (workout_id, channel, resolution)).fetchall()
+    values = np.concatenate([_decode(data, count, scale) for _, count, data in blocks])
+    start = blocks[0][0]
+    times = (start + np.arange(len(values), dtype=np.int64) * resolution).astype('datetime64[s]')
+    return times, values
+
+
+def sampled_workouts(conn, user_id, limit=50):
+    """``(id, date, exercise)`` of the user's most recent workouts that have samples"""
+    return conn.execute('''
+        SELECT id, date, exercise FROM workouts
+        WHERE user_id = ? AND EXISTS (SELECT 1 FROM workout_samples WHERE workout_id = workouts.id)
+        ORDER BY ts DESC
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+def iter_samples(conn, user_id):
+    """Yield ``(workout_id, channel, epoch_seconds, values)`` per stored 1 s block, gaps dropped"""
+    rows = conn.execute('''
+        SELECT s.workout_id, s.channel, s.start_ts, s.count, s.data
+        FROM workout_samples s JOIN workouts w ON w.id = s.workout_id
+        WHERE w.user_id = ? AND s.resolution = 1
+        ORDER BY s.workout_id, s.channel, s.start_ts
+    ''', (user_id,))
+    for workout_id, channel, start, count, data in rows:
+        values = _decode(data, count, CHANNELS[channel])
+        valid = ~np.isnan(values)
+        yield workout_id, channel, start + np.flatnonzero(valid), values[valid]
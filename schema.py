@@ -0,0 +1,391 @@
+"""Database schema and migrations for Elle.
+
+Each entry in ``MIGRATIONS`` runs exactly once per database file; progress is
+tracked in SQLite's ``PRAGMA user_version``, so existing ``elle_complete.db``
+files are brought up to date in place the next time the app starts.
+
+Once released, a migration must keep doing exactly what it did, so each
+one carries its own SQL instead of calling the modules that own its
+tables: those change with the app, and a database's history would then
+depend on when it was created.
+"""
+from datetime import date, datetime, time, timedelta
+
+
+
+def _create_base_tables(conn):
+    """Original single-user tables"""
+    # Workouts table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS workouts (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            exercise TEXT,
+            duration INTEGER,
+            calories INTEGER,
+            intensity TEXT,
+            mood_before TEXT,
+            mood_after TEXT,
+            notes TEXT,
+            heart_rate_avg INTEGER,
+            form_score REAL
+        )
+    ''')
+
+    # Nutrition table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS nutrition (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            meal_type TEXT,
+            food_items TEXT,
+            calories INTEGER,
+            protein REAL,
+            carbs REAL,
+            fats REAL,
+            fiber REAL,
+            sugar REAL,
+            sodium REAL,
+            analysis TEXT,
+            photo_path TEXT
+        )
+    ''')
+
+    # User profile
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_profile (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            age INTEGER,
+            gender TEXT,
+            height REAL,
+            weight REAL,
+            activity_level TEXT,
+            fitness_goals TEXT,
+            dietary_restrictions TEXT,
+            medical_conditions TEXT,
+            preferences TEXT,
+            created_date TEXT,
+            updated_date TEXT
+        )
+    ''')
+
+    # Health metrics
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS health_metrics (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            weight REAL,
+            body_fat_percentage REAL,
+            muscle_mass REAL,
+            resting_heart_rate INTEGER,
+            blood_pressure_systolic INTEGER,
+            blood_pressure_diastolic INTEGER,
+            sleep_hours REAL,
+            stress_level INTEGER,
+            energy_level INTEGER,
+            hydration_glasses INTEGER
+        )
+    ''')
+
+    # Goals and achievements
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY,
+            goal_type TEXT,
+            description TEXT,
+            target_value REAL,
+            current_value REAL,
+            target_date TEXT,
+            status TEXT,
+            created_date TEXT
+        )
+    ''')
+
+    # Social features
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS challenges (
+            id INTEGER PRIMARY KEY,
+            challenge_name TEXT,
+            challenge_type TEXT,
+            description TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            participants TEXT,
+            progress TEXT,
+            status TEXT
+        )
+    ''')
+
+
+# Tables whose rows are filtered by time
+TIMESERIES_TABLES = ('workouts', 'nutrition', 'health_metrics')
+
+
+def _add_epoch_timestamps(conn):
+    """Indexed integer ``ts`` (epoch seconds) next to the ISO ``date`` text"""
+    for table in TIMESERIES_TABLES:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN ts INTEGER')
+        # 'utc' converts the naive local-time ISO strings to true epoch seconds
+        conn.execute(f'''
+            UPDATE {table} SET ts = CAST(strftime('%s', date, 'utc') AS INTEGER)
+            WHERE ts IS NULL AND date IS NOT NULL
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)')
+
+
+# Rollup layout as of migration 3; health metrics keep a running sum and count
+_ROLLUP_METRICS = ('weight', 'resting_heart_rate', 'sleep_hours',
+                   'stress_level', 'energy_level', 'hydration_glasses')
+_ROLLUP_COLUMNS = {
+    'daily_workouts': '''
+        workout_count INTEGER NOT NULL DEFAULT 0,
+        total_minutes INTEGER NOT NULL DEFAULT 0,
+        total_calories INTEGER NOT NULL DEFAULT 0
+    ''',
+    'daily_nutrition': '''
+        meal_count INTEGER NOT NULL DEFAULT 0,
+        calories INTEGER NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        fats REAL NOT NULL DEFAULT 0
+    ''',
+    'daily_health': 'entries INTEGER NOT NULL DEFAULT 0, ' + ', '.join(
+        f'{m}_sum REAL NOT NULL DEFAULT 0, {m}_n INTEGER NOT NULL DEFAULT 0' for m in _ROLLUP_METRICS),
+}
+
+
+def _rollup_metric(metric):
+    # Weight and resting heart rate were entered as 0 when left blank
+    return f'NULLIF({metric}, 0)' if metric in ('weight', 'resting_heart_rate') else metric
+
+
+def _add_daily_rollups(conn):
+    """Per-day aggregate tables, backfilled from existing history"""
+    for table, columns in _ROLLUP_COLUMNS.items():
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (day TEXT PRIMARY KEY, {columns})')
+
+    conn.execute('''
+        INSERT INTO daily_workouts (day, workout_count, total_minutes, total_calories)
+        SELECT substr(date, 1, 10), COUNT(*), COALESCE(SUM(duration), 0), COALESCE(SUM(calories), 0)
+        FROM workouts WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 10)
+    ''')
+    conn.execute('''
+        INSERT INTO daily_nutrition (day, meal_count, calories, protein, carbs, fats)
+        SELECT substr(date, 1, 10), COUNT(*), COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0),
+               COALESCE(SUM(carbs), 0), COALESCE(SUM(fats), 0)
+        FROM nutrition WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 10)
+    ''')
+    columns = ', '.join(f'{m}_sum, {m}_n' for m in _ROLLUP_METRICS)
+    aggregates = ', '.join(
+        f'COALESCE(SUM({_rollup_metric(m)}), 0), COUNT({_rollup_metric(m)})' for m in _ROLLUP_METRICS
+    )
+    conn.execute(f'''
+        INSERT INTO daily_health (day, entries, {columns})
+        SELECT substr(date, 1, 10), COUNT(*), {aggregates}
+        FROM health_metrics WHERE date IS NOT NULL
+        GROUP BY substr(date, 1, 10)
+    ''')
+
+
+# Every row belongs to a user; rows written before accounts existed go here
+DEFAULT_USER = 'default'
+
+USER_TABLES = TIMESERIES_TABLES + ('goals', 'challenges', 'user_profile')
+
+
+def _add_user_dimension(conn):
+    """``user_id`` on every table, with ``(user_id, ts)`` composite indexes"""
+    for table in USER_TABLES:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+
+    # Every time filter is now scoped to one user, so user_id leads the index
+    for table in TIMESERIES_TABLES:
+        conn.execute(f'DROP INDEX IF EXISTS idx_{table}_ts')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table} (user_id, ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_goals_user_status ON goals (user_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_challenges_user ON challenges (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_profile_user ON user_profile (user_id)')
+
+    # The rollups are keyed by user too; every existing day belongs to the default user
+    for table, columns in _ROLLUP_COLUMNS.items():
+        conn.execute(f'ALTER TABLE {table} RENAME TO {table}_unkeyed')
+        conn.execute(f'''
+            CREATE TABLE {table} (user_id TEXT NOT NULL, day TEXT NOT NULL, {columns},
+                                  PRIMARY KEY (user_id, day))
+        ''')
+        conn.execute(f"INSERT INTO {table} SELECT '{DEFAULT_USER}', * FROM {table}_unkeyed")
+        conn.execute(f'DROP TABLE {table}_unkeyed')
+
+
+# Tables that imported rows land in
+IMPORT_TABLES = ('workouts', 'health_metrics')
+
+
+def _add_import_sources(conn):
+    """``(source, source_id)`` on imported rows, unique per user"""
+    for table in IMPORT_TABLES:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN source TEXT')
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN source_id TEXT')
+        # Partial, so hand-entered rows (no source_id) are never considered duplicates
+        conn.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_source
+            ON {table} (user_id, source, source_id) WHERE source_id IS NOT NULL
+        ''')
+
+
+def _add_workout_samples(conn):
+    """Compressed per-second sample blocks keyed by workout"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS workout_samples (
+            workout_id INTEGER NOT NULL REFERENCES workouts (id) ON DELETE CASCADE,
+            channel TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            start_ts INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (workout_id, channel, resolution, start_ts)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_data_versions(conn):
+    """Change counters that cached reads are keyed on"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, table_name)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_chat_history(conn):
+    """Stored AI Coach messages and their rolling summary"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_id, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            user_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            through_id INTEGER NOT NULL
+        )
+    ''')
+
+
+# Goal types as of migration 9: what each counts, matching exercise keywords, and
+# for weight goals whether a loss (+1) or a gain (-1) is progress
+_STRENGTH_WORDS = ('strength', 'weight', 'lift', 'resistance', 'dumbbell', 'barbell', 'kettlebell',
+                   'squat', 'deadlift', 'bench', 'press', 'push-up', 'pull-up', 'calisthenics', 'crossfit')
+_FLEXIBILITY_WORDS = ('yoga', 'stretch', 'pilates', 'mobility', 'flexibility', 'tai chi', 'barre')
+_GOAL_MEASURES = {
+    'Weight Loss': ('weight', None, 1),
+    'Weight Gain': ('weight', None, -1),
+    'Muscle Building': ('minutes', _STRENGTH_WORDS, 0),
+    'Endurance': ('minutes', None, 0),
+    'Strength': ('sessions', _STRENGTH_WORDS, 0),
+    'Flexibility': ('minutes', _FLEXIBILITY_WORDS, 0),
+    'Habit Building': ('active_days', None, 0),
+}
+_GOAL_AMOUNTS = {'minutes': 'COALESCE(SUM(duration), 0)', 'sessions': 'COUNT(*)',
+                 'active_days': 'COUNT(DISTINCT substr(date, 1, 10))'}
+
+
+def _add_goal_progress(conn):
+    """Columns for incrementally tracked goals, then catch existing active goals up"""
+    conn.execute('ALTER TABLE goals ADD COLUMN baseline_value REAL')
+    conn.execute('ALTER TABLE goals ADD COLUMN measured_day TEXT')
+    conn.execute('ALTER TABLE goals ADD COLUMN completed_date TEXT')
+
+    goals = conn.execute('''
+        SELECT id, user_id, goal_type, created_date, target_date, target_value
+        FROM goals WHERE status = 'Active'
+    ''').fetchall()
+    for goal_id, user_id, goal_type, created_date, target_date, target_value in goals:
+        if goal_type not in _GOAL_MEASURES or not created_date:
+            continue
+        source, keywords, sign = _GOAL_MEASURES[goal_type]
+        window = (user_id, created_date[:10], target_date or '9999-12-31')
+
+        baseline = measured_day = None
+        if source == 'weight':
+            before = conn.execute('''
+                SELECT weight FROM health_metrics
+                WHERE user_id = ? AND weight > 0 AND date <= ? ORDER BY ts DESC LIMIT 1
+            ''', (user_id, created_date)).fetchone()
+            readings = conn.execute('''
+                SELECT weight, substr(date, 1, 10) FROM health_metrics
+                WHERE user_id = ? AND weight > 0 AND substr(date, 1, 10) BETWEEN ? AND ? ORDER BY ts
+            ''', window).fetchall()
+            baseline = before[0] if before else readings[0][0] if readings else None
+            weight, measured_day = readings[-1] if readings else (baseline, None)
+            current = sign * (baseline - weight) if baseline is not None else 0
+            last_day = measured_day
+        else:
+            matches = '1'
+            if keywords is not None:
+                matches = '(' + ' OR '.join(f"lower(exercise) LIKE '%{k}%'" for k in keywords) + ')'
+            current, last_day = conn.execute(f'''
+                SELECT {_GOAL_AMOUNTS[source]}, MAX(substr(date, 1, 10)) FROM workouts
+                WHERE user_id = ? AND substr(date, 1, 10) BETWEEN ? AND ? AND {matches}
+            ''', window).fetchone()
+
+        completed = bool(target_value) and target_value > 0 and current >= target_value
+        conn.execute('''
+            UPDATE goals SET current_value = ?, baseline_value = ?, measured_day = ?, status = ?, completed_date = ?
+            WHERE id = ?
+        ''', (current, baseline, measured_day, 'Completed' if completed else 'Active',
+              last_day if completed else None, goal_id))
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_epoch_timestamps,
+    _add_daily_rollups,
+    _add_user_dimension,
+    _add_import_sources,
+    _add_workout_samples,
+    _add_data_versions,
+    _add_chat_history,
+    _add_goal_progress,
+]
+
+
+def migrate(conn):
+    """Apply pending migrations; call inside a write transaction"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+    return len(MIGRATIONS) - version
+
+
+def now_stamp():
+    """``(iso_date, epoch_ts)`` pair for a row written now"""
+    now = datetime.now()
+    return now.isoformat(), int(now.timestamp())
+
+
+def days_ago_ts(days):
+    """Epoch seconds at local midnight ``days`` days before today"""
+    start = datetime.combine(date.today() - timedelta(days=days), time.min)
+    return int(start.timestamp())
+
+
+def days_ago_day(days):
+    """``YYYY-MM-DD`` key of the local day ``days`` days before today"""
+    return (date.today() - timedelta(days=days)).isoformat()
+
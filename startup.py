@@ -0,0 +1,64 @@
+"""Startup instrumentation and deferred imports.
+
+Heavy libraries are wrapped in ``lazy_import`` proxies so they load on
+first use - after the header has rendered - instead of before the first
+pixel. Every deferred import and ``timed`` block is recorded, process-wide,
+for the startup panel in the sidebar.
+"""
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_START = time.perf_counter()
+
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def record(label, seconds):
+    """Keep the first measurement for ``label``; later reruns hit warm caches"""
+    with _timings_lock:
+        _timings.setdefault(label, seconds)
+
+
+@contextmanager
+def timed(label):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(label, time.perf_counter() - started)
+
+
+def timings():
+    """``{label: seconds}`` in the order they were first measured"""
+    with _timings_lock:
+        return dict(_timings)
+
+
+class LazyModule:
+    """Stand-in that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                with timed(f"import {self._name}"):
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -0,0 +1,202 @@
+"""Token streaming for long generations.
+
+``stream_text`` turns a streamed chat completion into plain text deltas and
+records time-to-first-token; ``parse_partial_json`` turns a half-finished
+JSON reply into the largest valid object seen so far, so structured plans
+can render while they are still being written.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+
+class StreamMetrics:
+    """Timings for one streamed generation"""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.chunks = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def ttft(self):
+        """Seconds until the first token, or None if nothing arrived"""
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def total(self):
+        return None if self.finished is None else self.finished - self.started
+
+    def summary(self):
+        if self.ttft is None:
+            return "No response received"
+        return f"First token in {self.ttft:.2f}s · full reply in {self.total or 0:.1f}s"
+
+
+class Generation:
+    """How one reply was served: from the cache or streamed, and its parsed result"""
+
+    __slots__ = ('from_cache', 'metrics', 'parsed')
+
+    def __init__(self, label):
+        self.from_cache = False
+        self.metrics = StreamMetrics(label)
+        self.parsed = None
+
+    def summary(self):
+        if self.from_cache:
+            return "Served instantly from Elle's saved plans"
+        return self.metrics.summary()
+
+
+# Recent generations across the process, for the latency readout
+_recent = deque(maxlen=200)
+_recent_lock = threading.Lock()
+
+
+def record(metrics):
+    with _recent_lock:
+        _recent.append(metrics)
+
+
+def latency_report():
+    """Median time-to-first-token and total time per label"""
+    with _recent_lock:
+        finished = [m for m in _recent if m.ttft is not None and m.total is not None]
+
+    report = {}
+    for label in sorted({m.label for m in finished}):
+        samples = [m for m in finished if m.label == label]
+        ttfts = sorted(m.ttft for m in samples)
+        totals = sorted(m.total for m in samples)
+        report[label] = {
+            'count': len(samples),
+            'median_ttft': ttfts[len(ttfts) // 2],
+            'median_total': totals[len(totals) // 2],
+        }
+    return report
+
+
+def stream_text(stream, metrics):
+    """Yield text deltas from a streamed chat completion, timing them in ``metrics``"""
+    try:
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                metrics.prompt_tokens = chunk.usage.prompt_tokens
+                metrics.completion_tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                metrics.mark_token()
+                yield delta
+    finally:
+        metrics.finish()
+        record(metrics)
+
+
+_CLOSERS = {'{': '}', '[': ']'}
+SAFE_POINTS_KEPT = 8
+
+
+class PartialJSONParser:
+    """Incremental ``parse_partial_json``: each character is scanned once.
+
+    ``feed`` text as it streams in; ``value()`` returns the best parse of
+    everything so far. ``complete`` turns true when the top-level object
+    or array has closed.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.complete = False
+        self._start = None
+        self._end = None
+        self._scanned = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        # (end offset, closers) at which the document can be cut cleanly
+        self._safe_points = deque(maxlen=SAFE_POINTS_KEPT)
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self._start is None:
+            starts = [i for i in (self.text.find('{', self._scanned), self.text.find('[', self._scanned)) if i != -1]
+            if not starts:
+                self._scanned = len(self.text)
+                return self
+            self._start = self._scanned = min(starts)
+        if not self.complete:
+            self._scan()
+        return self
+
+    def _scan(self):
+        stack = self._stack
+        for i in range(self._scanned, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                stack.append(_CLOSERS[char])
+                self._safe_points.append((i + 1, ''.join(reversed(stack))))
+            elif char in '}]':
+                if not stack:
+                    self._end, self.complete = i, True
+                    break
+                stack.pop()
+                self._safe_points.append((i + 1, ''.join(reversed(stack))))
+                if not stack:
+                    self._end, self.complete = i + 1, True
+                    break
+            elif char == ',':
+                self._safe_points.append((i, ''.join(reversed(stack))))
+        self._scanned = len(self.text) if self._end is None else self._end
+
+    def value(self):
+        """The largest valid document seen so far, or ``None``"""
+        if self._start is None:
+            return None
+        tail = '' if self.complete else ('"' if self._in_string else '') + ''.join(reversed(self._stack))
+        candidates = [self.text[self._start:self._end] + tail]
+        candidates += [self.text[self._start:end] + closers for end, closers in reversed(self._safe_points)]
+
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                continue
+        return None
+
+
+def parse_partial_json(text):
+    """Best-effort parse of a JSON document that may still be streaming.
+
+    Skips any leading prose or code fence, then closes whatever strings,
+    objects and arrays are still open. If the tail ends mid-key or mid-token,
+    falls back to the last point where a value had just completed. Returns
+    ``None`` when nothing usable has arrived yet.
+    """
+    return PartialJSONParser().feed(text).value()
@@ -0,0 +1,287 @@
+"""Typed parsing of JSON replies: food analyses, workout plans, meal plans.
+
+Replies are requested in JSON mode, then read tolerantly: code fences and
+prose around the object are skipped, and a reply cut off by ``max_tokens``
+is closed at the last complete value (``streaming.PartialJSONParser``).
+Each schema is a ``Model`` whose ``FIELDS`` coerce values to the expected
+types ("450 kcal" becomes 450) and report the required fields that are
+absent. Those, and only those, are what a follow-up request asks for -
+usually a few dozen tokens instead of paying for the whole reply again.
+"""
+import json
+import re
+import threading
+from collections import Counter, defaultdict
+
+import streaming
+
+MAX_REASKS = 2
+REASK_MAX_TOKENS = 600
+REASK_MODEL_CONTEXT = 6000   # characters of the partial reply sent back with a re-ask
+
+# Five meals a day don't fit in a flat budget; what still doesn't fit is re-asked for
+MEAL_PLAN_TOKENS_PER_DAY = 400
+MEAL_PLAN_MAX_TOKENS = 4000
+
+# Models that accept response_format={"type": "json_object"}
+JSON_MODE_MODELS = ('gpt-4o', 'gpt-4o-mini', 'gpt-4-turbo')
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _number(value, kind):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return kind(value)
+    if isinstance(value, str):
+        match = _NUMBER.search(value.replace(',', ''))
+        if match:
+            return kind(float(match.group()))
+    return None
+
+
+class Model:
+    """A JSON object schema: ``FIELDS`` is ``(name, kind, required)`` triples.
+
+    ``kind`` is ``int``, ``float``, ``str``, ``dict`` (kept as is),
+    another ``Model`` subclass, or a one-element list of any of these for
+    an array of them.
+    """
+
+    FIELDS = ()
+
+    @classmethod
+    def validate(cls, value, path=''):
+        """``(data, missing)``: ``value`` coerced to the schema, and the required paths it lacked"""
+        value = value if isinstance(value, dict) else {}
+        data, missing = {}, []
+        for name, kind, required in cls.FIELDS:
+            field_path = f"{path}{name}"
+            coerced, absent = _coerce(value.get(name), kind, field_path)
+            data[name] = coerced
+            if required:
+                missing += absent
+        return data, missing
+
+    @classmethod
+    def example(cls):
+        """A skeleton of the schema, for prompts"""
+        return {name: _example(kind) for name, kind, _ in cls.FIELDS}
+
+    @classmethod
+    def schema_prompt(cls):
+        return "Reply with a single JSON object shaped exactly like this:\n" + json.dumps(cls.example(), indent=1)
+
+
+def _coerce(value, kind, path):
+    """``(value, missing_paths)`` for one field"""
+    if isinstance(kind, list):
+        item_kind = kind[0]
+        items = value if isinstance(value, list) else ([value] if isinstance(value, (str, dict)) and value else [])
+        kept, missing = [], []
+        for index, item in enumerate(items):
+            coerced, absent = _coerce(item, item_kind, f"{path}[{index}]")
+            # An array item without its own required fields is dropped, not re-asked for
+            if not absent:
+                kept.append(coerced)
+        if not kept:
+            missing.append(path)
+        return kept, missing
+    if isinstance(kind, type) and issubclass(kind, Model):
+        data, missing = kind.validate(value, f"{path}.")
+        return data, ([path] if value is None else missing)
+    if kind in (int, float):
+        number = _number(value, kind)
+        return (kind(0), [path]) if number is None else (number, [])
+    if kind is dict:
+        return (value, []) if isinstance(value, dict) else ({}, [path])
+    if value is None or value == '':
+        return '', [path]
+    return (value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)), []
+
+
+def _example(kind):
+    if isinstance(kind, list):
+        return [_example(kind[0])]
+    if isinstance(kind, type) and issubclass(kind, Model):
+        return kind.example()
+    return {int: 0, float: 0.0, str: "string", dict: {}}[kind]
+
+
+class Macros(Model):
+    FIELDS = (
+        ('protein', float, True),
+        ('carbs', float, True),
+        ('fats', float, True),
+        ('fiber', float, False),
+        ('sugar', float, False),
+        ('sodium', float, False),
+    )
+
+
+class FoodAnalysis(Model):
+    FIELDS = (
+        ('food_items', [str], True),
+        ('portion_estimates', [str], False),
+        ('total_calories', int, True),
+        ('macros', Macros, True),
+        ('micronutrients', dict, False),
+        ('health_score', float, False),
+        ('meal_timing_advice', str, False),
+        ('alternatives', [str], False),
+        ('elle_analysis', str, False),
+        ('cooking_tips', [str], False),
+        ('pairing_suggestions', [str], False),
+    )
+    # Re-asks without these in the reply need the photo again
+    NEEDS_INPUT = ('food_items',)
+
+
+class Exercise(Model):
+    FIELDS = (
+        ('name', str, True),
+        ('sets', int, False),
+        ('reps', str, False),
+        ('rest', str, False),
+        ('instructions', str, False),
+        ('modifications', str, False),
+    )
+
+
+class WorkoutPlan(Model):
+    FIELDS = (
+        ('exercises', [Exercise], True),
+        ('warm_up', [str], False),
+        ('cool_down', [str], False),
+        ('safety_notes', [str], False),
+        ('progression', str, False),
+    )
+
+
+class Meal(Model):
+    FIELDS = (
+        ('meal', str, True),
+        ('name', str, True),
+        ('calories', int, False),
+        ('protein', float, False),
+        ('carbs', float, False),
+        ('fats', float, False),
+        ('prep_time', str, False),
+        ('recipe', str, False),
+    )
+
+
+class MealDay(Model):
+    FIELDS = (
+        ('day', str, True),
+        ('meals', [Meal], True),
+    )
+
+
+class MealPlan(Model):
+    FIELDS = (
+        ('days', [MealDay], True),
+        ('shopping_list', [str], False),
+        ('notes', str, False),
+    )
+
+
+class Parsed:
+    """A reply read against a schema"""
+
+    __slots__ = ('data', 'missing', 'repaired', 'raw')
+
+    def __init__(self, data, missing, repaired, raw):
+        self.data = data
+        self.missing = missing
+        self.repaired = repaired  # cut off or wrapped, and patched up to parse
+        self.raw = raw
+
+    @property
+    def ok(self):
+        return self.data is not None and not self.missing
+
+
+def extract(text):
+    """``(value, repaired)``: the JSON value in ``text``, or ``(None, False)``"""
+    text = text or ''
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    parser = streaming.PartialJSONParser().feed(text)
+    value = parser.value()
+    return value, value is not None
+
+
+def parse(text, model, expected=None):
+    """Read ``text`` as ``model``; ``expected`` maps list fields to how many items they should hold"""
+    value, repaired = extract(text)
+    if not isinstance(value, dict):
+        return Parsed(None, [], repaired, text)
+    data, missing = model.validate(value)
+    for name, count in (expected or {}).items():
+        have = len(data.get(name) or [])
+        if name not in missing and have < count:
+            missing.append(f"{name}[{have}:{count}]")
+    return Parsed(data, missing, repaired, text)
+
+
+def reask_messages(messages, parsed, model, keep_images=None):
+    """Follow-up asking for just ``parsed.missing``, continuing the original conversation"""
+    if keep_images is None:
+        keep_images = any(path.split('.')[0].split('[')[0] in getattr(model, 'NEEDS_INPUT', ())
+                          for path in parsed.missing)
+    history = []
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list) and not keep_images:
+            content = ' '.join(part.get('text', '') for part in content if part.get('type') == 'text')
+        history.append(dict(message, content=content))
+    partial = json.dumps(parsed.data)[:REASK_MODEL_CONTEXT]
+    return history + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": (
+            "That reply was cut off or incomplete. Reply with a JSON object holding only these "
+            f"fields, consistent with the reply above: {', '.join(parsed.missing)}. For a range like "
+            "days[3:7], return the array with just those items. Use the same structure as before:\n"
+            + json.dumps(model.example()))},
+    ]
+
+
+def merge(data, extra):
+    """``extra`` folded into ``data``: objects merge, arrays append, blanks are filled"""
+    merged = dict(data)
+    for name, value in (extra or {}).items():
+        current = merged.get(name)
+        if isinstance(current, dict) and isinstance(value, dict):
+            merged[name] = merge(current, value)
+        elif isinstance(current, list) and isinstance(value, list):
+            merged[name] = current + value
+        elif current in (None, '', 0, [], {}):
+            merged[name] = value
+    return merged
+
+
+def json_mode(request):
+    """``request`` with JSON mode switched on where the model supports it"""
+    if request['model'] in JSON_MODE_MODELS:
+        return dict(request, response_format={"type": "json_object"})
+    return request
+
+
+# Outcomes per label, for the response speed readout
+_outcomes = defaultdict(Counter)
+_outcomes_lock = threading.Lock()
+
+
+def record(label, outcome):
+    """``outcome``: ``'clean'``, ``'repaired'``, ``'reasked'``, ``'partial'`` or ``'failed'``"""
+    with _outcomes_lock:
+        _outcomes[label][outcome] += 1
+
+
+def stats():
+    with _outcomes_lock:
+        return {label: dict(counts) for label, counts in _outcomes.items()}
@@ -0,0 +1,21 @@
+"""Per-user, per-table change counters.
+
+Every write path calls ``bump`` inside its own transaction, so a reader can
+tell whether a table changed with one primary-key lookup instead of
+re-running its queries. Cached reads and figures are keyed on these
+counters.
+"""
+
+
+def bump(conn, user_id, *tables):
+    """Mark ``tables`` as changed for ``user_id``; call in the writing transaction"""
+    conn.executemany('''
+        INSERT INTO data_versions (user_id, table_name, version) VALUES (?, ?, 1)
+        ON CONFLICT (user_id, table_name) DO UPDATE SET version = version + 1
+    ''', [(user_id, table) for table in tables])
+
+
+def current(conn, user_id, tables):
+    """``(version, ...)`` in the order of ``tables``; 0 for a table never written"""
+    known = dict(conn.execute('SELECT table_name, version FROM data_versions WHERE user_id = ?', (user_id,)))
+    return tuple(known.get(table, 0) for table in tables)
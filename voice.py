@@ -0,0 +1,650 @@
+"""Elle's voice: a background speech-in, speech-out pipeline.
+
+Audio is captured in ``FRAME_MS`` frames on a capture thread and handed
+to a worker thread, which:
+
+* when a wake word detector is given, sleeps until it hears "Hey Elle"
+  and then listens for one request (see ``wakeword``)
+* detects speech with a VAD (webrtcvad when installed, otherwise an
+  energy gate over an adaptive noise floor) and ends the utterance after
+  ``END_SILENCE_MS`` of silence
+* feeds frames to an offline recognizer while the user is still talking
+  (Vosk decodes incrementally; Whisper decodes the utterance at the end)
+* streams the reply and passes each finished sentence to a speaker
+  thread, so TTS starts before the whole reply has been written
+* ignores the microphone while Elle is speaking and for
+  ``ECHO_HANGOVER_MS`` after, so her reply isn't heard as a new request
+
+Nothing touches ``st``; the Streamlit script polls ``turns()`` and
+``latency_report()``. Nothing here is imported or initialized until a
+voice feature is used - loading models and enumerating devices takes far
+longer than rendering the page.
+"""
+import json
+import os
+import queue
+import re
+import threading
+import time
+import wave
+from collections import deque
+
+import startup
+import wakeword
+
+np = startup.lazy_import('numpy')
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# Endpointing
+START_FRAMES = 3          # consecutive voiced frames that open an utterance
+PRE_ROLL_FRAMES = 10      # kept from before the opening so the first syllable survives
+END_SILENCE_MS = 600
+MAX_UTTERANCE_MS = 15000
+FOLLOW_UP_MS = 5000       # after the wake word, how long to wait for the request
+
+# Energy gate, used without webrtcvad
+MIN_SPEECH_RMS = 300
+SPEECH_TO_NOISE = 3.0
+NOISE_ALPHA = 0.05
+WEBRTC_AGGRESSIVENESS = 2
+
+# Offline recognizers in order of preference; the first that loads is used
+RECOGNIZERS = ('vosk', 'faster_whisper', 'sphinx')
+WHISPER_MODEL = 'base.en'
+
+TTS_RATE = 175
+TTS_VOLUME = 0.9
+ECHO_HANGOVER_MS = 300    # room echo and device latency after playback ends
+
+MAX_QUEUED_FRAMES = 60 * 1000 // FRAME_MS  # a minute of audio behind a slow reply
+RECENT_TURNS = 50
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+_webrtcvad_module = None
+
+
+def _webrtcvad():
+    """The webrtcvad module, or ``None`` when it isn't installed"""
+    global _webrtcvad_module
+    if _webrtcvad_module is None:
+        try:
+            import webrtcvad
+            _webrtcvad_module = webrtcvad
+        except ImportError:  # fall back to the energy gate
+            _webrtcvad_module = False
+    return _webrtcvad_module or None
+
+
+def rms(frame):
+    samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+
+class VoiceActivityDetector:
+    """Per-frame speech/non-speech decision"""
+
+    def __init__(self):
+        webrtcvad = _webrtcvad()
+        self._vad = webrtcvad.Vad(WEBRTC_AGGRESSIVENESS) if webrtcvad else None
+        self.kind = 'webrtcvad' if self._vad else 'energy'
+        self.noise_floor = None
+
+    def is_speech(self, frame):
+        if self._vad is not None:
+            return self._vad.is_speech(frame, SAMPLE_RATE)
+        level = rms(frame)
+        if self.noise_floor is None:
+            self.noise_floor = level
+        speech = level >= max(MIN_SPEECH_RMS, self.noise_floor * SPEECH_TO_NOISE)
+        if not speech:
+            # Only silence moves the floor, so a long sentence can't raise it
+            self.noise_floor += NOISE_ALPHA * (level - self.noise_floor)
+        return speech
+
+
+class Endpointer:
+    """Groups frames into utterances: opens on sustained speech, closes on silence"""
+
+    def __init__(self, vad=None):
+        self.vad = vad or VoiceActivityDetector()
+        self._pre_roll = deque(maxlen=PRE_ROLL_FRAMES)
+        self._voiced_run = 0
+        self._silent_frames = 0
+        self.frames = None
+        self.last_voice = None
+
+    @property
+    def active(self):
+        return self.frames is not None
+
+    def feed(self, frame, at):
+        """``'start'``, ``'continue'`` or ``'end'`` while in an utterance, else ``None``"""
+        speech = self.vad.is_speech(frame)
+        if not self.active:
+            self._pre_roll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if speech else 0
+            if self._voiced_run < START_FRAMES:
+                return None
+            self.frames = list(self._pre_roll)
+            self._pre_roll.clear()
+            self._silent_frames = 0
+            self.last_voice = at
+            return 'start'
+
+        self.frames.append(frame)
+        if speech:
+            self._silent_frames = 0
+            self.last_voice = at
+        else:
+            self._silent_frames += 1
+        if (self._silent_frames * FRAME_MS >= END_SILENCE_MS
+                or len(self.frames) * FRAME_MS >= MAX_UTTERANCE_MS):
+            return 'end'
+        return 'continue'
+
+    def take(self):
+        """The finished utterance's frames; resets for the next one"""
+        frames, self.frames = self.frames, None
+        self._voiced_run = 0
+        return frames
+
+    def reset(self):
+        """Drop any partial utterance and the pre-roll"""
+        self._pre_roll.clear()
+        self.take()
+
+
+class VoskRecognizer:
+    """Streaming Kaldi decoder; most of the work happens while the user talks"""
+
+    name = 'vosk'
+
+    def __init__(self, model_path=None):
+        import speech_recognition
+        import vosk
+
+        model_path = model_path or os.environ.get('VOSK_MODEL') or os.path.join(
+            os.path.dirname(speech_recognition.__file__), 'models', 'vosk')  # `sprc download vosk`
+        if not os.path.isdir(model_path):
+            raise FileNotFoundError(f"No Vosk model at {model_path}")
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self._model = vosk.Model(model_path)
+        self._decoder = None
+
+    def start(self):
+        self._decoder = self._vosk.KaldiRecognizer(self._model, SAMPLE_RATE)
+
+    def feed(self, frame):
+        self._decoder.AcceptWaveform(frame)
+
+    def finish(self):
+        return json.loads(self._decoder.FinalResult()).get('text', '')
+
+
+class BufferedRecognizer:
+    """Collects the utterance and decodes it once it ends"""
+
+    def start(self):
+        self._frames = []
+
+    def feed(self, frame):
+        self._frames.append(frame)
+
+    def finish(self):
+        return self.decode(b''.join(self._frames))
+
+
+class WhisperRecognizer(BufferedRecognizer):
+    """faster-whisper (CTranslate2), model loaded once"""
+
+    name = 'faster_whisper'
+
+    def __init__(self, model=WHISPER_MODEL):
+        from faster_whisper import WhisperModel
+        self._model = WhisperModel(model, device='cpu', compute_type='int8')
+
+    def decode(self, pcm):
+        audio = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768
+        segments, _ = self._model.transcribe(audio, language='en', beam_size=1, vad_filter=False)
+        return ' '.join(segment.text.strip() for segment in segments)
+
+
+class SphinxRecognizer(BufferedRecognizer):
+    """CMU PocketSphinx through speech_recognition's local backend"""
+
+    name = 'sphinx'
+
+    def __init__(self):
+        import pocketsphinx  # noqa: F401 - fail here rather than on the first utterance
+        import speech_recognition as sr
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+
+    def decode(self, pcm):
+        try:
+            return self._recognizer.recognize_sphinx(self._sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH))
+        except self._sr.UnknownValueError:
+            return ''
+
+
+_RECOGNIZER_CLASSES = {'vosk': VoskRecognizer, 'faster_whisper': WhisperRecognizer, 'sphinx': SphinxRecognizer}
+
+
+def load_recognizer(preference=RECOGNIZERS):
+    """``(recognizer, errors)``; ``recognizer`` is ``None`` when none of them loads"""
+    errors = {}
+    for name in preference:
+        try:
+            with startup.timed(f"load {name}"):
+                return _RECOGNIZER_CLASSES[name](), errors
+        except Exception as e:
+            errors[name] = e
+    return None, errors
+
+
+class MicrophoneSource:
+    """Frames from the default input device"""
+
+    def __init__(self):
+        import speech_recognition as sr
+        self._microphone = sr.Microphone(sample_rate=SAMPLE_RATE, chunk_size=FRAME_SAMPLES)
+        self._stream = None
+
+    def open(self):
+        self._stream = self._microphone.__enter__().stream
+
+    def read(self):
+        return self._stream.read(FRAME_SAMPLES)
+
+    def close(self):
+        self._microphone.__exit__(None, None, None)
+
+
+class WavSource:
+    """Frames from a recording, paced like a live microphone.
+
+    ``trailing_silence_ms`` of silence follows the file so the endpointer
+    can close the last utterance. ``read`` returns ``None`` at the end.
+    """
+
+    def __init__(self, path, realtime=True, trailing_silence_ms=END_SILENCE_MS * 2):
+        import speech_recognition as sr
+        with sr.AudioFile(path) as audio_file:
+            audio = sr.Recognizer().record(audio_file)
+        pcm = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=SAMPLE_WIDTH)
+        pcm += b'\0' * (SAMPLE_RATE * SAMPLE_WIDTH * trailing_silence_ms // 1000)
+        frame_bytes = FRAME_SAMPLES * SAMPLE_WIDTH
+        self._frames = [pcm[i:i + frame_bytes] for i in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+        self.realtime = realtime
+        self.duration = len(self._frames) * FRAME_MS / 1000
+
+    def open(self):
+        self._next = 0
+        self._started = time.perf_counter()
+
+    def read(self):
+        if self._next >= len(self._frames):
+            return None
+        if self.realtime:
+            # A frame is available once it has been "spoken"
+            due = self._started + (self._next + 1) * FRAME_MS / 1000
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self._frames[self._next]
+        self._next += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    """Save 16-bit mono PCM, e.g. a captured utterance to reuse as a fixture"""
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(SAMPLE_WIDTH)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm)
+
+
+class Speaker:
+    """TTS on its own thread; pyttsx3 engines must stay on the thread that made them.
+
+    Without a working engine, sentences are still timed (as if playback
+    started on hand-off), so latency can be measured on headless machines.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.available = False
+        self.error = None
+        self._queue = queue.Queue()
+        self._unplayed = 0
+        self._speaking_since = None  # playback of the current run of sentences began
+        self._last_spoken = None     # (start, end) of the previous run
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='elle-tts', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _init_engine(self):
+        import pyttsx3
+
+        engine = pyttsx3.init()
+        # Configure Elle's voice personality
+        for voice in engine.getProperty('voices') or ():
+            if any(keyword in voice.name.lower() for keyword in ['female', 'zira', 'samantha']):
+                engine.setProperty('voice', voice.id)
+                break
+        engine.setProperty('rate', TTS_RATE)  # Speaking speed
+        engine.setProperty('volume', TTS_VOLUME)
+        return engine
+
+    def _run(self):
+        engine = None
+        if self.enabled:
+            try:
+                with startup.timed("tts init"):
+                    engine = self._init_engine()
+                self.available = True
+            except Exception as e:
+                self.error = e
+        self._ready.set()
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            turn, sentence = item
+            if turn.audio_started is None:
+                turn.audio_started = time.perf_counter()
+            if engine is not None:
+                with self._lock:
+                    if self._speaking_since is None:
+                        self._speaking_since = time.perf_counter()
+                engine.say(sentence)
+                engine.runAndWait()
+            with self._lock:
+                self._unplayed -= 1
+                if not self._unplayed and self._speaking_since is not None:
+                    self._last_spoken = (self._speaking_since, time.perf_counter())
+                    self._speaking_since = None
+
+    def say(self, turn, sentence):
+        with self._lock:
+            self._unplayed += 1
+        self._queue.put((turn, sentence))
+
+    def talking(self, at, hangover=ECHO_HANGOVER_MS / 1000):
+        """Whether audio captured at ``at`` may be Elle's own voice"""
+        with self._lock:
+            if self._speaking_since is not None and at >= self._speaking_since:
+                return True
+            if self._last_spoken is None:
+                return False
+            start, end = self._last_spoken
+            return start <= at < end + hangover
+
+    def close(self, timeout=5.0):
+        """Finish what's queued, then stop"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class Turn:
+    """One utterance and Elle's answer, with the timings that make up the latency"""
+
+    def __init__(self, speech_end, endpoint):
+        self.speech_end = speech_end      # arrival of the last voiced frame
+        self.endpoint = endpoint          # VAD declared the utterance over
+        self.transcribed = None
+        self.first_sentence = None
+        self.audio_started = None
+        self.replied = None
+        self.heard = ''
+        self.reply = ''
+        self.error = None
+
+    def timings(self):
+        """Seconds from the end of speech to each stage; ``None`` for stages not reached"""
+        def since_speech(moment):
+            return None if moment is None else moment - self.speech_end
+        return {
+            'endpoint': since_speech(self.endpoint),
+            'recognized': since_speech(self.transcribed),
+            'first_sentence': since_speech(self.first_sentence),
+            'audio_out': since_speech(self.audio_started),
+        }
+
+
+class VoicePipeline:
+    """Capture thread -> worker thread (VAD, recognition, reply) -> speaker thread.
+
+    ``respond(text)`` is called on the worker thread with each transcript
+    and returns an iterable of reply text chunks. With a ``wake``
+    detector the worker only runs the endpointer and recognizer for one
+    request after each "Hey Elle"; the rest of the time frames go to the
+    detector alone.
+    """
+
+    def __init__(self, source, recognizer, respond, speaker=None, wake=None):
+        self.source = source
+        self.recognizer = recognizer
+        self.respond = respond
+        self.speaker = speaker or Speaker(enabled=False)
+        self.endpointer = Endpointer()
+        self.wake = wake
+        self.awake = wake is None
+        self.woke_at = None
+        self.frames_dropped = 0
+        self.frames_muted = 0
+        self.error = None
+        self._audio_frames = 0
+        self._thread_cpu = {}
+        self._frames = queue.Queue(maxsize=MAX_QUEUED_FRAMES)
+        self._turns = deque(maxlen=RECENT_TURNS)
+        self._turns_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.source.open()
+        for target, name in ((self._capture, 'elle-capture'), (self._work, 'elle-voice')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.source.close()
+        self.speaker.close()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def wait_until_done(self, timeout=None):
+        """Block until a finite source is exhausted and every turn answered"""
+        return self._idle.wait(timeout)
+
+    def _capture(self):
+        started = time.thread_time()
+        try:
+            while not self._stop.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                try:
+                    self._frames.put_nowait((frame, time.perf_counter()))
+                except queue.Full:
+                    self.frames_dropped += 1
+                self._thread_cpu['capture'] = time.thread_time() - started
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self._frames.put_nowait(None)
+            except queue.Full:
+                pass  # the worker has stopped reading
+
+    def _work(self):
+        started = time.thread_time()
+        while not self._stop.is_set():
+            item = self._frames.get()
+            if item is None:
+                break
+            frame, at = item
+            self._audio_frames += 1
+            self._thread_cpu['worker'] = time.thread_time() - started
+            if self.speaker.talking(at):
+                # Half duplex: without a wake word Elle would answer her own reply
+                self.frames_muted += 1
+                self.endpointer.reset()
+                continue
+            if not self.awake:
+                if self.wake.feed(frame):
+                    self.endpointer.reset()
+                    self.awake, self.woke_at = True, at
+                continue
+            state = self.endpointer.feed(frame, at)
+            if state is None:
+                if self.wake is not None and (at - self.woke_at) * 1000 > FOLLOW_UP_MS:
+                    self.awake = False  # "Hey Elle" and then nothing
+                continue
+            if self.recognizer is not None:
+                if state == 'start':
+                    self.recognizer.start()
+                    for buffered in self.endpointer.frames:
+                        self.recognizer.feed(buffered)
+                else:
+                    self.recognizer.feed(frame)
+            if state == 'end':
+                self.endpointer.take()
+                self._answer(Turn(self.endpointer.last_voice, at))
+                self.awake = self.wake is None
+        self._idle.set()
+
+    def _answer(self, turn):
+        with self._turns_lock:
+            self._turns.append(turn)
+        try:
+            turn.heard = self.recognizer.finish().strip() if self.recognizer else ''
+            turn.transcribed = time.perf_counter()
+            if not turn.heard:
+                return
+
+            reply, pending = [], ''
+            for chunk in self.respond(turn.heard):
+                reply.append(chunk)
+                pending += chunk
+                *sentences, pending = _SENTENCE_END.split(pending)
+                for sentence in sentences:
+                    self._speak(turn, sentence)
+            if pending.strip():
+                self._speak(turn, pending)
+            turn.reply = ''.join(reply)
+            turn.replied = time.perf_counter()
+        except Exception as e:
+            turn.error = e
+
+    def _speak(self, turn, sentence):
+        if turn.first_sentence is None:
+            turn.first_sentence = time.perf_counter()
+        self.speaker.say(turn, sentence)
+
+    def turns(self):
+        """Recent turns, oldest first"""
+        with self._turns_lock:
+            return list(self._turns)
+
+    def cpu_report(self):
+        """CPU seconds per hour of audio: the wake word stage, and the whole pipeline.
+
+        The pipeline figure covers the capture and worker threads,
+        recognition and reply streaming included; TTS runs elsewhere.
+        """
+        hours = self._audio_frames * FRAME_MS / 3_600_000
+        report = {
+            'audio_seconds': hours * 3600,
+            'pipeline_cpu_seconds_per_hour': sum(self._thread_cpu.values()) / hours if hours else 0.0,
+        }
+        if self.wake is not None:
+            report['wake'] = self.wake.stats.as_dict()
+        return report
+
+    def latency_report(self):
+        """Median seconds from end of speech to each stage, over answered turns"""
+        report = {}
+        for stage in ('endpoint', 'recognized', 'first_sentence', 'audio_out'):
+            values = sorted(t.timings()[stage] for t in self.turns() if t.timings()[stage] is not None)
+            if values:
+                report[stage] = values[len(values) // 2]
+        return report
+
+
+class VoiceAssistant:
+    """Microphone, offline recognizer and TTS, run as a ``VoicePipeline`` on demand"""
+
+    def __init__(self):
+        self.available = False
+        self.error = None
+        self.pipeline = None
+        self.recognizer = None
+        self.recognizer_errors = {}
+        self.wake_model = None
+        self.wake_errors = {}
+
+        try:
+            with startup.timed("voice init"):
+                import speech_recognition as sr
+                sr.Microphone.get_pyaudio()  # raises without PyAudio
+                if not sr.Microphone.list_microphone_names():
+                    raise OSError("No microphone found")
+            self.available = True
+        except Exception as e:
+            self.error = e
+
+    @property
+    def listening(self):
+        return self.pipeline is not None and self.pipeline.running
+
+    @property
+    def hands_free(self):
+        """Whether the running pipeline waits for "Hey Elle" between requests"""
+        return self.listening and self.pipeline.wake is not None
+
+    def start(self, respond):
+        """Start listening in the background; replies are spoken as they stream"""
+        if self.listening:
+            return
+        if self.recognizer is None:
+            self.recognizer, self.recognizer_errors = load_recognizer()
+            if self.recognizer is None:
+                self.error = RuntimeError(
+                    "No offline speech recognizer is installed (tried "
+                    + ", ".join(f"{name}: {error}" for name, error in self.recognizer_errors.items()) + ")")
+                return
+        if self.wake_model is None and not self.wake_errors:
+            with startup.timed("load wake word"):
+                self.wake_model, self.wake_errors = wakeword.load_model(
+                    SAMPLE_RATE, vosk_model=self.recognizer._model if self.recognizer.name == 'vosk' else None)
+        # Without a wake word model every utterance is a request, as before
+        wake = (wakeword.WakeWordDetector(self.wake_model, SAMPLE_RATE, FRAME_MS)
+                if self.wake_model is not None else None)
+        self.pipeline = VoicePipeline(MicrophoneSource(), self.recognizer, respond, Speaker(), wake).start()
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
@@ -0,0 +1,282 @@
+"""Always-on "Hey Elle" detection, cheap enough to leave running.
+
+Frames go into a ring buffer while an energy gate watches for a burst of
+sound about as long as the phrase. Only when such a burst ends is the
+keyword model run, over the buffered audio; silence, steady noise and
+long stretches of talk never reach it, so an idle hour costs seconds of
+CPU.
+
+Two keyword models:
+
+* ``VoskKeywordModel``: Vosk restricted to a grammar of just the phrase,
+  when a Vosk model is installed
+* ``TemplateModel``: MFCCs compared by dynamic time warping against a few
+  recordings of the user saying the phrase (NumPy only, nothing to
+  download); put three or so WAVs in ``wakeword_samples/`` or
+  ``$ELLE_WAKEWORD_DIR``
+
+With neither, the voice pipeline treats every utterance as a request.
+"""
+import glob
+import json
+import math
+import os
+import time
+from functools import lru_cache
+
+import startup
+
+np = startup.lazy_import('numpy')
+
+PHRASE = 'hey elle'
+TEMPLATE_DIR = 'wakeword_samples'  # recordings of the phrase, for TemplateModel
+
+RING_MS = 2000
+MIN_PHRASE_MS = 240
+MAX_PHRASE_MS = 1500
+GATE_HANG_MS = 150        # a gap this long ends the burst ("hey ... elle" stays one)
+PRE_ROLL_MS = 60
+REFRACTORY_MS = 1500      # ignore re-triggers on the tail of the same phrase
+
+MIN_RMS = 300
+SIGNAL_TO_NOISE = 3.0
+NOISE_ALPHA = 0.05
+NOISE_FALL = 0.5
+
+# MFCC front end
+WINDOW_MS = 25
+HOP_MS = 10
+FFT_SIZE = 512
+MEL_BANDS = 26
+CEPSTRA = 12
+PRE_EMPHASIS = 0.97
+
+DEFAULT_DISTANCE = 12.0   # DTW threshold with a single template
+THRESHOLD_MARGIN = 1.25   # over the largest distance between enrolled templates
+
+
+@lru_cache(maxsize=4)
+def _mel_filterbank(sample_rate):
+    def to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    edges = to_hz(np.linspace(to_mel(0), to_mel(sample_rate / 2), MEL_BANDS + 2))
+    bins = np.floor((FFT_SIZE + 1) * edges / sample_rate).astype(int)
+    bank = np.zeros((MEL_BANDS, FFT_SIZE // 2 + 1))
+    for band in range(MEL_BANDS):
+        left, center, right = bins[band], bins[band + 1], bins[band + 2]
+        bank[band, left:center] = (np.arange(left, center) - left) / max(center - left, 1)
+        bank[band, center:right] = (right - np.arange(center, right)) / max(right - center, 1)
+    return bank
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix():
+    n = np.arange(MEL_BANDS)
+    return np.cos(np.pi / MEL_BANDS * (n[:, None] + 0.5) * np.arange(1, CEPSTRA + 1)[None, :])
+
+
+def mfcc(pcm, sample_rate):
+    """``(frames, CEPSTRA)`` mean-normalized MFCCs of 16-bit PCM"""
+    samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+    samples = np.append(samples[:1], samples[1:] - PRE_EMPHASIS * samples[:-1])
+    window = sample_rate * WINDOW_MS // 1000
+    hop = sample_rate * HOP_MS // 1000
+    count = 1 + max(0, len(samples) - window) // hop
+    frames = samples[np.arange(window)[None, :] + hop * np.arange(count)[:, None]] * np.hamming(window)
+    power = np.abs(np.fft.rfft(frames, FFT_SIZE)) ** 2 / FFT_SIZE
+    features = np.log(power @ _mel_filterbank(sample_rate).T + 1e-6) @ _dct_matrix()
+    return features - features.mean(axis=0)
+
+
+def dtw_distance(a, b):
+    """Length-normalized dynamic time warping distance between feature sequences"""
+    cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    n, m = cost.shape
+    total = np.full((n + 1, m + 1), np.inf)
+    total[0, 0] = 0.0
+    for i in range(1, n + 1):
+        # Diagonal and vertical steps vectorize; the horizontal one is a running minimum
+        row = cost[i - 1] + np.minimum(total[i - 1, 1:], total[i - 1, :-1])
+        for j in range(1, m):
+            row[j] = min(row[j], row[j - 1] + cost[i - 1, j])
+        total[i, 1:] = row
+    return total[n, m] / (n + m)
+
+
+class TemplateModel:
+    """Matches a candidate against enrolled recordings of the phrase"""
+
+    name = 'templates'
+
+    def __init__(self, recordings, sample_rate):
+        if not recordings:
+            raise ValueError("No wake word recordings to match against")
+        self.sample_rate = sample_rate
+        self.templates = [mfcc(pcm, sample_rate) for pcm in recordings]
+        pairwise = [dtw_distance(a, b) for i, a in enumerate(self.templates) for b in self.templates[i + 1:]]
+        self.threshold = max(pairwise) * THRESHOLD_MARGIN if pairwise else DEFAULT_DISTANCE
+
+    @classmethod
+    def from_directory(cls, directory, sample_rate):
+        """Enrolled from every WAV in ``directory``"""
+        import speech_recognition as sr
+
+        recordings = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.wav'))):
+            with sr.AudioFile(path) as audio_file:
+                audio = sr.Recognizer().record(audio_file)
+            recordings.append(audio.get_raw_data(convert_rate=sample_rate, convert_width=2))
+        return cls(recordings, sample_rate)
+
+    def score(self, pcm):
+        """Best distance to any template; lower is closer"""
+        features = mfcc(pcm, self.sample_rate)
+        return min(dtw_distance(features, template) for template in self.templates)
+
+    def matches(self, pcm):
+        return self.score(pcm) <= self.threshold
+
+
+class VoskKeywordModel:
+    """Vosk decoding against a two-entry grammar: the phrase or anything else"""
+
+    name = 'vosk keyword'
+
+    def __init__(self, sample_rate, model=None):
+        import vosk
+
+        if model is None:
+            import speech_recognition
+            model_path = os.environ.get('VOSK_MODEL') or os.path.join(
+                os.path.dirname(speech_recognition.__file__), 'models', 'vosk')
+            if not os.path.isdir(model_path):
+                raise FileNotFoundError(f"No Vosk model at {model_path}")
+            vosk.SetLogLevel(-1)
+            model = vosk.Model(model_path)
+        self._vosk = vosk
+        self._model = model  # shared with the VoskRecognizer when there is one
+        self.sample_rate = sample_rate
+
+    def matches(self, pcm):
+        decoder = self._vosk.KaldiRecognizer(self._model, self.sample_rate, json.dumps([PHRASE, '[unk]']))
+        decoder.AcceptWaveform(pcm)
+        return json.loads(decoder.FinalResult()).get('text', '') == PHRASE
+
+
+def load_model(sample_rate, template_dir=None, vosk_model=None):
+    """``(model, errors)``: Vosk if it loads, else enrolled templates, else ``None``"""
+    errors = {}
+    try:
+        return VoskKeywordModel(sample_rate, vosk_model), errors
+    except Exception as e:
+        errors['vosk'] = e
+    try:
+        directory = template_dir or os.environ.get('ELLE_WAKEWORD_DIR', TEMPLATE_DIR)
+        return TemplateModel.from_directory(directory, sample_rate), errors
+    except Exception as e:
+        errors['templates'] = e
+    return None, errors
+
+
+class WakeWordStats:
+    """Audio heard, CPU spent and what the gate let through"""
+
+    def __init__(self):
+        self.audio_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.candidates = 0
+        self.triggers = 0
+        self.model_seconds = 0.0
+
+    def as_dict(self):
+        share = self.cpu_seconds / self.audio_seconds if self.audio_seconds else 0.0
+        return {
+            'audio_seconds': self.audio_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'cpu_seconds_per_hour': share * 3600,
+            'core_fraction': share,
+            'candidates': self.candidates,
+            'triggers': self.triggers,
+            'avg_model_ms': self.model_seconds / self.candidates * 1000 if self.candidates else 0.0,
+        }
+
+
+class WakeWordDetector:
+    """Ring buffer + energy gate in front of a keyword model; ``feed`` one frame at a time"""
+
+    def __init__(self, model, sample_rate, frame_ms):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.stats = WakeWordStats()
+        self.noise_floor = None
+        self._ring = bytearray(sample_rate * 2 * RING_MS // 1000)
+        self._ring_filled = 0
+        self._burst_frames = 0
+        self._gap_frames = 0
+        self._quiet_until = -math.inf
+        self._elapsed_ms = 0
+
+    def _remember(self, frame):
+        # Shift-and-append; at ~64 KB per ring this beats index bookkeeping
+        size = len(frame)
+        self._ring[:-size] = self._ring[size:]
+        self._ring[-size:] = frame
+        self._ring_filled = min(len(self._ring), self._ring_filled + size)
+
+    def _voiced(self, frame):
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        level = math.sqrt(float(np.dot(samples, samples)) / len(samples)) if len(samples) else 0.0
+        if self.noise_floor is None:
+            self.noise_floor = level
+        voiced = level >= max(MIN_RMS, self.noise_floor * SIGNAL_TO_NOISE)
+        if not voiced:
+            # Falls quickly and rises slowly, so starting mid-sentence doesn't deafen the gate
+            rate = NOISE_FALL if level < self.noise_floor else NOISE_ALPHA
+            self.noise_floor += rate * (level - self.noise_floor)
+        return voiced
+
+    def feed(self, frame):
+        """True when this frame completes the wake phrase"""
+        started = time.thread_time()
+        try:
+            self._remember(frame)
+            self._elapsed_ms += self.frame_ms
+            self.stats.audio_seconds += self.frame_ms / 1000
+            if self._voiced(frame):
+                self._burst_frames += self._gap_frames + 1
+                self._gap_frames = 0
+                return False
+            if not self._burst_frames:
+                return False
+            self._gap_frames += 1
+            if self._gap_frames * self.frame_ms < GATE_HANG_MS:
+                return False
+
+            burst_ms = self._burst_frames * self.frame_ms
+            self._burst_frames = self._gap_frames = 0
+            if not MIN_PHRASE_MS <= burst_ms <= MAX_PHRASE_MS or self._elapsed_ms < self._quiet_until:
+                return False
+            return self._check(burst_ms)
+        finally:
+            self.stats.cpu_seconds += time.thread_time() - started
+
+    def _check(self, burst_ms):
+        # The burst plus a little lead-in, without the trailing silence
+        tail_bytes = self.sample_rate * 2 * GATE_HANG_MS // 1000
+        span_bytes = self.sample_rate * 2 * (burst_ms + PRE_ROLL_MS) // 1000
+        span_bytes = min(span_bytes, self._ring_filled - tail_bytes)
+        pcm = bytes(self._ring[len(self._ring) - tail_bytes - span_bytes:len(self._ring) - tail_bytes])
+
+        self.stats.candidates += 1
+        started = time.perf_counter()
+        matched = self.model.matches(pcm)
+        self.stats.model_seconds += time.perf_counter() - started
+        if matched:
+            self.stats.triggers += 1
+            self._quiet_until = self._elapsed_ms + REFRACTORY_MS
+        return matched
@@ -0,0 +1,232 @@
+"""Write-behind queue for workout, nutrition and health inserts.
+
+In ``batched`` mode a save only enqueues its inserts; a background thread
+drains the queue and runs everything that arrived within ``max_delay`` in a
+single transaction per database file, so under load many inserts share one
+commit instead of queueing for the write lock one by one. Interactive saves
+``wait`` on the returned future so the page that follows reads the new row;
+background writers can leave it pending.
+
+The queue is bounded: when the writer falls behind, ``submit`` blocks until
+there is room, and the time spent blocked is reported in ``stats``.
+``sync`` mode runs each write in its own transaction on the caller's thread.
+Pending writes are flushed when the process exits.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import Future
+
+import database
+
+SYNC = 'sync'
+BATCHED = 'batched'
+
+MAX_PENDING = 1000
+MAX_BATCH = 200
+MAX_DELAY = 0.05  # seconds a write may wait for others to share its commit
+SAVE_TIMEOUT = 10.0  # seconds an interactive save waits for its commit
+
+_STOP = object()
+
+
+class WriteStats:
+    """Thread-safe throughput and backpressure counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.max_blocked = 0.0
+        self.commit_seconds = 0.0
+        self.last_error = None
+
+    def add(self, **amounts):
+        with self._lock:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + amount)
+
+    def blocked_for(self, seconds):
+        with self._lock:
+            self.blocked += 1
+            self.blocked_seconds += seconds
+            self.max_blocked = max(self.max_blocked, seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'avg_batch': self.written / self.batches if self.batches else 0.0,
+                'avg_commit_ms': 1000 * self.commit_seconds / self.batches if self.batches else 0.0,
+                'blocked': self.blocked,
+                'max_blocked_ms': 1000 * self.max_blocked,
+                'last_error': str(self.last_error) if self.last_error else None,
+            }
+
+
+class WriteBehindQueue:
+    """Bounded queue drained by one writer thread with group commit"""
+
+    def __init__(self, durability=BATCHED, max_pending=MAX_PENDING, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.durability = durability
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = WriteStats()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='elle-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, path, write):
+        """Run ``write(conn)`` inside a transaction on ``path``.
+
+        Returns a ``Future`` that resolves once the write is committed; in
+        ``sync`` mode it is already resolved when ``submit`` returns.
+        """
+        future = Future()
+        self.stats.add(submitted=1)
+        if self.durability == SYNC or self._closed:
+            self._write_now(path, write, future)
+            return future
+
+        self._ensure_thread()
+        item = (path, write, future)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            started = time.perf_counter()
+            self._queue.put(item)
+            self.stats.blocked_for(time.perf_counter() - started)
+        return future
+
+    def _write_now(self, path, write, future):
+        started = time.perf_counter()
+        try:
+            with database.transaction(path) as conn:
+                write(conn)
+        except Exception as e:
+            self.stats.add(failed=1, batches=1, commit_seconds=time.perf_counter() - started)
+            self.stats.last_error = e
+            future.set_exception(e)
+        else:
+            self.stats.add(written=1, batches=1, commit_seconds=time.perf_counter() - started)
+            future.set_result(None)
+
+    def _collect(self, first):
+        """``first`` plus whatever else arrives within ``max_delay``"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = batch[-1] is _STOP
+            writes = batch[:-1] if stop else batch
+
+            by_path = {}
+            for path, write, future in writes:
+                by_path.setdefault(path, []).append((write, future))
+            for path, items in by_path.items():
+                self._commit(path, items)
+
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _commit(self, path, items):
+        """One transaction for the batch; a failing write only rolls back itself"""
+        started = time.perf_counter()
+        done, failed = [], []
+        try:
+            with database.transaction(path) as conn:
+                for write, future in items:
+                    conn.execute('SAVEPOINT write_behind')
+                    try:
+                        write(conn)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_behind')
+                        failed.append((future, e))
+                    else:
+                        done.append(future)
+                    conn.execute('RELEASE write_behind')
+        except Exception as e:
+            # The transaction itself failed, so nothing in the batch was written
+            done, failed = [], [(future, e) for _, future in items]
+
+        self.stats.add(written=len(done), failed=len(failed), batches=1,
+                       commit_seconds=time.perf_counter() - started)
+        for future in done:
+            future.set_result(None)
+        for future, error in failed:
+            self.stats.last_error = error
+            future.set_exception(error)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every write submitted so far is committed"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush and stop the writer; later writes run synchronously"""
+        with self._thread_lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+
+def wait(future, timeout=SAVE_TIMEOUT):
+    """True once ``future``'s write is committed, False if it failed or is still pending"""
+    done, _ = futures.wait([future], timeout=timeout)
+    return bool(done) and future.exception() is None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def configure(durability=BATCHED):
+    """Choose ``sync`` or ``batched`` durability for the process-wide writer"""
+    get_writer().durability = durability
+
+
+def get_writer():
+    """Process-wide writer, flushed when the interpreter exits"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue()
+            atexit.register(_writer.close)
+        return _writer